@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 15:38:02 2026
+
+@author: mathaes
+
+Benchmarks for the core hot paths: DeckDatabase.insertTerms, loadDeck
+and queryByCriteria, Drill.makeDrillFromDeck and
+Controller.exportTermsToPath, on generated decks of several sizes.
+Run from the python-src directory:
+
+    python -m benchmarks.hotpaths [sizes=10000,100000,1000000] [repeat=5]
+        [seed=1] [language=greek|latin] [out=results.json]
+        [baseline=baseline.json] [threshold=0.2] [savebaseline=baseline.json]
+
+The default sizes stop at 100000 terms, so a run takes well under a
+minute. A 1000000-term deck takes about three minutes with the default
+repeat and peaks at about 2 GiB of memory; pass it in sizes when
+checking how the hot paths scale.
+
+Results are written as JSON. If a baseline file is given, each
+benchmark's median is compared against it and the run exits with
+status 1 if any is slower than the baseline by more than threshold.
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from lexilogio.controller import Controller
+from lexilogio.deck import Deck
+from lexilogio.deckdatabase import DeckDatabase, QueryCriterion
+from lexilogio.deckgenerator import DeckGenerator, LANGUAGE_GREEK
+from lexilogio.drill import Drill
+
+from benchmarks.timing import timeCall, summarize
+
+ARG_SIZES = "sizes"
+ARG_REPEAT = "repeat"
+ARG_SEED = "seed"
+ARG_LANGUAGE = "language"
+ARG_OUT = "out"
+ARG_BASELINE = "baseline"
+ARG_SAVE_BASELINE = "savebaseline"
+ARG_THRESHOLD = "threshold"
+
+BENCH_DECK_NAME = "hotpaths_bench"
+
+
+def benchmarkDeckSize(termCount, repeat, seed, language, workDir):
+    results = {}
+    dataDir = os.path.join(workDir, str(termCount))
+    os.makedirs(dataDir, exist_ok=True)
+    dbPath = os.path.join(dataDir, DeckDatabase.fileNameForDeckName(BENCH_DECK_NAME))
+
+    database = DeckDatabase(dbPath)
+    deck = Deck(BENCH_DECK_NAME)
+    database.ensureDeckTablesExist(deck)
+
+    generator = DeckGenerator(seed=seed, language=language)
+    # generate categories and tags only, then time the term insert
+    generator.populateDeck(database, deck, 0)
+    terms = generator.makeTerms(termCount, deck.categories, deck.tags)
+    results["insertTerms"] = summarize(timeCall(lambda: database.insertTerms(deck, terms), 1))
+    terms = None
+
+    results["loadDeck"] = summarize(timeCall(lambda: database.loadDeck(BENCH_DECK_NAME), repeat))
+
+    deck = database.loadDeck(BENCH_DECK_NAME)
+    category = deck.categories[0]
+    tag = deck.tags[0]
+
+    results["makeDrillFromDeck"] = summarize(
+        timeCall(lambda: Drill.makeDrillFromDeck(deck=deck), repeat)
+    )
+    results["makeDrillFromDeck.category"] = summarize(
+        timeCall(lambda: Drill.makeDrillFromDeck(deck=deck, category=category), repeat)
+    )
+    results["makeDrillFromDeck.tag"] = summarize(
+        timeCall(lambda: Drill.makeDrillFromDeck(deck=deck, tag=tag), repeat)
+    )
+
+    results["queryByCriteria.categoryBin"] = summarize(
+        timeCall(
+            lambda: database.queryByCriteria(
+                deck, [QueryCriterion.category(category), QueryCriterion.binvalue(0)]
+            ),
+            repeat,
+        )
+    )
+    results["queryByCriteria.tag"] = summarize(
+        timeCall(lambda: database.queryByCriteria(deck, [QueryCriterion.tag(tag)]), repeat)
+    )
+    results["queryByCriteria.question"] = summarize(
+        timeCall(lambda: database.queryByCriteria(deck, [QueryCriterion.question("*1*")]), repeat)
+    )
+    database.close()
+
+    controller = Controller()
+    with contextlib.redirect_stdout(io.StringIO()):
+        controller.initialize(dataDir, BENCH_DECK_NAME)
+    exportPath = os.path.join(dataDir, "export.txt")
+    results["exportTermsToPath"] = summarize(
+        timeCall(lambda: controller.exportTermsToPath(exportPath), repeat, discardOutput=True)
+    )
+    controller.database.close()
+
+    return {f"{name}@{termCount}": value for name, value in results.items()}
+
+
+def compareToBaseline(results, baseline, threshold):
+    """
+    Return a list of (benchmark, baseline median, current median) for
+    benchmarks whose median regressed by more than threshold.
+    """
+    regressions = []
+    for name, current in results.items():
+        if not name in baseline:
+            continue
+        baseMedian = baseline[name]["median"]
+        if current["median"] > baseMedian * (1.0 + threshold):
+            regressions.append((name, baseMedian, current["median"]))
+    return regressions
+
+
+def main(argv):
+    # 1000000 only on request, see the module docstring
+    sizes = [10000, 100000]
+    repeat = 5
+    seed = 1
+    language = LANGUAGE_GREEK
+    outPath = None
+    baselinePath = None
+    saveBaselinePath = None
+    threshold = 0.2
+
+    for arg in argv[1:]:
+        key, _, value = arg.partition("=")
+        if key == ARG_SIZES:
+            sizes = [int(s) for s in value.split(",") if len(s.strip()) > 0]
+        elif key == ARG_REPEAT:
+            repeat = int(value)
+        elif key == ARG_SEED:
+            seed = int(value)
+        elif key == ARG_LANGUAGE:
+            language = value
+        elif key == ARG_OUT:
+            outPath = value
+        elif key == ARG_BASELINE:
+            baselinePath = value
+        elif key == ARG_SAVE_BASELINE:
+            saveBaselinePath = value
+        elif key == ARG_THRESHOLD:
+            threshold = float(value)
+
+    workDir = tempfile.mkdtemp(prefix="lexilogio_hotpaths_")
+    results = {}
+    try:
+        for termCount in sizes:
+            print(f"Benchmarking {termCount} terms...")
+            results.update(benchmarkDeckSize(termCount, repeat, seed, language, workDir))
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    for name, value in results.items():
+        print(f"  {name:40} median {value['median']:.4f}s  min {value['min']:.4f}s")
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "parameters": {"sizes": sizes, "repeat": repeat, "seed": seed, "language": language},
+        "results": results,
+    }
+
+    if None != outPath:
+        with open(outPath, "w") as outFile:
+            json.dump(report, outFile, indent=2)
+
+    if None != saveBaselinePath:
+        with open(saveBaselinePath, "w") as baselineFile:
+            json.dump(report, baselineFile, indent=2)
+        print(f"Saved baseline to {saveBaselinePath}")
+
+    if None != baselinePath:
+        with open(baselinePath, "r") as baselineFile:
+            baseline = json.load(baselineFile)["results"]
+        regressions = compareToBaseline(results, baseline, threshold)
+        if len(regressions) > 0:
+            print(f"REGRESSIONS (more than {threshold:.0%} slower than baseline):")
+            for name, baseMedian, currentMedian in regressions:
+                print(f"  {name}: {baseMedian:.4f}s -> {currentMedian:.4f}s")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
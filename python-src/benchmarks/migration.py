@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 23:41:26 2026
+
+@author: mathaes
+
+Offline against online schema migration of a temporary deck created at
+an old schema version, so the table rebuilds (migrations 6 and 12) run.
+Online mode has to copy the rows in more than one batch when the deck
+has more terms than the batch size; the benchmark fails otherwise. Run
+from the python-src directory:
+
+    python -m benchmarks.migration [terms=200000] [batch=5000]
+        [from=5] [seed=1]
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from lexilogio.deckdatabase import (
+    DeckDatabase,
+    DECK_TERMS_TABLE_NAME,
+    CATEGORY_TABLE_NAME,
+    TAG_TABLE_NAME,
+    TAG_RELATION_TABLE_NAME,
+)
+from lexilogio.deckmigrations import DECK_MIGRATIONS
+from lexilogio.schemamigration import SchemaMigrator
+
+ARG_TERMS = "terms"
+ARG_BATCH = "batch"
+ARG_FROM = "from"
+ARG_SEED = "seed"
+
+CATEGORY_COUNT = 12
+TAG_COUNT = 40
+
+
+def createOldDeck(path, version, termCount, seed):
+    """
+    Create a deck file at schema version with termCount terms, about two
+    tags per term and ISO drill times, as written by older versions.
+    """
+    rng = random.Random(seed)
+    con = sqlite3.connect(path)
+    SchemaMigrator(con, [m for m in DECK_MIGRATIONS if m.version <= version]).migrate()
+    con.executemany(
+        f"INSERT INTO {CATEGORY_TABLE_NAME} (pkey, category) VALUES (?, ?);",
+        [(n, f"category{n}") for n in range(1, CATEGORY_COUNT + 1)],
+    )
+    con.executemany(
+        f"INSERT INTO {TAG_TABLE_NAME} (pkey, tag) VALUES (?, ?);",
+        [(n, f"tag{n}") for n in range(1, TAG_COUNT + 1)],
+    )
+    con.executemany(
+        f"""INSERT INTO {DECK_TERMS_TABLE_NAME}
+    (pkey, question, answer, category, bin, reversed_bin, last_drill_time)
+VALUES (?, ?, ?, ?, ?, ?, ?);""",
+        [
+            (
+                n,
+                f"question {n}",
+                f"answer {n}",
+                rng.randint(1, CATEGORY_COUNT),
+                rng.randint(0, 6),
+                rng.randint(0, 6),
+                f"2026-{rng.randint(1, 9):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00",
+            )
+            for n in range(1, termCount + 1)
+        ],
+    )
+    con.executemany(
+        f"INSERT OR IGNORE INTO {TAG_RELATION_TABLE_NAME} (term, tag) VALUES (?, ?);",
+        [(n, rng.randint(1, TAG_COUNT)) for n in range(1, termCount + 1) for k in range(0, 2)],
+    )
+    con.commit()
+    con.close()
+
+
+def main(argv):
+    termCount = 200000
+    batchSize = 5000
+    fromVersion = 5
+    seed = 1
+
+    for arg in argv[1:]:
+        key, _, value = arg.partition("=")
+        if key == ARG_TERMS:
+            termCount = int(value)
+        elif key == ARG_BATCH:
+            batchSize = int(value)
+        elif key == ARG_FROM:
+            fromVersion = int(value)
+        elif key == ARG_SEED:
+            seed = int(value)
+
+    batchedVersions = [m.version for m in DECK_MIGRATIONS if None != m.batchApply and m.version > fromVersion]
+    failures = []
+    with tempfile.TemporaryDirectory() as tmpDir:
+        oldPath = os.path.join(tmpDir, "migration_bench_old.db")
+        print(f"Creating a version {fromVersion} deck with {termCount} terms...")
+        createOldDeck(oldPath, fromVersion, termCount, seed)
+
+        for online in [False, True]:
+            path = os.path.join(tmpDir, f"migration_bench_{'online' if online else 'offline'}.db")
+            shutil.copyfile(oldPath, path)
+            database = DeckDatabase(path)
+            report = database.migrateSchema(online=online, batchSize=batchSize)
+            database.close()
+
+            print(f"  {'online' if online else 'offline'}, batches of {batchSize}:"
+                  f" {sum([entry.seconds for entry in report]):.3f}s")
+            for entry in report:
+                if entry.version in batchedVersions:
+                    print(f"    {entry}")
+                    if online and termCount > batchSize and entry.batches <= 1:
+                        failures.append(entry)
+
+    for entry in failures:
+        print(f"FAILED: online migration {entry.version} ran in {entry.batches} batch")
+    return len(failures) == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(sys.argv) else 1)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 09:26:14 2026
+
+@author: mathaes
+
+Incremental deck refresh (Controller.refreshDeck) against a full reload,
+after another controller has added terms to a generated deck, and again
+after it has edited, deleted and tagged terms. The deck is refreshed both when it was loaded from the
+database and when it was loaded from its snapshot; the refreshed deck
+must equal a fresh reload, or the benchmark fails. Run from the
+python-src directory:
+
+    python -m benchmarks.refresh [terms=100000] [changes=100] [repeat=5]
+        [seed=1]
+"""
+
+import contextlib
+import io
+import random
+import shutil
+import sys
+import tempfile
+
+from lexilogio.controller import Controller
+from lexilogio.deckgenerator import DeckGenerator
+from lexilogio.term import Term
+
+from benchmarks.timing import timeCall, summarize
+
+ARG_TERMS = "terms"
+ARG_CHANGES = "changes"
+ARG_REPEAT = "repeat"
+ARG_SEED = "seed"
+
+BENCH_DECK_NAME = "refresh_bench"
+
+
+def openController(dataDir, useSnapshot):
+    controller = Controller()
+    with contextlib.redirect_stdout(io.StringIO()):
+        controller.initialize(dataDir, BENCH_DECK_NAME, useSnapshot=useSnapshot)
+    return controller
+
+
+def deckState(deck):
+    """
+    The stored fields of the deck's terms and its tag relations, for
+    comparing two loads of a deck.
+    """
+    terms = sorted(
+        (t.pkey, t.question, t.answer, t.category, t.bin, t.reversedBin, t.lastDrillTime, t.rowVersion)
+        for t in deck.terms
+    )
+    relations = sorted((termPK, tagPK) for termPK, tagPKs in deck.termToTags.items() for tagPK in tagPKs)
+    return terms, relations
+
+
+def addTerms(controller, changeCount, rng):
+    newTerms = []
+    for n in range(0, changeCount):
+        term = Term()
+        term.question = f"refresh question {rng.random()}"
+        term.answer = f"refresh answer {n}"
+        newTerms.append(term)
+    controller.addNewTerms(newTerms)
+    return newTerms
+
+
+def changeTerms(controller, changeCount, rng, newTerms):
+    """
+    Edit, delete and tag changeCount terms each, and tag newTerms, as
+    another process would.
+    """
+    deck = controller.deck
+    changedTerms = rng.sample(list(deck.terms), 3 * changeCount)
+    editedTerms = changedTerms[:changeCount]
+    for term in editedTerms:
+        term.answer = f"{term.answer} (edited)"
+    controller.updateTerms(editedTerms)
+    for term in changedTerms[changeCount : 2 * changeCount]:
+        controller.deleteTerm(term)
+    tag = deck.tags[0]
+    controller.database.applyTagToTermPKeys(
+        deck, tag, [t.pkey for t in changedTerms[2 * changeCount :]] + [t.pkey for t in newTerms]
+    )
+
+
+def main(argv):
+    termCount = 100000
+    changeCount = 100
+    repeat = 5
+    seed = 1
+
+    for arg in argv[1:]:
+        key, _, value = arg.partition("=")
+        if key == ARG_TERMS:
+            termCount = int(value)
+        elif key == ARG_CHANGES:
+            changeCount = int(value)
+        elif key == ARG_REPEAT:
+            repeat = int(value)
+        elif key == ARG_SEED:
+            seed = int(value)
+
+    rng = random.Random(seed)
+    failures = []
+    dataDir = tempfile.mkdtemp(prefix="lexilogio_refresh_")
+    try:
+        print(f"Generating {termCount} terms...")
+        writer = openController(dataDir, False)
+        DeckGenerator(seed=seed).populateDeck(writer.database, writer.deck, termCount)
+        writer.reloadDeck()
+
+        for useSnapshot in [False, True]:
+            source = "snapshot" if useSnapshot else "database"
+            refreshSeconds = []
+            for n in range(0, repeat):
+                if useSnapshot:
+                    # a snapshot load of a changed deck writes a current
+                    # snapshot, for the reader to load
+                    openController(dataDir, True).shutdown()
+                reader = openController(dataDir, useSnapshot)
+                writer.reloadDeck()
+                # a refresh that only adds terms appends them to the
+                # loaded ones, the other changes replace them with a list
+                newTerms = addTerms(writer, changeCount, rng)
+                refreshSeconds.extend(timeCall(reader.refreshDeck, 1))
+                changeTerms(writer, changeCount, rng, newTerms)
+                refreshSeconds.extend(timeCall(reader.refreshDeck, 1))
+                state = deckState(reader.deck)
+                reader.shutdown()
+
+                reloaded = openController(dataDir, False)
+                if state != deckState(reloaded.deck):
+                    failures.append(f"deck loaded from the {source} differs from a reload after refresh {n + 1}")
+                reloadSeconds = timeCall(reloaded.reloadDeck, 1)
+                reloaded.shutdown()
+
+            refresh = summarize(refreshSeconds)
+            print(f"  loaded from the {source}: refresh after {changeCount} changes"
+                  f" median {refresh['median']:.4f}s, full reload {reloadSeconds[0]:.4f}s")
+        writer.shutdown()
+    finally:
+        shutil.rmtree(dataDir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return len(failures) == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(sys.argv) else 1)
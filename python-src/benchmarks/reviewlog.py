@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 21:38:17 2026
+
+@author: mathaes
+
+Review analytics read from the daily rollups (lexilogio.reviewlog)
+against the same aggregates computed by scanning the review log, on a
+temporary deck with a generated log. Run from the python-src directory:
+
+    python -m benchmarks.reviewlog [reviews=1000000] [terms=20000]
+        [days=365] [batch=1000] [repeat=5] [seed=1]
+
+batch is the number of reviews per appendReviewLog call (a drill
+session is about 25).
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from lexilogio.deckdatabase import DeckDatabase, REVIEW_LOG_TABLE_NAME
+from lexilogio.deck import Deck
+from lexilogio.reviewlog import (
+    ReviewRecord,
+    SECONDS_PER_DAY,
+    RECALLED_MIN_RATING,
+    intervalBucketSQL,
+    retentionCurve,
+    categoryAccuracy,
+    todayEpochDay,
+)
+
+from benchmarks.timing import timeCall, summarize
+
+ARG_REVIEWS = "reviews"
+ARG_TERMS = "terms"
+ARG_DAYS = "days"
+ARG_BATCH = "batch"
+ARG_REPEAT = "repeat"
+ARG_SEED = "seed"
+
+
+def generateReviews(reviewCount, termCount, dayCount, seed):
+    rng = random.Random(seed)
+    startTime = (todayEpochDay() - dayCount) * SECONDS_PER_DAY
+    lastReview = {}
+    reviews = []
+    for n in range(0, reviewCount):
+        reviewTime = startTime + n * dayCount * SECONDS_PER_DAY // reviewCount
+        termPK = rng.randint(1, termCount)
+        reviews.append(
+            ReviewRecord(
+                termPK,
+                reviewTime,
+                rng.randint(1, 5),
+                responseMs=rng.randint(800, 9000),
+                previousReviewTime=lastReview.get(termPK),
+                category=termPK % 12 + 1,
+            )
+        )
+        lastReview[termPK] = reviewTime
+    return reviews
+
+
+def main(argv):
+    reviewCount = 1000000
+    termCount = 20000
+    dayCount = 365
+    batchSize = 1000
+    repeat = 5
+    seed = 1
+
+    for arg in argv[1:]:
+        key, _, value = arg.partition("=")
+        if key == ARG_REVIEWS:
+            reviewCount = int(value)
+        elif key == ARG_TERMS:
+            termCount = int(value)
+        elif key == ARG_DAYS:
+            dayCount = int(value)
+        elif key == ARG_BATCH:
+            batchSize = int(value)
+        elif key == ARG_REPEAT:
+            repeat = int(value)
+        elif key == ARG_SEED:
+            seed = int(value)
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        database = DeckDatabase(os.path.join(tmpDir, "reviewlog_bench.db"))
+        deck = Deck("reviewlog_bench")
+
+        print(f"Generating {reviewCount} reviews of {termCount} terms over {dayCount} days...")
+        reviews = generateReviews(reviewCount, termCount, dayCount, seed)
+        startTime = time.perf_counter()
+        for n in range(0, len(reviews), batchSize):
+            database.appendReviewLog(deck, reviews[n : n + batchSize])
+        appendSeconds = time.perf_counter() - startTime
+        print(f"  appended in batches of {batchSize}: {appendSeconds:.2f}s"
+              f" ({reviewCount / appendSeconds:.0f} reviews/s)")
+
+        con = database.getDbConnection()
+
+        def scanRetention():
+            return con.execute(f"""SELECT {intervalBucketSQL("interval_seconds")} AS bucket,
+    COUNT(*), SUM(rating >= {RECALLED_MIN_RATING})
+FROM {REVIEW_LOG_TABLE_NAME} GROUP BY bucket;""").fetchall()
+
+        def scanCategories():
+            return con.execute(f"""SELECT category, COUNT(*), SUM(rating >= {RECALLED_MIN_RATING}),
+    AVG(response_ms) FROM {REVIEW_LOG_TABLE_NAME} GROUP BY category;""").fetchall()
+
+        results = [
+            ("retention curve", lambda: retentionCurve(con), scanRetention),
+            ("category accuracy", lambda: categoryAccuracy(con), scanCategories),
+            ("last 30 days", lambda: retentionCurve(con, 30), None),
+        ]
+        for name, rollupFunc, scanFunc in results:
+            rollupSeconds = summarize(timeCall(rollupFunc, repeat))["median"]
+            line = f"  {name:18} rollups {rollupSeconds * 1000:9.3f}ms"
+            if None != scanFunc:
+                scanSeconds = summarize(timeCall(scanFunc, repeat))["median"]
+                line += f"  log scan {scanSeconds * 1000:9.3f}ms  x{scanSeconds / rollupSeconds:.0f}"
+            print(line)
+        database.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
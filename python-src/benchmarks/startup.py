@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:14:47 2026
+
+@author: mathaes
+
+Startup benchmark: measures time-to-first-prompt of the text runner
+on a large deck. Run from the python-src directory:
+
+    python -m benchmarks.startup [terms=200000] [runs=5] [dir=PATH]
+
+The deck is generated once into the benchmark data directory and
+reused on later runs.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from lexilogio.deck import Deck
+from lexilogio.deckdatabase import DeckDatabase, DECK_TERMS_TABLE_NAME
+from lexilogio.deckgenerator import DeckGenerator
+
+from benchmarks.timing import summarize
+
+ARG_TERMS = "terms"
+ARG_RUNS = "runs"
+ARG_DIR = "dir"
+
+BENCH_DECK_NAME = "startup_bench"
+
+# the runner prints this line just before its first input() prompt
+FIRST_PROMPT_MARKER = b"commands:"
+
+
+def buildLargeDeck(dataDir, termCount):
+    dbPath = os.path.join(dataDir, DeckDatabase.fileNameForDeckName(BENCH_DECK_NAME))
+    database = DeckDatabase(dbPath)
+    deck = Deck(BENCH_DECK_NAME)
+    database.ensureDeckTablesExist(deck)
+
+    existing = database.getDbConnection().execute(f"SELECT COUNT(*) FROM {DECK_TERMS_TABLE_NAME};").fetchone()[0]
+    if existing < termCount:
+        print(f"Generating {termCount - existing} terms into {dbPath}...")
+        DeckGenerator(seed=termCount).populateDeck(database, deck, termCount - existing)
+    database.close()
+    return dbPath
+
+
+def timeToFirstPrompt(dataDir):
+    """
+    Launch the text runner in a child process and return the seconds
+    elapsed until the main menu prompt is written to stdout.
+    """
+    srcDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cmd = [
+        sys.executable,
+        "-u",
+        "-m",
+        "lexilogio.textdrillrunner",
+        f"dir={dataDir}",
+        f"deck={BENCH_DECK_NAME}",
+        "loglevel=WARNING",
+    ]
+    startTime = time.perf_counter()
+    proc = subprocess.Popen(
+        cmd,
+        cwd=srcDir,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    output = b""
+    elapsed = None
+    while True:
+        chunk = proc.stdout.read1(4096)
+        if not chunk:
+            break
+        output += chunk
+        if FIRST_PROMPT_MARKER in output:
+            elapsed = time.perf_counter() - startTime
+            break
+
+    proc.stdin.write(b"x\n")
+    proc.stdin.flush()
+    proc.communicate(timeout=60)
+
+    if None == elapsed:
+        raise Exception(f"Runner exited before first prompt: {output.decode(errors='replace')}")
+    return elapsed
+
+
+def main(argv):
+    termCount = 200000
+    runs = 5
+    dataDir = os.path.join(tempfile.gettempdir(), "lexilogio_bench")
+
+    for arg in argv[1:]:
+        if arg.startswith(f"{ARG_TERMS}="):
+            termCount = int(arg[len(ARG_TERMS) + 1 :])
+        elif arg.startswith(f"{ARG_RUNS}="):
+            runs = int(arg[len(ARG_RUNS) + 1 :])
+        elif arg.startswith(f"{ARG_DIR}="):
+            dataDir = arg[len(ARG_DIR) + 1 :]
+
+    os.makedirs(dataDir, exist_ok=True)
+    buildLargeDeck(dataDir, termCount)
+
+    summary = summarize([timeToFirstPrompt(dataDir) for _ in range(runs)])
+    print(f"time-to-first-prompt over {runs} runs, {termCount} terms:")
+    print(f"  min {summary['min']:.3f}s  median {summary['median']:.3f}s  max {summary['max']:.3f}s")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
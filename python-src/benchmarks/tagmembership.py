@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 19:31:08 2026
+
+@author: mathaes
+
+Memory and throughput of deck tag membership as term pkey lists (as
+loaded into Deck.tagToTerms, with the list-scanning lookups Deck used
+before bitsets) against term bitsets (lexilogio.termbitset), on a
+generated in-memory deck with hundreds of tags. Run from the python-src
+directory:
+
+    python -m benchmarks.tagmembership [terms=20000] [tags=400]
+        [repeat=5] [seed=1] [out=results.json]
+
+The list lookups scan the deck per tag lookup, so keep terms moderate.
+"""
+
+import gc
+import json
+import platform
+import sys
+import tracemalloc
+
+from lexilogio.category import Category
+from lexilogio.deck import Deck
+from lexilogio.deckgenerator import DeckGenerator
+from lexilogio.tag import Tag
+from lexilogio.termbitset import (
+    TermMembership,
+    bitsetCount,
+    bitsetDifference,
+)
+
+from benchmarks.timing import timeCall, summarize
+
+ARG_TERMS = "terms"
+ARG_TAGS = "tags"
+ARG_REPEAT = "repeat"
+ARG_SEED = "seed"
+ARG_OUT = "out"
+
+
+def makeDeck(termCount, tagCount, seed):
+    generator = DeckGenerator(seed=seed, tagCount=tagCount, maxTagsPerTerm=6)
+    deck = Deck("tagmembership_bench")
+    deck.categories = [Category(name=f"category-{n}", pkey=n + 1) for n in range(0, 12)]
+    deck.tags = [Tag(name=f"tag-{n}", pkey=n + 1) for n in range(0, tagCount)]
+    deck.terms = generator.makeTerms(termCount, deck.categories, deck.tags)
+
+    relations = []
+    for pkey, term in enumerate(deck.terms, start=1):
+        term.pkey = pkey
+        relations.extend([(pkey, tag.pkey) for tag in term.tags])
+        term.tags = []
+    return deck, relations
+
+
+def buildTagLists(relations):
+    # as DeckDatabase.getDeckTermTagRelations; row values are new ints
+    tagToTerms = {}
+    for termPK, tagPK in relations:
+        tagToTerms.setdefault(tagPK, []).append(int(str(termPK)))
+    return tagToTerms
+
+
+def buildTagBitsets(membership, tagToTerms):
+    for tagPK in tagToTerms:
+        membership.tagBitset(tagPK, tagToTerms)
+    return membership.tagBitsets
+
+
+def measureMemory(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main(argv):
+    termCount = 20000
+    tagCount = 400
+    repeat = 5
+    seed = 1
+    outPath = None
+
+    for arg in argv[1:]:
+        key, _, value = arg.partition("=")
+        if key == ARG_TERMS:
+            termCount = int(value)
+        elif key == ARG_TAGS:
+            tagCount = int(value)
+        elif key == ARG_REPEAT:
+            repeat = int(value)
+        elif key == ARG_SEED:
+            seed = int(value)
+        elif key == ARG_OUT:
+            outPath = value
+
+    print(f"Generating {termCount} terms with {tagCount} tags...")
+    deck, relations = makeDeck(termCount, tagCount, seed)
+
+    tagToTerms, listBytes = measureMemory(lambda: buildTagLists(relations))
+    deck.tagToTerms = tagToTerms
+    # ordinals are needed by bitsets but not by the lists
+    membership, ordinalBytes = measureMemory(lambda: TermMembership(deck.terms))
+    bitsetBytes = measureMemory(lambda: buildTagBitsets(membership, tagToTerms))[1]
+
+    terms = deck.terms
+    category = deck.categories[0]
+    # a frequent and a mid-frequency tag (tag weights are Zipf-like)
+    tagA = deck.tags[0]
+    tagB = deck.tags[tagCount // 10]
+    listA = tagToTerms.get(tagA.pkey, [])
+    listB = tagToTerms.get(tagB.pkey, [])
+    bitsA = membership.tagBitset(tagA.pkey, tagToTerms)
+    bitsB = membership.tagBitset(tagB.pkey, tagToTerms)
+    categoryBits = membership.categoryBitset(category.pkey)
+
+    timings = {
+        "lists": {
+            "getTermsWithTag": timeCall(lambda: [t for t in terms if t.pkey in listA], repeat),
+            "and": timeCall(lambda: [pk for pk in listB if pk in listA], repeat),
+            "or": timeCall(lambda: listA + [pk for pk in listB if not pk in listA], repeat),
+            "difference": timeCall(lambda: [pk for pk in listA if not pk in listB], repeat),
+            "count": timeCall(lambda: len(listA), repeat),
+            "categoryAndTag": timeCall(
+                lambda: [t for t in terms if t.category == category.pkey and t.pkey in listB], repeat
+            ),
+        },
+        "bitsets": {
+            "getTermsWithTag": timeCall(lambda: membership.termsForBitset(bitsA), repeat),
+            "and": timeCall(lambda: membership.pkeysForBitset(bitsA & bitsB), repeat),
+            "or": timeCall(lambda: membership.pkeysForBitset(bitsA | bitsB), repeat),
+            "difference": timeCall(
+                lambda: membership.pkeysForBitset(bitsetDifference(bitsA, bitsB)), repeat
+            ),
+            "count": timeCall(lambda: bitsetCount(bitsA), repeat),
+            "categoryAndTag": timeCall(
+                lambda: membership.termsForBitset(categoryBits & bitsB), repeat
+            ),
+        },
+    }
+    results = {
+        kind: {name: summarize(kindTimings[name]) for name in kindTimings}
+        for kind, kindTimings in timings.items()
+    }
+
+    memory = {
+        "relations": len(relations),
+        "tagListBytes": listBytes,
+        "tagBitsetBytes": bitsetBytes,
+        "ordinalIndexBytes": ordinalBytes,
+    }
+
+    print(f"  {len(relations)} tag relations, tag sizes {len(listA)} and {len(listB)}")
+    print(f"  memory: lists {listBytes / 1024:.0f} KiB, bitsets {bitsetBytes / 1024:.0f} KiB"
+          f" (+ {ordinalBytes / 1024:.0f} KiB ordinal index)")
+    for name in results["lists"]:
+        listMedian = results["lists"][name]["median"]
+        bitsetMedian = results["bitsets"][name]["median"]
+        speedup = listMedian / bitsetMedian if bitsetMedian > 0 else float("inf")
+        print(f"  {name:16} lists {listMedian * 1000:10.3f}ms  bitsets {bitsetMedian * 1000:10.3f}ms  x{speedup:.1f}")
+
+    if None != outPath:
+        with open(outPath, "w") as outFile:
+            json.dump(
+                {
+                    "environment": {
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                    },
+                    "parameters": {"terms": termCount, "tags": tagCount, "repeat": repeat, "seed": seed},
+                    "memory": memory,
+                    "results": results,
+                },
+                outFile,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv)
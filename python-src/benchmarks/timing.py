@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 23:52:40 2026
+
+@author: mathaes
+
+Timing helpers shared by the benchmarks.
+"""
+
+import contextlib
+import io
+import statistics
+import time
+
+
+def timeCall(func, repeat, discardOutput=False):
+    """
+    Call func repeat times and return the list of elapsed seconds. With
+    discardOutput, anything the call prints is discarded.
+    """
+    timings = []
+    for n in range(0, repeat):
+        outputContext = contextlib.redirect_stdout(io.StringIO()) if discardOutput else contextlib.nullcontext()
+        with outputContext:
+            startTime = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - startTime)
+    return timings
+
+
+def summarize(timings):
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "max": max(timings),
+        "runs": len(timings),
+    }
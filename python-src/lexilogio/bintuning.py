@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 22:10:44 2026
+
+@author: mathaes
+
+Tuning of a deck's bin review intervals and bin weights from its review
+log.
+
+Recall after an interval of t days from bin b is modelled as
+exp(-t / S[b]), with the stability S[b] fitted per bin by maximum
+likelihood. A bin's interval is then the t at which recall falls to the
+deck's retention target, and the weights of bins 1-5 are set to each
+bin's share of the reviews that fall due per day (terms in the bin over
+its interval), so drills go where reviews are due; the bin 0 (new term)
+share is left as set.
+
+The fit reads recall counts per (bin, interval bucket) from
+review_bin_stats. Each run first adds the review log rows logged since
+the previous run to those counts, so a run costs one pass over the new
+reviews only.
+"""
+
+import math
+
+from lexilogio.connectionmanager import immediateTransaction
+from lexilogio.deck import Deck
+from lexilogio.deckdatabase import (
+    DECK_META_TABLE_NAME,
+    REVIEW_LOG_TABLE_NAME,
+    REVIEW_BIN_STATS_TABLE_NAME,
+)
+from lexilogio.reviewlog import (
+    SECONDS_PER_DAY,
+    RECALLED_MIN_RATING,
+    intervalBucketSQL,
+)
+
+# reviews of a bin (with a previous review) needed to fit its stability
+MIN_FIT_REVIEWS = 30
+
+MIN_STABILITY_DAYS = 0.1
+MAX_STABILITY_DAYS = 3650.0
+MIN_INTERVAL_DAYS = 0.5
+MAX_INTERVAL_DAYS = 365.0
+MIN_BIN_WEIGHT = 0.01
+
+GOLDEN_SECTION_STEPS = 60
+
+
+class BinTuningResult:
+    def __init__(self):
+        self.newReviewCount = 0
+        # bin -> (reviews used, fitted stability in days) for fitted bins
+        self.stabilities = {}
+        self.intervals = {}
+        self.weights = {}
+
+    def __repr__(self):
+        return (
+            f"BinTuningResult(newReviews={self.newReviewCount}, stabilities={self.stabilities}, "
+            f"intervals={self.intervals}, weights={self.weights})"
+        )
+
+
+def accumulateNewReviews(con):
+    """
+    Add the review log rows not yet counted to the bin stats, in one
+    transaction. Returns the number of reviews added.
+    """
+    with immediateTransaction(con) as cur:
+        lastPK = cur.execute(
+            f"SELECT tuned_review_pkey FROM {DECK_META_TABLE_NAME} WHERE pkey = 1;"
+        ).fetchone()[0]
+        newLastPK, newCount = cur.execute(
+            f"SELECT MAX(pkey), COUNT(*) FROM {REVIEW_LOG_TABLE_NAME} WHERE pkey > ?;", [lastPK]
+        ).fetchone()
+        if newCount > 0:
+            # first reviews have no previous bin or interval to learn from
+            cur.execute(
+                f"""INSERT INTO {REVIEW_BIN_STATS_TABLE_NAME}
+    (previous_bin, interval_bucket, review_count, recalled_count, interval_seconds_total)
+SELECT previous_bin, {intervalBucketSQL("interval_seconds")}, COUNT(*),
+    SUM(rating >= {RECALLED_MIN_RATING}), SUM(interval_seconds)
+FROM {REVIEW_LOG_TABLE_NAME}
+WHERE pkey > ? AND pkey <= ? AND interval_seconds IS NOT NULL AND previous_bin IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT(previous_bin, interval_bucket) DO UPDATE SET
+    review_count = review_count + excluded.review_count,
+    recalled_count = recalled_count + excluded.recalled_count,
+    interval_seconds_total = interval_seconds_total + excluded.interval_seconds_total;""",
+                [lastPK, newLastPK],
+            )
+            cur.execute(
+                f"UPDATE {DECK_META_TABLE_NAME} SET tuned_review_pkey = ? WHERE pkey = 1;", [newLastPK]
+            )
+    return newCount
+
+
+def readBinObservations(con):
+    """
+    Return a dict of bin -> list of (mean interval days, reviews,
+    recalled), one per interval bucket.
+    """
+    observations = {}
+    for binValue, reviews, recalled, intervalTotal in con.execute(
+        f"""SELECT previous_bin, review_count, recalled_count, interval_seconds_total
+FROM {REVIEW_BIN_STATS_TABLE_NAME} WHERE review_count > 0;"""
+    ):
+        observations.setdefault(binValue, []).append(
+            (intervalTotal / reviews / SECONDS_PER_DAY, reviews, recalled)
+        )
+    return observations
+
+
+def negativeLogLikelihood(stability, observations):
+    total = 0.0
+    for days, reviews, recalled in observations:
+        exponent = days / stability
+        # recalled reviews contribute -log(exp(-t/S)), missed ones -log(1 - exp(-t/S))
+        total += recalled * exponent
+        if reviews > recalled:
+            total -= (reviews - recalled) * math.log(max(-math.expm1(-exponent), 1e-12))
+    return total
+
+
+def fitStability(observations):
+    """
+    Return the maximum likelihood stability (days) for observations, by
+    golden-section search over log stability.
+    """
+    low = math.log(MIN_STABILITY_DAYS)
+    high = math.log(MAX_STABILITY_DAYS)
+    ratio = (math.sqrt(5) - 1) / 2
+    a = high - ratio * (high - low)
+    b = low + ratio * (high - low)
+    costA = negativeLogLikelihood(math.exp(a), observations)
+    costB = negativeLogLikelihood(math.exp(b), observations)
+    for n in range(0, GOLDEN_SECTION_STEPS):
+        if costA <= costB:
+            high, b, costB = b, a, costA
+            a = high - ratio * (high - low)
+            costA = negativeLogLikelihood(math.exp(a), observations)
+        else:
+            low, a, costA = a, b, costB
+            b = low + ratio * (high - low)
+            costB = negativeLogLikelihood(math.exp(b), observations)
+    return math.exp((low + high) / 2)
+
+
+def tunedIntervals(stabilities, retentionTarget, currentIntervals):
+    """
+    Intervals (days) at which recall falls to retentionTarget, for the
+    bins in stabilities; other bins keep their current interval. Bin 0
+    (new terms) is always due, and intervals never decrease with the
+    bin.
+    """
+    intervals = {0: 0.0}
+    for binValue in range(1, 6):
+        if binValue in stabilities:
+            days = -stabilities[binValue] * math.log(retentionTarget)
+            days = min(max(days, MIN_INTERVAL_DAYS), MAX_INTERVAL_DAYS)
+        else:
+            days = currentIntervals[binValue]
+        intervals[binValue] = round(max(days, intervals[binValue - 1]), 1)
+    return intervals
+
+
+def tunedWeights(binTermCounts, intervals, currentWeights):
+    """
+    Bin weights giving each of bins 1-5 its share of the reviews due per
+    day, keeping the relative weight of bin 0.
+    """
+    weightSum = sum(currentWeights.values())
+    newShare = currentWeights[0] / weightSum if weightSum > 0 else 0.0
+    dueRates = {
+        b: binTermCounts.get(b, 0) / max(intervals[b], MIN_INTERVAL_DAYS) for b in range(1, 6)
+    }
+    dueTotal = sum(dueRates.values())
+    if dueTotal <= 0:
+        return dict(currentWeights)
+
+    weights = {0: round(newShare, 3)}
+    for b in range(1, 6):
+        weights[b] = round(max((1 - newShare) * dueRates[b] / dueTotal, MIN_BIN_WEIGHT), 3)
+    return weights
+
+
+def tuneBinPrefs(database, deck: Deck):
+    """
+    Update the bin stats from the new reviews of deck's review log and
+    return a BinTuningResult with tuned intervals and weights for the
+    deck prefs (not written; see Controller.tuneBinPrefs). Both are the
+    current ones unless the stability of at least one bin was fitted.
+    """
+    database.ensureDeckTablesExist(deck)
+    con = database.getDbConnection()
+
+    result = BinTuningResult()
+    result.newReviewCount = accumulateNewReviews(con)
+
+    stabilities = {}
+    for binValue, observations in readBinObservations(con).items():
+        reviewCount = sum(reviews for days, reviews, recalled in observations)
+        if 1 <= binValue <= 5 and reviewCount >= MIN_FIT_REVIEWS:
+            stabilities[binValue] = fitStability(observations)
+            result.stabilities[binValue] = (reviewCount, round(stabilities[binValue], 2))
+
+    if len(stabilities) == 0:
+        # no bin has enough reviews yet; keep the prefs as they are
+        result.intervals = dict(deck.getSpacedBinIntervals())
+        result.weights = dict(deck.getSpacedBinDistribution())
+        return result
+
+    result.intervals = tunedIntervals(
+        stabilities, deck.getRetentionTarget(), deck.getSpacedBinIntervals()
+    )
+
+    isReversed = deck.isReversedDrill()
+    binTermCounts = {}
+    for t in deck.terms:
+        binValue = t.reversedBin if isReversed else t.bin
+        binTermCounts[binValue] = binTermCounts.get(binValue, 0) + 1
+    result.weights = tunedWeights(binTermCounts, result.intervals, deck.getSpacedBinDistribution())
+    return result
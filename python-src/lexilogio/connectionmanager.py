@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 23:02:15 2026
+
+@author: mathaes
+
+Per-thread sqlite3 connections to one database file, so DeckDatabase can
+be used from background threads (an import, shard workers) while the UI
+thread drills.
+
+Each thread gets its own connection on first use, opened in WAL mode so
+readers do not block the writer and the writer does not block readers.
+Writers still take turns: a connection waits up to busyTimeoutSeconds
+for a lock inside SQLite, and transaction() retries BEGIN IMMEDIATE with
+backoff on SQLITE_BUSY beyond that. closeAll() closes the connections of
+all threads, e.g. at shutdown; connections are reopened on next use.
+"""
+
+import contextlib
+import logging
+import sqlite3
+import threading
+import time
+
+DEFAULT_BUSY_TIMEOUT_SECONDS = 5.0
+# attempts at BEGIN IMMEDIATE after the busy timeout has run out
+BUSY_RETRY_COUNT = 4
+BUSY_RETRY_DELAY_SECONDS = 0.05
+DEFAULT_JOURNAL_MODE = "WAL"
+
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+
+def isBusyError(ex):
+    if not isinstance(ex, sqlite3.OperationalError):
+        return False
+    errorCode = getattr(ex, "sqlite_errorcode", None)
+    if None != errorCode:
+        return errorCode & 0xFF in [SQLITE_BUSY, SQLITE_LOCKED]
+    message = str(ex)
+    return "database is locked" in message or "database table is locked" in message
+
+
+def retryOnBusy(func, retryCount=BUSY_RETRY_COUNT, retryDelaySeconds=BUSY_RETRY_DELAY_SECONDS):
+    """
+    Return func(), calling it again after a growing delay, up to
+    retryCount more times, while it fails with SQLITE_BUSY.
+    """
+    delay = retryDelaySeconds
+    for attempt in range(0, retryCount + 1):
+        try:
+            return func()
+        except sqlite3.OperationalError as ex:
+            if not isBusyError(ex) or attempt == retryCount:
+                raise
+            logging.info(f"Database busy, retrying in {delay:.2f}s ({ex})")
+            time.sleep(delay)
+            delay *= 2
+
+
+@contextlib.contextmanager
+def immediateTransaction(con):
+    """
+    Run the with block in a BEGIN IMMEDIATE transaction on con, yielding
+    a cursor; commits at the end of the block, rolls back on an
+    exception. Any pending implicit transaction is committed first.
+    """
+    con.commit()
+    cur = con.cursor()
+    retryOnBusy(lambda: cur.execute("BEGIN IMMEDIATE;"))
+    try:
+        yield cur
+    except BaseException:
+        con.rollback()
+        raise
+    retryOnBusy(con.commit)
+
+
+class ConnectionManager:
+    """
+    Hands out one connection per thread to the database at dbPath.
+
+    openConnection(), called on a thread's first use, opens a sqlite3
+    connection (with check_same_thread=False, so closeAll can close it
+    from another thread); configureConnection(con), if given, is then
+    called to set it up, after the busy timeout and journal mode.
+    """
+
+    def __init__(self, dbPath, openConnection, configureConnection=None,
+                 busyTimeoutSeconds=DEFAULT_BUSY_TIMEOUT_SECONDS,
+                 journalMode=DEFAULT_JOURNAL_MODE):
+        self.dbPath = dbPath
+        self.openConnection = openConnection
+        self.configureConnection = configureConnection
+        self.busyTimeoutSeconds = busyTimeoutSeconds
+        self.journalMode = journalMode
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # (thread, connection) for every open connection
+        self.connections = []
+
+    def connection(self):
+        con = getattr(self.local, "connection", None)
+        if None == con:
+            con = self.openConnection()
+            con.execute(f"PRAGMA busy_timeout = {int(self.busyTimeoutSeconds * 1000)};")
+            if None != self.journalMode and self.dbPath != ":memory:":
+                retryOnBusy(lambda: con.execute(f"PRAGMA journal_mode = {self.journalMode};"))
+            if None != self.configureConnection:
+                self.configureConnection(con)
+            self.local.connection = con
+            self.local.transactionDepth = 0
+            with self.lock:
+                self.closeFinishedThreadConnections()
+                self.connections.append((threading.current_thread(), con))
+        return con
+
+    def hasConnection(self):
+        return None != getattr(self.local, "connection", None)
+
+    def connectionCount(self):
+        with self.lock:
+            return len(self.connections)
+
+    def closeFinishedThreadConnections(self):
+        # callers hold self.lock
+        running = []
+        for thread, con in self.connections:
+            if thread.is_alive():
+                running.append((thread, con))
+            else:
+                con.close()
+        self.connections = running
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Run the with block in a write transaction on this thread's
+        connection, yielding a cursor. Nested uses join the outermost
+        transaction, which alone commits (or rolls back).
+        """
+        con = self.connection()
+        if self.local.transactionDepth > 0:
+            self.local.transactionDepth += 1
+            try:
+                yield con.cursor()
+            finally:
+                self.local.transactionDepth -= 1
+            return
+
+        self.local.transactionDepth = 1
+        try:
+            with immediateTransaction(con) as cur:
+                yield cur
+        finally:
+            self.local.transactionDepth = 0
+
+    def closeAll(self):
+        """
+        Close the connections of all threads. Nothing may be using them;
+        each thread opens a new connection on its next use.
+        """
+        with self.lock:
+            connections = self.connections
+            self.connections = []
+            # a new local drops the other threads' references as well
+            self.local = threading.local()
+        for thread, con in connections:
+            try:
+                con.close()
+            except sqlite3.Error as ex:
+                logging.warning(f"Error closing connection to {self.dbPath}: {ex}")
@@ -8,14 +8,54 @@ Created on Sun Apr 23 16:14:53 2023
 
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from lexilogio.category import Category
 from lexilogio.deckdatabase import DeckDatabase
+from lexilogio.shardeddeckdatabase import (
+    ShardedDeckDatabase,
+    openDeckDatabase,
+    PARTITION_BY_HASH,
+)
 from lexilogio.deck import Deck
-from lexilogio.drill import Drill
 from lexilogio.tag import Tag
 from lexilogio.term import Term
 
+# Controller methods timed by enableOperationTiming
+TIMED_CONTROLLER_OPERATIONS = [
+    "reloadDeck",
+    "switchDeck",
+    "makeNewDrill",
+    "saveUpdatedDrillTerms",
+    "query",
+    "searchAllDecks",
+    "addNewTerms",
+    "exportTermsToPath",
+]
+
+# posted to clients with a dict of the changed pref keys -> new values
+NOTIFICATION_PREFS_CHANGED = "prefs.changed"
+# posted with a dict of scope, scopePKey and prefs (changed overrides,
+# None for removed ones)
+NOTIFICATION_SCOPED_PREFS_CHANGED = "prefs.scoped.changed"
+# posted, from the background thread, with the list of added terms when
+# addNewTermsInBackground finishes
+NOTIFICATION_TERMS_ADDED = "terms.added"
+
+# posted with the list of TermConflicts (see deckdatabase) when saving
+# terms found some of them changed by another process since they were
+# loaded
+NOTIFICATION_TERM_CONFLICTS = "terms.conflicts"
+# posted with the number of changed terms when refreshDeck picked up
+# changes made to the deck by another process
+NOTIFICATION_DECK_CHANGED = "deck.changed"
+
+ACTION_ADD_TERMS_IN_BACKGROUND = "addNewTermsInBackground"
+
+# terms inserted per transaction by background imports, so foreground
+# writes (a drill's bin updates) wait for one batch at most
+BACKGROUND_IMPORT_BATCH_SIZE = 500
+
 
 class ControllerClient:
     def __init__(self):
@@ -54,30 +94,233 @@ class Controller:
     def __init__(self):
         self.deckName = None
         self.deck: Deck = None
-        self.drill: Drill = None
+        self.drill = None
         self.database: DeckDatabase = None
 
         self.dataDir = None
         self.dataFilePath = None
 
-    def initialize(self, dataDir, deckName):
-        self.deckName = deckName
+        # load the deck from a binary snapshot when it is current
+        self.useSnapshot = False
+
+        # OperationMetrics while operation timing is enabled
+        self.operationMetrics = None
+
+        # ControllerClients receiving notifications
+        self.clients = []
+
+        # runs addNewTermsInBackground work, created on first use
+        self.backgroundExecutor = None
+
+        # deck revision and term version (see DeckDatabase) the loaded
+        # deck is current with, for refreshDeck
+        self.deckRevision = None
+        self.termVersion = None
+
+        # decks in dataDir, created by initialize; other decks switched
+        # away from stay loaded in the deck cache (see switchDeck)
+        self.deckCatalog = None
+        self.deckCache = None
+
+    def addClient(self, client: ControllerClient):
+        if not client in self.clients:
+            self.clients.append(client)
+
+    def removeClient(self, client: ControllerClient):
+        if client in self.clients:
+            self.clients.remove(client)
+
+    def postNotification(self, notificationIdentifier, notificationData):
+        for client in list(self.clients):
+            client.handleNotification(notificationIdentifier, notificationData)
+
+    def initialize(self, dataDir, deckName, shardCount=0, partitionMode=PARTITION_BY_HASH,
+                   useSnapshot=False):
+        """
+        Open (or create) the named deck in dataDir. If the deck does not
+        exist yet and shardCount is 2 or more, it is created as a sharded
+        deck with terms partitioned by partitionMode.
+
+        With useSnapshot, the deck is loaded from its binary snapshot
+        file when that is current, and the snapshot is rewritten
+        whenever the deck has to be loaded from the database.
+        """
+        from lexilogio.deckcatalog import DeckCatalog, DeckCache
+
+        self.useSnapshot = useSnapshot
         self.dataDir = dataDir
         if not os.path.isdir(self.dataDir):
             logging.info(
                 f"Data dir {self.dataDir} does not exist, creating it..."
             )
             os.makedirs(self.dataDir, exist_ok=True)
+        self.deckCatalog = DeckCatalog(self.dataDir)
+        self.deckCache = DeckCache()
 
+        self.openDeckDatabase(deckName, shardCount, partitionMode)
+        # load or create deck
+        self.reloadDeck()
+
+    def openDeckDatabase(self, deckName, shardCount=0, partitionMode=PARTITION_BY_HASH):
+        self.deckName = deckName
         databaseFileName = DeckDatabase.fileNameForDeckName(deckName)
         self.dataFilePath = os.path.join(self.dataDir, databaseFileName)
-        self.database = DeckDatabase(self.dataFilePath)
+        if shardCount > 1 and not os.path.exists(self.dataFilePath):
+            logging.info(f"Creating deck {deckName} with {shardCount} shards...")
+            self.database = ShardedDeckDatabase.createShardedDeck(
+                self.dataFilePath, shardCount, partitionMode
+            )
+        else:
+            self.database = openDeckDatabase(self.dataFilePath)
+
+    def switchDeck(self, deckName, shardCount=0, partitionMode=PARTITION_BY_HASH):
+        """
+        Make deckName in the data dir the current deck, creating it if it
+        does not exist (see initialize). The current deck stays loaded in
+        the deck cache; a deck found there is refreshed (see refreshDeck)
+        instead of loaded again. Returns True if it came from the cache.
+        """
+        from lexilogio.deckcatalog import OpenDeck
+
+        if DeckDatabase.fileNameForDeckName(deckName) == os.path.basename(self.dataFilePath):
+            return True
+        if None != self.backgroundExecutor:
+            # the background thread may still be writing the current deck
+            self.backgroundExecutor.shutdown(wait=True)
+            self.backgroundExecutor = None
+
+        instrumentation = self.database.instrumentation
+        self.deckCache.put(
+            OpenDeck(self.deckName, self.dataFilePath, self.database, self.deck,
+                     self.deckRevision, self.termVersion)
+        )
+        self.drill = None
+
+        openDeck = self.deckCache.take(deckName)
+        if None != openDeck:
+            self.deckName = openDeck.deckName
+            self.dataFilePath = openDeck.dataFilePath
+            self.database = openDeck.database
+            self.deck = openDeck.deck
+            self.deckRevision = openDeck.deckRevision
+            self.termVersion = openDeck.termVersion
+        else:
+            self.openDeckDatabase(deckName, shardCount, partitionMode)
+        if instrumentation != self.database.instrumentation:
+            self.database.setInstrumentation(instrumentation)
 
-        # load or create deck
-        self.reloadDeck()
+        if None != openDeck:
+            self.refreshDeck()
+        else:
+            self.reloadDeck()
+        return None != openDeck
+
+    def listDecks(self):
+        """
+        Return the DeckCatalogEntries of the decks in the data dir, with
+        their term counts, sorted by name.
+        """
+        return self.deckCatalog.refresh()
+
+    def getOpenDeckNames(self):
+        """
+        Names of the current deck and the decks loaded in the deck cache,
+        most recently used first.
+        """
+        return [self.deckName] + list(reversed(self.deckCache.deckNames()))
+
+    def setDeckCacheLimits(self, maxBytes=None, maxDecks=None):
+        """
+        Limit the decks kept loaded besides the current one to maxDecks
+        and an estimated maxBytes of memory (None keeps a limit).
+        """
+        if None != maxBytes:
+            self.deckCache.maxBytes = maxBytes
+        if None != maxDecks:
+            self.deckCache.maxDecks = maxDecks
+        self.deckCache.evict()
 
     def reloadDeck(self):
+        # read the versions before loading, so a concurrent change can
+        # only make the snapshot look stale or be refreshed again, never
+        # be missed
+        termVersion = self.database.readTermVersion()
+        revision = self.database.readDeckRevision()
+        self.loadDeck(revision)
+        if None == termVersion or None == revision:
+            # loading migrated the database
+            termVersion = self.database.readTermVersion()
+            revision = self.database.readDeckRevision()
+        self.termVersion = termVersion
+        self.deckRevision = revision
+
+    def loadDeck(self, revision):
+        if not self.useSnapshot:
+            self.deck = self.database.loadDeck(self.deckName)
+            return
+
+        from lexilogio.decksnapshot import (
+            loadDeckSnapshot,
+            writeDeckSnapshot,
+            snapshotPathForDatabasePath,
+        )
+
+        snapshotPath = snapshotPathForDatabasePath(self.dataFilePath)
+        deck = loadDeckSnapshot(snapshotPath, self.deckName, revision)
+        if None != deck:
+            logging.debug(f"Loaded deck {self.deckName} from snapshot (revision {revision})")
+            self.deck = deck
+            return
+
         self.deck = self.database.loadDeck(self.deckName)
+        if None == revision:
+            revision = self.database.readDeckRevision()
+        writeDeckSnapshot(self.deck, revision, snapshotPath)
+
+    def refreshDeck(self):
+        """
+        Bring the loaded deck up to date with changes made to the
+        database by other processes (or this one) since it was loaded or
+        last refreshed, without a full reload: changed and deleted term
+        rows are applied to the loaded terms, and categories, tags, tag
+        relations and prefs are re-read. Returns the number of changed
+        terms (clients get NOTIFICATION_DECK_CHANGED with it if not 0),
+        or None if the deck revision is unchanged.
+        """
+        if None == self.termVersion or None == self.deckRevision:
+            self.reloadDeck()
+            return None
+        revision = self.database.readDeckRevision()
+        if revision == self.deckRevision:
+            return None
+
+        terms, deletedPKeys, termVersion = self.database.queryTermChangesSince(
+            self.deck, self.termVersion
+        )
+        changeCount = self.deck.applyTermChanges(terms, deletedPKeys)
+        self.deck.categories = self.database.getDeckCategories(self.deck)
+        self.deck.tags = self.database.getDeckTags(self.deck)
+        termToTags, tagToTerms = self.database.getDeckTermTagRelations(self.deck)
+        self.deck.setTagRelations(termToTags, tagToTerms)
+        self.database.readDeckPreferences(self.deck)
+
+        self.termVersion = termVersion
+        self.deckRevision = revision
+        logging.debug(f"Refreshed deck {self.deckName}: {changeCount} terms changed (revision {revision})")
+        if changeCount > 0:
+            self.postNotification(NOTIFICATION_DECK_CHANGED, changeCount)
+        return changeCount
+
+    def handleTermConflicts(self, conflicts):
+        """
+        Remove the terms deleted by another process from the deck and
+        notify clients of the conflicts.
+        """
+        if len(conflicts) == 0:
+            return
+        self.deck.removeTermsByPKeys([c.term.pkey for c in conflicts if None == c.storedTerm])
+        self.deck.invalidateCategoryMembership()
+        self.postNotification(NOTIFICATION_TERM_CONFLICTS, conflicts)
 
     def get_stats(self):
         return self.database.readDeckStats()
@@ -97,12 +340,18 @@ class Controller:
         return newCat
     
     def setCategoryForTerm(self, category, term):
-        self.database.udpateTermCategory(self.deck, catpk=category.pkey, termpk=term.pkey)
+        term.rowVersion = self.database.udpateTermCategory(
+            self.deck, catpk=category.pkey, termpk=term.pkey
+        )
         term.category = category.pkey
+        self.deck.invalidateCategoryMembership()
 
     def deleteCategory(self, category: Category):
         self.database.deleteDeckCategory(self.deck, category)
-        self.deck.categories.remove(category)
+        if category in self.deck.categories:
+            self.deck.categories.remove(category)
+        # the terms cleared of the category got new row versions
+        self.refreshDeck()
 
     def getTagsList(self):
         def tagNameSort(tag):
@@ -112,10 +361,19 @@ class Controller:
         tags.sort(key=tagNameSort)
         return tags
 
-    def addTag(self, tagName):
-        newTag = self.database.insertDeckTag(self.deck, tagName)
+    def addTag(self, tagName, parent: Tag = None):
+        newTag = self.database.insertDeckTag(self.deck, tagName, parent)
         self.deck.tags.append(newTag)
         return newTag
+
+    def moveTag(self, tag: Tag, newParent: Tag = None):
+        """
+        Move tag and the tags below it under newParent (None for top level).
+        """
+        self.database.moveDeckTag(self.deck, tag, newParent)
+
+    def getTagSubtree(self, tag: Tag):
+        return self.deck.getTagSubtree(tag)
     
     def applyTagToTerm(self, tag:Tag, term:Term):
         # avoid re-applying an already applied tag
@@ -128,15 +386,30 @@ class Controller:
         self.database.applyTagToTerm(self.deck, term, tag)
         
     def removeTagFromTerm(self, tag:Tag, term:Term):
-        if term.pkey in self.deck.termToTags:
-            curTagPKs = self.deck.termToTags[term.pkey]
-            if tag.pkey in curTagPKs:
-                curTagPKs.remove(tag.pkey)
-                
         self.database.removeTagFromTerm(self.deck, tag, term)
         
     def clearTagFromTerms(self, tag:Tag):
         self.database.clearTagFromAllTerms(self.deck, tag)
+
+    def applyTagToTerms(self, tag: Tag, termList: list):
+        """
+        Apply tag to all terms in termList in one statement.
+        Returns the number of terms newly tagged.
+        """
+        return self.database.applyTagToTermPKeys(self.deck, tag, [t.pkey for t in termList])
+
+    def removeTagFromTerms(self, tag: Tag, termList: list):
+        return self.database.removeTagFromTermPKeys(self.deck, tag, [t.pkey for t in termList])
+
+    def applyTagByCriteria(self, tag: Tag, queryCriteriaList):
+        """
+        Apply tag to every term matching the query criteria.
+        Returns the number of terms newly tagged.
+        """
+        return self.database.applyTagByCriteria(self.deck, tag, queryCriteriaList)
+
+    def removeTagByCriteria(self, tag: Tag, queryCriteriaList):
+        return self.database.removeTagByCriteria(self.deck, tag, queryCriteriaList)
         
     def getTagsForTerm(self, term:Term):
         return self.deck.getTagsForTerm(term)
@@ -146,9 +419,64 @@ class Controller:
 
     def addNewTerms(self, newTermList):
         self.database.insertTerms(self.deck, newTermList)
+
+    def addNewTermsInBackground(self, newTermList):
+        """
+        Insert newTermList on a background thread (which has its own
+        database connection) in batches of BACKGROUND_IMPORT_BATCH_SIZE,
+        so drilling can go on meanwhile. When done, clients are sent
+        NOTIFICATION_TERMS_ADDED, or handleError if it failed, from that
+        thread; reloadDeck picks up the new terms. Returns a Future of the
+        number of terms added.
+        """
+        if None == self.backgroundExecutor:
+            self.backgroundExecutor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="lexilogio-background"
+            )
+        deck = self.deck
+        database = self.database
+
+        def addTerms():
+            try:
+                for start in range(0, len(newTermList), BACKGROUND_IMPORT_BATCH_SIZE):
+                    database.insertTerms(
+                        deck, newTermList[start : start + BACKGROUND_IMPORT_BATCH_SIZE]
+                    )
+            except Exception as ex:
+                for client in list(self.clients):
+                    client.handleError(
+                        ACTION_ADD_TERMS_IN_BACKGROUND, type(ex).__name__, "Adding terms failed", str(ex)
+                    )
+                raise
+            self.postNotification(NOTIFICATION_TERMS_ADDED, newTermList)
+            return len(newTermList)
+
+        return self.backgroundExecutor.submit(addTerms)
+
+    def shutdown(self):
+        """
+        Wait for background work to finish, then close the database
+        connections of all threads, and the decks in the deck cache.
+        """
+        if None != self.backgroundExecutor:
+            self.backgroundExecutor.shutdown(wait=True)
+            self.backgroundExecutor = None
+        if None != self.database:
+            self.database.close()
+        if None != self.deckCache:
+            self.deckCache.closeAll()
         
     def updateTerms(self, termList):
-        self.database.updateTerms(self.deck, termList)
+        """
+        Save edited terms. Terms changed by another process since they
+        were loaded are not saved but refreshed; returns their
+        TermConflicts (also posted as NOTIFICATION_TERM_CONFLICTS).
+        """
+        conflicts = self.database.updateTerms(self.deck, termList)
+        # edited terms may have changed category
+        self.deck.invalidateCategoryMembership()
+        self.handleTermConflicts(conflicts)
+        return conflicts
         
     def deleteTerm(self, term):
         self.database.deleteTerm(self.deck, term)
@@ -156,6 +484,53 @@ class Controller:
         
     def query(self, queryCriteriaList):
         return self.database.queryByCriteria(self.deck, queryCriteriaList)
+
+    def iterDeckSearchResults(self, queryCriteriaLists):
+        """
+        Search all decks in the data dir (loaded or not) for terms
+        matching any of the criteria lists, yielding each deck's
+        DeckSearchResult as soon as it is done; see DeckSearch.
+        """
+        from lexilogio.decksearch import DeckSearch
+
+        deckPaths = [(entry.deckName, entry.path) for entry in self.deckCatalog.refresh()]
+        yield from DeckSearch(self.dataDir).iterDeckResults(queryCriteriaLists, deckPaths)
+
+    def searchAllDecks(self, queryCriteriaLists, limit=None):
+        """
+        The SearchHits for queryCriteriaLists in all decks, best ranked
+        first, at most limit of them.
+        """
+        from lexilogio.decksearch import mergeSearchHits
+
+        return mergeSearchHits(list(self.iterDeckSearchResults(queryCriteriaLists)), limit)
+
+    # bulk edits of all terms matching a query; each returns the number
+    # of terms changed and keeps the loaded deck up to date
+
+    def recategorizeByCriteria(self, queryCriteriaList, category: Category):
+        return self.database.recategorizeByCriteria(self.deck, queryCriteriaList, category)
+
+    def resetBinsByCriteria(self, queryCriteriaList, resetBin=True, resetReversedBin=True):
+        return self.database.resetBinsByCriteria(
+            self.deck, queryCriteriaList, resetBin, resetReversedBin
+        )
+
+    def setPaperCardByCriteria(self, queryCriteriaList, hasPaperCard: bool):
+        return self.database.setPaperCardByCriteria(self.deck, queryCriteriaList, hasPaperCard)
+
+    def deleteByCriteria(self, queryCriteriaList):
+        return self.database.deleteByCriteria(self.deck, queryCriteriaList)
+
+    def checkIntegrity(self, repair=False):
+        """
+        Check the deck database for orphaned rows; see
+        DeckDatabase.checkIntegrity. The deck is reloaded after a repair.
+        """
+        report = self.database.checkIntegrity(self.deck, repair)
+        if repair and sum(report.values()) > 0:
+            self.reloadDeck()
+        return report
     
     def getTerm(self, termID):
         return self.deck.getTermByPKey(termID)
@@ -165,47 +540,116 @@ class Controller:
 
     # -------------------------------------- Deck Preferences
     def reloadPrefs(self):
+        """
+        Re-read the prefs from the database; only needed if another
+        process may have changed them, as deck.prefs is kept current.
+        """
         self.database.readDeckPreferences(self.deck)
 
+    def setPrefs(self, newPrefs: dict):
+        """
+        Set several prefs (key -> value, see deckprefs) at once. Only the
+        changed ones are written, in one transaction, and clients are
+        notified of them with NOTIFICATION_PREFS_CHANGED. Returns the
+        changed prefs.
+        """
+        changes = self.database.updateDeckPreferences(self.deck, newPrefs)
+        if len(changes) > 0:
+            self.postNotification(NOTIFICATION_PREFS_CHANGED, changes)
+        return changes
+
+    def resolvePrefs(self, category: Category = None, tag: Tag = None):
+        """
+        The prefs a drill of category and/or tag uses; see Deck.resolvePrefs.
+        """
+        return self.deck.resolvePrefs(category, tag)
+
+    def getCategoryPrefs(self, category: Category):
+        return dict(self.deck.getScopedPrefs(Deck.PREFS_SCOPE_CATEGORY, category.pkey))
+
+    def setCategoryPrefs(self, category: Category, newPrefs: dict):
+        """
+        Override prefs for drills of category; a value of None removes
+        an override. Returns the changed overrides.
+        """
+        return self.setScopedPrefs(Deck.PREFS_SCOPE_CATEGORY, category.pkey, newPrefs)
+
+    def getTagPrefs(self, tag: Tag):
+        return dict(self.deck.getScopedPrefs(Deck.PREFS_SCOPE_TAG, tag.pkey))
+
+    def setTagPrefs(self, tag: Tag, newPrefs: dict):
+        """
+        Override prefs for drills of tag and the tags below it; a value
+        of None removes an override. Returns the changed overrides.
+        """
+        return self.setScopedPrefs(Deck.PREFS_SCOPE_TAG, tag.pkey, newPrefs)
+
+    def setScopedPrefs(self, scope, scopePK, newPrefs: dict):
+        changes = self.database.updateScopedPreferences(self.deck, scope, scopePK, newPrefs)
+        if len(changes) > 0:
+            self.postNotification(
+                NOTIFICATION_SCOPED_PREFS_CHANGED,
+                {"scope": scope, "scopePKey": scopePK, "prefs": changes},
+            )
+        return changes
+
     def getPref_drillQuestionCount(self):
         return self.deck.getDrillQuestionCount()
 
     def setPref_drillQuestionCount(self, newCount: int):
-        self.deck.prefs[Deck.PREFSKEY_QUESTION_COUNT] = newCount
-        self.database.writeDeckPreferences(self.deck)
+        self.setPrefs({Deck.PREFSKEY_QUESTION_COUNT: newCount})
 
     def getPref_isReversedDrill(self):
         return self.deck.isReversedDrill()
 
     def setPref_isReversedDri(self, is_reversed: bool):
-        self.deck.prefs[Deck.PREFSKEY_REVERSED_DRILL] = is_reversed
-        self.database.writeDeckPreferences(self.deck)
+        self.setPrefs({Deck.PREFSKEY_REVERSED_DRILL: is_reversed})
 
     def getPref_isUsingSpacedRepetition(self):
         return self.deck.isUsingSpacedRepetition()
 
     def setPref_isUsingSpacedRepetition(self, use_spaced_rep: bool):
-        self.deck.prefs[Deck.PREFSKEY_SPACED_REPETITION] = use_spaced_rep
-        self.database.writeDeckPreferences(self.deck)
+        self.setPrefs({Deck.PREFSKEY_SPACED_REPETITION: use_spaced_rep})
 
     def getPref_spacedBinDistribution(self):
-        return self.deck.getSpacedBinDistribution()
+        # a copy, so edits by the caller are seen as changes by setPrefs
+        return dict(self.deck.getSpacedBinDistribution())
 
     def setPref_spacedBinDistribution(self, binDist):
-        self.deck.prefs[Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION] = binDist
-        self.database.writeDeckPreferences(self.deck)
+        self.setPrefs({Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION: binDist})
 
     # -------------------------------------- Drill
 
-    def makeNewDrill(self, category: Category = None, tag: Tag = None):
-        self.drill = Drill.makeDrillFromDeck(deck=self.deck, category=category, tag=tag)
+    def makeNewDrill(self, category: Category = None, tag: Tag = None, queryCriteriaList=None,
+                     includeSubtags=False):
+        """
+        Make a drill from the category and/or tag (with includeSubtags,
+        also from the tags below it), or, if given, from the terms matching
+        queryCriteriaList (see DeckDatabase.queryByCriteria).
+        """
+        # drill module (and random/math) is loaded on first drill only
+        from lexilogio.drill import Drill
+
+        if None != queryCriteriaList and len(queryCriteriaList) > 0:
+            pkeys = self.database.queryTermPKeysByCriteria(self.deck, queryCriteriaList)
+            self.drill = Drill.makeDrillFromTerms(self.deck, self.deck.getTermsByPKeys(pkeys))
+        else:
+            self.drill = Drill.makeDrillFromDeck(
+                deck=self.deck, category=category, tag=tag, includeSubtags=includeSubtags
+            )
         # TODO notify that drill was created successfull
 
     def currentDrillTerm(self):
         return self.drill.currentTerm()
 
+    def isDrillReversed(self):
+        return self.drill.isReversed
+
+    def markDrillQuestionShown(self):
+        self.drill.markQuestionShown()
+
     def setTermBinValue(self, binValue):
-        self.drill.assignBinValue(binValue, self.deck.isReversedDrill())
+        self.drill.assignBinValue(binValue, self.drill.isReversed)
 
     def advanceDrill(self):
         self.drill.advance()
@@ -214,17 +658,160 @@ class Controller:
         return self.drill.isCompleted()
 
     def saveUpdatedDrillTerms(self):
+        """
+        Save the drill's bin changes and reviews. Where another process
+        drilled a term meanwhile, the later drill's bin is kept; returns
+        the TermConflicts (also posted as NOTIFICATION_TERM_CONFLICTS).
+        """
         updatedTerms = self.drill.getUpdatedTerms()
         logging.debug(f"Saving {len(updatedTerms)} updated terms...")
+        conflicts = []
         if len(updatedTerms) > 0:
-            self.database.updateTermBins(
-                self.deck, updatedTerms, self.deck.isReversedDrill()
+            conflicts = self.database.updateTermBins(
+                self.deck, updatedTerms, self.drill.isReversed
             )
+        self.database.appendReviewLog(self.deck, self.drill.takeReviews())
+        # saved, so refreshDeck may update them again
+        for t in updatedTerms:
+            t.updated = False
+        self.handleTermConflicts(conflicts)
+        return conflicts
             
     def getMissedDrillTerms(self):
-        return self.drill.getMissedTerms(self.deck.isReversedDrill())
+        return self.drill.getMissedTerms(self.drill.isReversed)
         
+    # -------------------------------------- Review analytics
+    # (see reviewlog; these read the daily rollups)
+
+    def getRetentionCurve(self, sinceDays=None, isReversed=None):
+        from lexilogio.reviewlog import retentionCurve
+
+        return retentionCurve(self.database.getDbConnection(), sinceDays, isReversed)
+
+    def getCategoryAccuracy(self, sinceDays=None):
+        from lexilogio.reviewlog import categoryAccuracy
+
+        return categoryAccuracy(self.database.getDbConnection(), sinceDays)
+
+    def getDailyReviewCounts(self, sinceDays=30):
+        from lexilogio.reviewlog import dailyReviewCounts
+
+        return dailyReviewCounts(self.database.getDbConnection(), sinceDays)
+
+    def getWorkloadForecast(self, days=7):
+        from lexilogio.reviewlog import workloadForecast
+
+        return workloadForecast(
+            self.deck.terms, days, self.deck.getSpacedBinIntervals(), self.deck.isReversedDrill()
+        )
+
+    def tuneBinPrefs(self, apply=True):
+        """
+        Fit bin intervals and weights to the review log (see bintuning)
+        and, with apply, write them to the deck prefs. The prefs are
+        left alone if no bin had enough reviews to fit. Returns the
+        BinTuningResult.
+        """
+        from lexilogio.bintuning import tuneBinPrefs
+
+        result = tuneBinPrefs(self.database, self.deck)
+        if apply and len(result.stabilities) > 0:
+            self.setPrefs(
+                {
+                    Deck.PREFSKEY_SPACED_BIN_INTERVALS: result.intervals,
+                    Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION: result.weights,
+                }
+            )
+        return result
+
     # -------------------------------------- Import and Export
+    def mergeFromDeckFile(self, sourcePath, applyDeletes=False):
+        """
+        Merge another deck database file (e.g. a learner's offline copy)
+        into this deck. Returns the applied DeckDiff.
+        """
+        from lexilogio.deckmerge import mergeDecks
+
+        sourceDb = openDeckDatabase(sourcePath)
+        try:
+            diff = mergeDecks(sourceDb, self.database, self.deck, applyDeletes)
+        finally:
+            sourceDb.close()
+        self.reloadDeck()
+        return diff
+
+    def enableSqlInstrumentation(self, slowQuerySeconds=None, explainPlans=True):
+        """
+        Start recording per-statement SQL statistics for the deck database.
+        Statements slower than slowQuerySeconds (default 100ms) are logged.
+        """
+        from lexilogio.sqlinstrumentation import (
+            SqlInstrumentation,
+            DEFAULT_SLOW_QUERY_SECONDS,
+        )
+
+        if None == slowQuerySeconds:
+            slowQuerySeconds = DEFAULT_SLOW_QUERY_SECONDS
+        instrumentation = SqlInstrumentation(slowQuerySeconds, explainPlans)
+        self.database.setInstrumentation(instrumentation)
+        return instrumentation
+
+    def disableSqlInstrumentation(self):
+        self.database.setInstrumentation(None)
+
+    def getSqlInstrumentation(self):
+        return self.database.instrumentation
+
+    def getSqlCounters(self):
+        """
+        Return the SQL counters as a dict, or None if instrumentation
+        is not enabled.
+        """
+        if None == self.database.instrumentation:
+            return None
+        return self.database.instrumentation.counters()
+
+    # -------------------------------------- Operation timing
+
+    def enableOperationTiming(self):
+        """
+        Record the latency of the TIMED_CONTROLLER_OPERATIONS methods in
+        histograms. The timed methods are wrapped on this instance only,
+        so there is no overhead while timing is disabled.
+        """
+        if None != self.operationMetrics:
+            return self.operationMetrics
+
+        from lexilogio.operationmetrics import OperationMetrics
+
+        self.operationMetrics = OperationMetrics()
+        for operation in TIMED_CONTROLLER_OPERATIONS:
+            setattr(
+                self, operation, self.operationMetrics.timed(operation, getattr(self, operation))
+            )
+        return self.operationMetrics
+
+    def disableOperationTiming(self):
+        if None == self.operationMetrics:
+            return
+        for operation in TIMED_CONTROLLER_OPERATIONS:
+            # removing the instance attribute restores the class method
+            delattr(self, operation)
+        self.operationMetrics = None
+
+    def getOperationMetrics(self):
+        return self.operationMetrics
+
+    def dumpOperationMetrics(self, filePath, format=None):
+        """
+        Write the operation histograms to filePath as Prometheus text or
+        JSON (chosen by the .json extension if format is None).
+        """
+        if None == self.operationMetrics:
+            return False
+        self.operationMetrics.writeToFile(filePath, format)
+        return True
+
     def exportTermsToPath(self, filePath, category: Category = None):
         self.reloadDeck()
         termList = None
@@ -8,6 +8,12 @@ Created on Sat Apr  8 23:55:23 2023
 
 from lexilogio.category import Category
 from lexilogio.tag import Tag
+from lexilogio.termbitset import (
+    TermMembership,
+    bitsetUnion,
+    bitsetIntersection,
+    bitsetCount,
+)
 import random
 
 class Deck:
@@ -15,6 +21,14 @@ class Deck:
     PREFSKEY_SPACED_REPETITION = "using.spaced.repetition"
     PREFSKEY_REVERSED_DRILL = "reversed.drill"
     PREFSKEY_SPACED_BIN_DISTRIBUTION = "spaced.bin.distribution"
+    # days until a term in each bin is due for review again
+    PREFSKEY_SPACED_BIN_INTERVALS = "spaced.bin.intervals"
+    # share of reviews to be recalled that bin intervals are tuned for
+    PREFSKEY_RETENTION_TARGET = "retention.target"
+
+    # scopes of pref overrides, see resolvePrefs
+    PREFS_SCOPE_CATEGORY = "category"
+    PREFS_SCOPE_TAG = "tag"
 
     def __init__(self, name):
         self.name = name
@@ -24,6 +38,14 @@ class Deck:
         self.termToTags = {}  # term pkey -> array of tag pkey
         self.tagToTerms = {}  # tag pkey -> array of term pkey
         self.prefs = {}
+        # (scope, category or tag pkey) -> pref overrides
+        self.scopedPrefs = {}
+        # (category pkey, tag pkey) -> resolved prefs
+        self.resolvedPrefs = {}
+        # term ordinals and membership bitsets, rebuilt when the term
+        # list changes
+        self.termMembership = None
+        self.termMembershipKey = None
 
     def clear(self):
         """
@@ -38,6 +60,9 @@ class Deck:
         self.categories = []
         self.tags = []
         self.prefs = {}
+        self.scopedPrefs = {}
+        self.resolvedPrefs = {}
+        self.termMembership = None
 
     def getDrillQuestionCount(self):
         return self.prefs[Deck.PREFSKEY_QUESTION_COUNT]
@@ -51,9 +76,65 @@ class Deck:
     def getSpacedBinDistribution(self):
         return self.prefs[Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION]
 
+    def getSpacedBinIntervals(self):
+        return self.prefs[Deck.PREFSKEY_SPACED_BIN_INTERVALS]
+
+    def getRetentionTarget(self):
+        return self.prefs[Deck.PREFSKEY_RETENTION_TARGET]
+
+    def resolvePrefs(self, category: Category = None, tag: Tag = None):
+        """
+        Return the prefs for a drill of category and/or tag: the deck
+        prefs, overridden by those of the category, then by those of the
+        tag's ancestors from the top level down, then by the tag's own.
+        Results are cached until invalidateResolvedPrefs; do not modify
+        them.
+        """
+        categoryPK = None if None == category else category.pkey
+        tagPK = None if None == tag else tag.pkey
+        prefs = self.resolvedPrefs.get((categoryPK, tagPK))
+        if None != prefs:
+            return prefs
+
+        prefs = dict(self.prefs)
+        if None != categoryPK:
+            prefs.update(self.scopedPrefs.get((Deck.PREFS_SCOPE_CATEGORY, categoryPK), {}))
+        if None != tagPK:
+            tagPKs = [tagPK]
+            parent = self.getTagByPK(tag.parent)
+            while None != parent and len(tagPKs) <= len(self.tags):
+                tagPKs.insert(0, parent.pkey)
+                parent = self.getTagByPK(parent.parent)
+            for pk in tagPKs:
+                prefs.update(self.scopedPrefs.get((Deck.PREFS_SCOPE_TAG, pk), {}))
+        self.resolvedPrefs[(categoryPK, tagPK)] = prefs
+        return prefs
+
+    def getScopedPrefs(self, scope, scopePK):
+        return self.scopedPrefs.get((scope, scopePK), {})
+
+    def invalidateResolvedPrefs(self):
+        """
+        Call after changing prefs, pref overrides or tag parents.
+        """
+        self.resolvedPrefs = {}
+
+    def removeCategory(self, category: Category):
+        """
+        Remove category from the deck and clear it from its terms.
+        """
+        if category in self.categories:
+            self.categories.remove(category)
+        if None != self.scopedPrefs.pop((Deck.PREFS_SCOPE_CATEGORY, category.pkey), None):
+            self.invalidateResolvedPrefs()
+        for term in self.terms:
+            if term.category == category.pkey:
+                term.category = None
+        self.invalidateCategoryMembership()
+
     def removeTerm(self, term):
-        if term in self.terms:
-            self.terms.remove(term)
+        # with its tag relations, as deleting the term row cascades to them
+        self.removeTermsByPKeys([term.pkey])
         
     # utilities for filtering terms
 
@@ -77,15 +158,55 @@ class Deck:
         return result
 
     def getTermsInCategory(self, category: Category):
-        return [t for t in self.terms if t.category == category.pkey]
+        membership = self.getTermMembership()
+        return membership.termsForBitset(membership.categoryBitset(category.pkey))
+
+    def countTermsInCategory(self, category: Category):
+        return bitsetCount(self.getTermMembership().categoryBitset(category.pkey))
     
     def getTermByPKey(self, pkey):
-        #print(f"DEBUG - checking {len(self.terms)} terms for pkey {pkey}...")
-        for t in self.terms:
-            #print(f"  {str(t)}")
-            if t.pkey == pkey:
-                return t
-        return None
+        ordinal = self.getTermMembership().ordinalForPKey.get(pkey)
+        if None == ordinal:
+            return None
+        return self.terms[ordinal]
+
+    def getTermMembership(self):
+        """
+        Return the TermMembership (ordinals and membership bitsets) for
+        the current terms.
+        """
+        # terms are replaced as a list (load, bulk delete) or removed with
+        # removeTerm, so the list identity and length identify its state
+        membershipKey = (id(self.terms), len(self.terms))
+        if None == self.termMembership or self.termMembershipKey != membershipKey:
+            self.termMembership = TermMembership(self.terms)
+            self.termMembershipKey = membershipKey
+        return self.termMembership
+
+    def invalidateCategoryMembership(self):
+        """
+        Must be called after changing the category of terms in the deck.
+        """
+        if None != self.termMembership:
+            self.termMembership.invalidateCategories()
+
+    def invalidateTagMembership(self, tagPK):
+        if None != self.termMembership:
+            self.termMembership.invalidateTag(tagPK)
+
+    def getTermsByPKeys(self, pkeys):
+        """
+        Return the terms for pkeys, in the same order, skipping pkeys not
+        in the deck.
+        """
+        ordinalForPKey = self.getTermMembership().ordinalForPKey
+        return [self.terms[ordinalForPKey[pk]] for pk in pkeys if pk in ordinalForPKey]
+
+    def getTagBitset(self, tag: Tag):
+        return self.getTermMembership().tagBitset(tag.pkey, self.tagToTerms)
+
+    def getCategoryBitset(self, category: Category):
+        return self.getTermMembership().categoryBitset(category.pkey)
 
     def getTermsInCategoryOfBinValue(
         self, category: Category, binValue, reversedBin
@@ -93,24 +214,40 @@ class Deck:
         if None == category:
             return self.getTermsFromBin(binValue, reversedBin)
 
+        categoryTerms = self.getTermsInCategory(category)
         if reversedBin:
-            return [
-                t
-                for t in self.terms
-                if t.category == category.pkey and t.reversedBin == binValue
-            ]
+            return [t for t in categoryTerms if t.reversedBin == binValue]
         else:
-            return [
-                t
-                for t in self.terms
-                if t.category == category.pkey and t.bin == binValue
-            ]
+            return [t for t in categoryTerms if t.bin == binValue]
         
     def getTermsWithTag(self, tag: Tag):
         if tag.pkey in self.tagToTerms:
-            termPKs = self.tagToTerms[tag.pkey]
-            return [t for t in self.terms if t.pkey in termPKs]
+            membership = self.getTermMembership()
+            return membership.termsForBitset(self.getTagBitset(tag))
         return []
+
+    def countTermsWithTag(self, tag: Tag):
+        return bitsetCount(self.getTagBitset(tag))
+
+    def getTagCriteriaBitset(self, anyTags: list, requiredTags: list = []):
+        """
+        Return the bitset of terms having at least one of anyTags (if any
+        are given) and every one of requiredTags.
+        """
+        bitsets = [self.getTagBitset(tag) for tag in requiredTags]
+        if len(anyTags) > 0:
+            bitsets.append(bitsetUnion([self.getTagBitset(tag) for tag in anyTags]))
+        if len(bitsets) == 0:
+            return (1 << len(self.terms)) - 1
+        return bitsetIntersection(bitsets)
+
+    def getTermPKeysMatchingTags(self, anyTags: list, requiredTags: list = []):
+        """
+        Return the set of pkeys of terms having at least one of anyTags
+        (if any are given) and every one of requiredTags.
+        """
+        bits = self.getTagCriteriaBitset(anyTags, requiredTags)
+        return set(self.getTermMembership().pkeysForBitset(bits))
     
     def getTermsWithTagOfBinValue(self, tag: Tag, binValue, reversedBin):
         if None == tag:
@@ -144,6 +281,163 @@ class Deck:
             tags = [tg for tg in self.tags if tg.pkey in tagPKs]
         return tags
 
+    def updateTermAttributes(self, termPKs, attributeValues: dict):
+        """
+        Set the given attributes (name -> value) on each of the terms
+        in termPKs, in one pass over the terms.
+        """
+        for term in self.getTermsByPKeys(termPKs):
+            for name, value in attributeValues.items():
+                setattr(term, name, value)
+        if "category" in attributeValues:
+            self.invalidateCategoryMembership()
+
+    def applyTermChanges(self, changedTerms, deletedPKs):
+        """
+        Bring the deck up to date with term rows changed elsewhere (see
+        DeckDatabase.queryTermChangesSince): loaded terms are updated in
+        place, new ones appended and deleted ones removed. Terms with
+        unsaved drill results (updated) are left as they are. Returns
+        the number of terms changed.
+        """
+        changedPKs = set([t.pkey for t in changedTerms])
+        removedPKs = [pk for pk in deletedPKs if not pk in changedPKs]
+        existingPKs = [pk for pk in removedPKs if None != self.getTermByPKey(pk)]
+        self.removeTermsByPKeys(existingPKs)
+
+        changeCount = len(existingPKs)
+        newTerms = []
+        for changedTerm in changedTerms:
+            term = self.getTermByPKey(changedTerm.pkey)
+            if None == term:
+                newTerms.append(changedTerm)
+            elif not term.updated and term.rowVersion != changedTerm.rowVersion:
+                term.copyStoredFields(changedTerm)
+                changeCount += 1
+        if len(newTerms) > 0:
+            # a new list, so the term membership is rebuilt (terms loaded
+            # from a snapshot are a SnapshotTermSequence, which has no +)
+            self.terms = list(self.terms) + newTerms
+            changeCount += len(newTerms)
+        self.invalidateCategoryMembership()
+        return changeCount
+
+    def removeTermsByPKeys(self, termPKs):
+        """
+        Remove the terms in termPKs, and their tag relations.
+        """
+        termPKs = set(termPKs)
+        if len(termPKs) == 0:
+            return
+        self.terms = [t for t in self.terms if not t.pkey in termPKs]
+
+        for termPK in termPKs:
+            self.termToTags.pop(termPK, None)
+        for tagPK in list(self.tagToTerms.keys()):
+            remainingPKs = [pk for pk in self.tagToTerms[tagPK] if not pk in termPKs]
+            if len(remainingPKs) > 0:
+                self.tagToTerms[tagPK] = remainingPKs
+            else:
+                del self.tagToTerms[tagPK]
+
+    def setTagRelations(self, termToTags, tagToTerms):
+        """
+        Replace all tag relations, e.g. after re-reading them.
+        """
+        self.termToTags = termToTags
+        self.tagToTerms = tagToTerms
+        if None != self.termMembership:
+            self.termMembership.tagBitsets = {}
+
+    def addTagRelations(self, tagPK, termPKs):
+        """
+        Record tagPK as applied to each of termPKs, skipping terms
+        that already have it.
+        """
+        self.invalidateTagMembership(tagPK)
+        taggedPKs = self.tagToTerms.setdefault(tagPK, [])
+        existingPKs = set(taggedPKs)
+        for termPK in termPKs:
+            if termPK in existingPKs:
+                continue
+            existingPKs.add(termPK)
+            taggedPKs.append(termPK)
+            self.termToTags.setdefault(termPK, []).append(tagPK)
+
+    def removeTagRelations(self, tagPK, termPKs=None):
+        """
+        Remove tagPK from each of termPKs, or from all terms if termPKs
+        is None.
+        """
+        taggedPKs = self.tagToTerms.get(tagPK)
+        if None == taggedPKs:
+            return
+        self.invalidateTagMembership(tagPK)
+        if None == termPKs:
+            removedPKs = set(taggedPKs)
+        else:
+            removedPKs = set(termPKs)
+
+        for termPK in removedPKs:
+            termTagPKs = self.termToTags.get(termPK)
+            if None != termTagPKs and tagPK in termTagPKs:
+                termTagPKs.remove(tagPK)
+
+        remainingPKs = [pk for pk in taggedPKs if not pk in removedPKs]
+        if len(remainingPKs) > 0:
+            self.tagToTerms[tagPK] = remainingPKs
+        else:
+            del self.tagToTerms[tagPK]
+
+    def getTagByPK(self, tagPK):
+        for tag in self.tags:
+            if tag.pkey == tagPK:
+                return tag
+        return None
+
+    def getTagSubtree(self, tag: Tag):
+        """
+        Return tag and every tag below it, from the deck's tag parents.
+        """
+        childTags = {}
+        for t in self.tags:
+            if None != t.parent:
+                childTags.setdefault(t.parent, []).append(t)
+
+        subtree = [tag]
+        index = 0
+        while index < len(subtree):
+            subtree.extend(childTags.get(subtree[index].pkey, []))
+            index += 1
+        return subtree
+
+    def getTagSubtreeBitset(self, tag: Tag):
+        return bitsetUnion([self.getTagBitset(t) for t in self.getTagSubtree(tag)])
+
+    def getTagPath(self, tag: Tag):
+        """
+        Return the tag names from the top level down to tag, joined by '/'.
+        """
+        names = [tag.name]
+        parent = self.getTagByPK(tag.parent)
+        while None != parent and len(names) <= len(self.tags):
+            names.insert(0, parent.name)
+            parent = self.getTagByPK(parent.parent)
+        return "/".join(names)
+
+    def removeTag(self, tag: Tag, childPKs=[], parentPK=None):
+        """
+        Remove tag and its relations from the deck; its child tags
+        (childPKs) move up to parentPK.
+        """
+        self.tags = [t for t in self.tags if t.pkey != tag.pkey]
+        for t in self.tags:
+            if t.pkey in childPKs:
+                t.parent = parentPK
+        self.scopedPrefs.pop((Deck.PREFS_SCOPE_TAG, tag.pkey), None)
+        self.invalidateResolvedPrefs()
+        self.removeTagRelations(tag.pkey)
+
     def getCategoryByName(self, catName):
         for cat in self.categories:
             if cat.name == catName:
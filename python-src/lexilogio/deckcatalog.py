@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 23:48:36 2026
+
+@author: mathaes
+
+The decks of a data directory, for hosts serving more than one deck.
+
+DeckCatalog lists the lexilogio_*.db deck files of a data dir with their
+term counts. The counts are cached in a JSON index file in the data dir,
+keyed by the size and modification time of each deck's files (including
+WAL and shard files); a deck whose files changed is checked against its
+cached deck revision, and only counted again if that changed too. Deck
+files are read through read-only connections, so listing never migrates
+or locks a deck.
+
+DeckCache keeps recently used decks loaded (Deck and DeckDatabase), least
+recently used first out once their estimated memory use or number
+exceeds its limits. See Controller.switchDeck.
+"""
+
+import glob
+import json
+import logging
+import os
+import sqlite3
+import sys
+from collections import OrderedDict
+
+from lexilogio.deckdatabase import (
+    DeckDatabase,
+    DECK_TERMS_TABLE_NAME,
+    DECK_META_TABLE_NAME,
+)
+from lexilogio.shardeddeckdatabase import ShardedDeckDatabase
+
+CATALOG_FILE_NAME = "lexilogio_catalog.json"
+CATALOG_FORMAT_VERSION = 1
+
+DECK_FILE_PREFIX = "lexilogio_"
+DECK_FILE_SUFFIX = ".db"
+
+DEFAULT_DECK_CACHE_BYTES = 256 * 1024 * 1024
+DEFAULT_DECK_CACHE_DECKS = 8
+
+# terms sampled to estimate a deck's memory use
+ESTIMATE_SAMPLE_TERMS = 200
+# estimated bytes per tag relation (list entries and dict share)
+ESTIMATE_RELATION_BYTES = 80
+
+
+def deckNameForFileName(fileName):
+    """
+    The deck name for a deck file name; spaces in deck names are stored
+    as underscores, and opening the underscore name finds the same file.
+    """
+    return fileName[len(DECK_FILE_PREFIX) : -len(DECK_FILE_SUFFIX)]
+
+
+def shardFilePaths(deckPath):
+    paths = []
+    while os.path.isfile(ShardedDeckDatabase.shardPathForIndex(deckPath, len(paths))):
+        paths.append(ShardedDeckDatabase.shardPathForIndex(deckPath, len(paths)))
+    return paths
+
+
+def fileSignature(paths):
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append([stat.st_mtime_ns, stat.st_size])
+        except FileNotFoundError:
+            signature.append(None)
+    return signature
+
+
+def readOnlyConnection(path):
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def readFileValue(path, sql, default):
+    con = readOnlyConnection(path)
+    try:
+        row = con.execute(sql).fetchone()
+    except sqlite3.OperationalError:
+        # not (yet) a deck database, or not migrated
+        return default
+    finally:
+        con.close()
+    return default if None == row else row[0]
+
+
+def estimateDeckBytes(deck, sampleSize=ESTIMATE_SAMPLE_TERMS):
+    """
+    Estimate the memory used by a loaded deck from a sample of its terms
+    and the number of tag relations. For decks loaded lazily from a
+    snapshot this is what the deck grows to once all terms are used.
+    """
+    termCount = len(deck.terms)
+    termBytes = 0
+    if termCount > 0:
+        step = max(1, termCount // sampleSize)
+        sampled = 0
+        sampleBytes = 0
+        for index in range(0, termCount, step):
+            term = deck.terms[index]
+            sampleBytes += sys.getsizeof(term) + sys.getsizeof(term.__dict__)
+            sampleBytes += sys.getsizeof(term.question) + sys.getsizeof(term.answer)
+            sampled += 1
+        termBytes = sampleBytes * termCount // sampled
+
+    relationCount = sum([len(tagPKs) for tagPKs in deck.termToTags.values()])
+    return termBytes + 2 * relationCount * ESTIMATE_RELATION_BYTES
+
+
+class DeckCatalogEntry:
+    def __init__(self, deckName, path):
+        self.deckName = deckName
+        self.path = path
+        self.fileName = os.path.basename(path)
+        self.shardCount = 0
+        self.termCount = 0
+        # None for decks not yet migrated to have a revision counter
+        self.revision = None
+        self.signature = None
+
+    def toJSON(self):
+        return {
+            "shardCount": self.shardCount,
+            "termCount": self.termCount,
+            "revision": self.revision,
+            "signature": self.signature,
+        }
+
+    def fromJSON(deckName, path, values):
+        entry = DeckCatalogEntry(deckName, path)
+        entry.shardCount = values.get("shardCount", 0)
+        entry.termCount = values.get("termCount", 0)
+        entry.revision = values.get("revision")
+        entry.signature = values.get("signature")
+        return entry
+
+    def __repr__(self):
+        shards = f", {self.shardCount} shards" if self.shardCount > 0 else ""
+        return f"{self.deckName} ({self.termCount} terms{shards})"
+
+
+class DeckCatalog:
+    """
+    The decks in dataDir with their (cached) term counts.
+    """
+
+    def __init__(self, dataDir):
+        self.dataDir = dataDir
+        self.catalogPath = os.path.join(dataDir, CATALOG_FILE_NAME)
+        # file name -> DeckCatalogEntry
+        self.entries = None
+
+    def readCatalogFile(self):
+        entries = {}
+        if not os.path.isfile(self.catalogPath):
+            return entries
+        try:
+            with open(self.catalogPath) as catalogFile:
+                catalog = json.load(catalogFile)
+        except (OSError, ValueError) as ex:
+            logging.warning(f"Ignoring unreadable deck catalog {self.catalogPath}: {ex}")
+            return entries
+        if catalog.get("version") != CATALOG_FORMAT_VERSION:
+            return entries
+        for fileName, values in catalog.get("decks", {}).items():
+            entries[fileName] = DeckCatalogEntry.fromJSON(
+                deckNameForFileName(fileName), os.path.join(self.dataDir, fileName), values
+            )
+        return entries
+
+    def writeCatalogFile(self):
+        catalog = {
+            "version": CATALOG_FORMAT_VERSION,
+            "decks": {fileName: entry.toJSON() for fileName, entry in self.entries.items()},
+        }
+        # write and rename, so concurrent readers never see a partial file
+        tempPath = f"{self.catalogPath}.{os.getpid()}.tmp"
+        try:
+            with open(tempPath, "w") as catalogFile:
+                json.dump(catalog, catalogFile)
+            os.replace(tempPath, self.catalogPath)
+        except OSError as ex:
+            logging.warning(f"Could not write deck catalog {self.catalogPath}: {ex}")
+
+    def refreshEntry(self, entry: DeckCatalogEntry):
+        """
+        Recount entry's terms if its files changed since it was counted
+        and its deck revision differs. Returns True if entry changed.
+        """
+        # the deck's database files and their WALs
+        shardPaths = shardFilePaths(entry.path)
+        paths = [entry.path] + shardPaths
+        signature = fileSignature(paths + [f"{path}-wal" for path in paths])
+        if signature == entry.signature:
+            return False
+
+        # like ShardedDeckDatabase.readDeckRevision, the sum over all files
+        revisions = [
+            readFileValue(path, f"SELECT revision FROM {DECK_META_TABLE_NAME} WHERE pkey = 1;", None)
+            for path in paths
+        ]
+        revision = None if None in revisions else sum(revisions)
+        if None == revision or revision != entry.revision:
+            countSQL = f"SELECT COUNT(*) FROM {DECK_TERMS_TABLE_NAME};"
+            entry.termCount = sum([readFileValue(path, countSQL, 0) for path in paths])
+
+        entry.shardCount = len(shardPaths)
+        entry.revision = revision
+        entry.signature = signature
+        return True
+
+    def refresh(self):
+        """
+        Bring the catalog up to date with the deck files in the data dir
+        and return its entries, sorted by deck name.
+        """
+        if None == self.entries:
+            self.entries = self.readCatalogFile()
+
+        pattern = os.path.join(self.dataDir, DeckDatabase.fileNameForDeckName("*"))
+        fileNames = set([os.path.basename(path) for path in glob.glob(pattern)])
+        changed = False
+        for fileName in list(self.entries.keys()):
+            if not fileName in fileNames:
+                del self.entries[fileName]
+                changed = True
+        for fileName in fileNames:
+            entry = self.entries.get(fileName)
+            if None == entry:
+                entry = DeckCatalogEntry(
+                    deckNameForFileName(fileName), os.path.join(self.dataDir, fileName)
+                )
+                self.entries[fileName] = entry
+            try:
+                changed = self.refreshEntry(entry) or changed
+            except sqlite3.Error as ex:
+                logging.warning(f"Could not read deck {fileName}: {ex}")
+
+        if changed:
+            self.writeCatalogFile()
+        return self.getEntries()
+
+    def getEntries(self):
+        if None == self.entries:
+            return self.refresh()
+        return sorted(self.entries.values(), key=lambda entry: entry.deckName)
+
+    def getEntry(self, deckName):
+        fileName = DeckDatabase.fileNameForDeckName(deckName)
+        self.refresh()
+        return self.entries.get(fileName)
+
+
+class OpenDeck:
+    """
+    A loaded deck with its open database and the revision and term
+    version it is current with (see Controller.refreshDeck).
+    """
+
+    def __init__(self, deckName, dataFilePath, database, deck, deckRevision, termVersion):
+        self.deckName = deckName
+        self.dataFilePath = dataFilePath
+        self.database = database
+        self.deck = deck
+        self.deckRevision = deckRevision
+        self.termVersion = termVersion
+        self.estimatedBytes = estimateDeckBytes(deck)
+
+    def close(self):
+        self.database.close()
+
+
+class DeckCache:
+    """
+    Least recently used cache of OpenDecks, limited to maxDecks decks and
+    an estimated maxBytes of memory; the decks beyond either limit are
+    closed, least recently used first.
+    """
+
+    def __init__(self, maxBytes=DEFAULT_DECK_CACHE_BYTES, maxDecks=DEFAULT_DECK_CACHE_DECKS):
+        self.maxBytes = maxBytes
+        self.maxDecks = maxDecks
+        # deck name -> OpenDeck, least recently used first
+        self.openDecks = OrderedDict()
+        self.evictionCount = 0
+
+    def put(self, openDeck: OpenDeck):
+        previous = self.openDecks.pop(openDeck.deckName, None)
+        if None != previous and previous is not openDeck:
+            previous.close()
+        self.openDecks[openDeck.deckName] = openDeck
+        self.evict()
+
+    def take(self, deckName):
+        """
+        Remove and return the OpenDeck for deckName, or None.
+        """
+        return self.openDecks.pop(deckName, None)
+
+    def contains(self, deckName):
+        return deckName in self.openDecks
+
+    def deckNames(self):
+        return list(self.openDecks.keys())
+
+    def totalBytes(self):
+        return sum([openDeck.estimatedBytes for openDeck in self.openDecks.values()])
+
+    def evict(self):
+        while len(self.openDecks) > 0 and (
+            len(self.openDecks) > self.maxDecks or self.totalBytes() > self.maxBytes
+        ):
+            deckName, openDeck = self.openDecks.popitem(last=False)
+            logging.debug(f"Closing deck {deckName} ({openDeck.estimatedBytes} bytes) from deck cache")
+            openDeck.close()
+            self.evictionCount += 1
+
+    def closeAll(self):
+        for openDeck in self.openDecks.values():
+            openDeck.close()
+        self.openDecks = OrderedDict()
@@ -5,18 +5,33 @@ Created on Sun Apr  9 00:01:09 2023
 
 @author: mathaes
 """
+import copy
 import os
+from contextlib import contextmanager
 import sqlite3
+import time
 from datetime import datetime
 import logging
 
 from .deck import Deck
+from .deckprefs import (
+    DECK_PREF_DEFINITIONS,
+    defaultPrefs,
+    changedPrefs,
+    encodePrefValue,
+    decodePrefValue,
+)
+from .connectionmanager import ConnectionManager
+from .schemamigration import SchemaMigrator, DEFAULT_MIGRATION_BATCH_SIZE
 from .term import Term
 from .tag import Tag
 from .category import Category
 
 
 DECK_TERMS_TABLE_NAME = "deck_terms"
+# deck_terms with last_drill_time as the ISO-8601 UTC text it was stored
+# as before schema version 12 (epoch seconds since), for external readers
+DECK_TERMS_ISO_VIEW_NAME = "deck_terms_iso_time"
 DECK_TERMS_COLUMN_NAMES = [
     "pkey",
     "question",
@@ -27,11 +42,59 @@ DECK_TERMS_COLUMN_NAMES = [
     "last_drill_time",
     "has_paper_card"
 ]
+# the columns loaded into Terms: the above plus the row version, which
+# deck files before schema version 13 (e.g. merge sources) do not have
+DECK_TERMS_LOAD_COLUMN_NAMES = DECK_TERMS_COLUMN_NAMES + ["row_version"]
+# pkey and term version of every deleted term, for change queries
+TERM_DELETES_TABLE_NAME = "deck_term_deletes"
 
 CATEGORY_TABLE_NAME = "deck_categories"
 TAG_TABLE_NAME = "deck_tags"
 TAG_RELATION_TABLE_NAME = "deck_terms_tags_rel"
+# (ancestor, descendant, depth) for every tag and each of its ancestors,
+# including itself at depth 0
+TAG_CLOSURE_TABLE_NAME = "deck_tag_closure"
+# single-row prefs table of schema versions 1-7
 PREFS_TABLE_NAME = "deck_prefs"
+# one row per deck preference: key -> JSON value (see deckprefs)
+PREF_VALUES_TABLE_NAME = "deck_pref_values"
+# pref overrides per category and per tag: (category/tag, key) -> JSON value
+CATEGORY_PREFS_TABLE_NAME = "deck_category_prefs"
+TAG_PREFS_TABLE_NAME = "deck_tag_prefs"
+# append-only drill answers, and their per-day rollups (see reviewlog)
+REVIEW_LOG_TABLE_NAME = "review_log"
+REVIEW_DAILY_TABLE_NAME = "review_daily"
+# recall counts by bin and interval, accumulated from the review log for
+# bin tuning (see bintuning)
+REVIEW_BIN_STATS_TABLE_NAME = "review_bin_stats"
+DECK_META_TABLE_NAME = "deck_meta"
+
+# Stored in the database file via PRAGMA user_version by the schema
+# migrations in deckmigrations.py; must equal the last migration version.
+DECK_SCHEMA_VERSION = 13
+
+# rows fetched per round trip when streaming a whole table
+MERGE_FETCH_SIZE = 2000
+
+# max number of host parameters per IN (...) lookup
+PKEY_LOOKUP_CHUNK = 500
+
+# connection-local table of term pkeys for set-based bulk operations
+BULK_PKEYS_TABLE_NAME = "temp.bulk_term_pkeys"
+
+# columns bulkUpdateByCriteria may set -> Term attribute names
+BULK_EDIT_COLUMNS = {
+    "category": "category",
+    "bin": "bin",
+    "reversed_bin": "reversedBin",
+    "has_paper_card": "hasPaperCard",
+}
+
+# pref scope -> (table, scope column)
+SCOPED_PREFS_TABLES = {
+    Deck.PREFS_SCOPE_CATEGORY: (CATEGORY_PREFS_TABLE_NAME, "category"),
+    Deck.PREFS_SCOPE_TAG: (TAG_PREFS_TABLE_NAME, "tag"),
+}
 
 INSERT_DEFAULT_PREFS_SQL = f"""INSERT INTO {PREFS_TABLE_NAME} (
     drill_question_count, space_repetition_bias, reverse_drill) VALUES (
@@ -45,8 +108,23 @@ class QueryCriterion:
     ANSWER = "answer:"
     BIN = "bin:"
     REVERSEBIN = "revbin:"
+    # a term must have every required tag (tag criteria are OR'ed)
+    REQUIREDTAG = "reqtag:"
+    # the tag or any tag below it, OR'ed with tag criteria
+    TAGTREE = "tagtree:"
+    # value is an inclusive (low, high) tuple, OR'ed with bin values
+    BINRANGE = "binrange:"
+    REVERSEBINRANGE = "revbinrange:"
+    # value is a (start, end) tuple of epoch seconds, start inclusive and
+    # end exclusive, either None for an open end; OR'ed with each other.
+    # Terms never drilled match none.
+    DRILLTIME = "drilltime:"
     
-    CRITERION_TYPES = [CATEGORY, TAG, QUESTION, ANSWER, BIN, REVERSEBIN]
+    CRITERION_TYPES = [
+        CATEGORY, TAG, QUESTION, ANSWER, BIN, REVERSEBIN,
+        REQUIREDTAG, TAGTREE, BINRANGE, REVERSEBINRANGE, DRILLTIME,
+    ]
+    TAG_CRITERION_TYPES = [TAG, REQUIREDTAG, TAGTREE]
     
     def __init__(self, criterionType, value):
         if not criterionType in QueryCriterion.CRITERION_TYPES:
@@ -77,23 +155,135 @@ class QueryCriterion:
     def reversebinvalue(value):
         return QueryCriterion(QueryCriterion.REVERSEBIN, value)
 
+    def requiredtag(value):
+        return QueryCriterion(QueryCriterion.REQUIREDTAG, value)
+
+    def tagtree(value):
+        return QueryCriterion(QueryCriterion.TAGTREE, value)
+
+    def binrange(low, high):
+        return QueryCriterion(QueryCriterion.BINRANGE, (int(low), int(high)))
+
+    def reversebinrange(low, high):
+        return QueryCriterion(QueryCriterion.REVERSEBINRANGE, (int(low), int(high)))
+
+    def drilledbetween(start, end):
+        return QueryCriterion(
+            QueryCriterion.DRILLTIME,
+            (None if None == start else int(start), None if None == end else int(end)),
+        )
+
+    def notseenindays(days):
+        """
+        Terms last drilled more than days days ago (new terms, never
+        drilled, are those in bin 0).
+        """
+        return QueryCriterion.drilledbetween(None, time.time() - float(days) * 86400)
+
+    def seentoday():
+        """
+        Terms drilled since local midnight.
+        """
+        midnight = datetime.combine(datetime.now().date(), datetime.min.time())
+        return QueryCriterion.drilledbetween(midnight.timestamp(), None)
+
+
+class TermConflict:
+    """
+    A term whose row changed (or was deleted) since the term was read,
+    found when writing it. term is the caller's Term, refreshed from the
+    row unless it was deleted; localTerm a copy of it as the caller had
+    it, storedTerm the row as stored (None if deleted). isWritten tells
+    whether the caller's values were written anyway (see updateTermBins).
+    """
+
+    def __init__(self, term: Term, storedTerm: Term):
+        self.term = term
+        self.localTerm = copy.copy(term)
+        self.storedTerm = storedTerm
+        self.isWritten = False
+
+    def __repr__(self):
+        return f"TermConflict({self.localTerm}, stored {self.storedTerm}, written {self.isWritten})"
+
 
 class DeckDatabase:
     def fileNameForDeckName(deckName):
         deckToken = deckName.replace(" ", "_")
         return f"lexilogio_{deckToken}.db"
 
-    def __init__(self, dbPath):
+    def __init__(self, dbPath, enforceForeignKeys=True):
         self.dbPath = dbPath
-        self.dbConnection = None
+        # one connection per thread, see connectionmanager
+        self.connections = ConnectionManager(
+            dbPath, self.openConnection, self.configureConnection
+        )
+        # False for files whose references point into other files, as for
+        # sharded decks; otherwise deletes cascade to tag relations and
+        # deleted categories are cleared from their terms.
+        self.enforceForeignKeys = enforceForeignKeys
+        # set once the schema has been verified, until the connections close
+        self.schemaVerified = False
+        # SqlInstrumentation, or None for plain connections
+        self.instrumentation = None
 
     def getFileName(self):
         return os.path.basename(self.dbPath)
 
     def getDbConnection(self):
-        if None == self.dbConnection:
-            self.dbConnection = sqlite3.connect(self.dbPath)
-        return self.dbConnection
+        """
+        Return the calling thread's connection to the database, opening
+        it on first use.
+        """
+        return self.connections.connection()
+
+    def openConnection(self):
+        # the connection manager keeps each connection to its thread
+        if None != self.instrumentation:
+            return self.instrumentation.connect(self.dbPath, checkSameThread=False)
+        return sqlite3.connect(self.dbPath, check_same_thread=False)
+
+    def configureConnection(self, con):
+        DeckDatabase.setConnectionForeignKeys(con, self.enforceForeignKeys)
+
+    def transaction(self):
+        """
+        Context manager running its block in a write transaction on the
+        calling thread's connection, yielding a cursor:
+
+            with database.transaction() as cur:
+                cur.execute(...)
+
+        Commits at the end of the outermost block, rolls back if it
+        raises. BEGIN is retried while another connection holds the
+        write lock.
+        """
+        return self.connections.transaction()
+
+    def setConnectionForeignKeys(con, enforced):
+        # the pragma is a no-op inside a transaction
+        con.commit()
+        con.execute(f"PRAGMA foreign_keys = {'ON' if enforced else 'OFF'};")
+
+    def setForeignKeysEnforced(self, enforced):
+        DeckDatabase.setConnectionForeignKeys(self.getDbConnection(), enforced)
+
+    def setInstrumentation(self, instrumentation):
+        """
+        Record statement statistics in the given SqlInstrumentation, or
+        stop recording if it is None. The open connections are closed
+        so the next ones are opened with (or without) instrumentation.
+        """
+        self.close()
+        self.instrumentation = instrumentation
+
+    def close(self):
+        """
+        Close the connections of all threads; none may be in use. They
+        are reopened on next use.
+        """
+        self.connections.closeAll()
+        self.schemaVerified = False
 
     def loadDeck(self, deckName):
         deck = Deck(deckName)
@@ -112,34 +302,32 @@ class DeckDatabase:
         return deck
     
     def readDeckStats(self):
-        
-        COUNT_SQL = f"SELECT COUNT(*) FROM {DECK_TERMS_TABLE_NAME}"
-        BIN_AVG_SQL = f"SELECT AVG(bin) FROM {DECK_TERMS_TABLE_NAME}"
-        RBIN_AVG_SQL = f"SELECT AVG(reversed_bin) FROM {DECK_TERMS_TABLE_NAME}"
+        count, binSum, rbinSum = self.readTermAggregates()
+        return DeckDatabase.statsFromAggregates(count, binSum, rbinSum)
+
+    def readTermAggregates(self):
+        """
+        Return (term count, sum of bins, sum of reversed bins), computed
+        in a single pass over the terms table.
+        """
+        STATS_SQL = f"SELECT COUNT(*), SUM(bin), SUM(reversed_bin) FROM {DECK_TERMS_TABLE_NAME}"
         
         con = self.getDbConnection()
         cur = con.cursor()
         
-        cur.execute(COUNT_SQL, [])
-        count_result = cur.fetchone()
-        if count_result is not None and len(count_result) > 0:
-            count = int(count_result[0])
-        else:
-            count = 0
-        
-        cur.execute(BIN_AVG_SQL, [])
-        bin_avg_result = cur.fetchone()
-        if bin_avg_result[0] is not None:
-            bin_avg = float(bin_avg_result[0])
-        else:
-            bin_avg = 0
-        
-        cur.execute(RBIN_AVG_SQL, [])
-        rbin_avg_result = cur.fetchone()
-        if rbin_avg_result[0] is not None:
-            rbin_avg = float(rbin_avg_result[0])
-        else:
-            rbin_avg = 0
+        cur.execute(STATS_SQL, [])
+        stats_result = cur.fetchone()
+        if stats_result is None or stats_result[0] is None:
+            return (0, 0, 0)
+
+        return (int(stats_result[0]), int(stats_result[1] or 0), int(stats_result[2] or 0))
+
+    def statsFromAggregates(count, binSum, rbinSum):
+        bin_avg = 0
+        rbin_avg = 0
+        if count > 0:
+            bin_avg = float(binSum) / count
+            rbin_avg = float(rbinSum) / count
         
         result_d = {
             "count": count,
@@ -150,11 +338,10 @@ class DeckDatabase:
         }
         return result_d
 
-
     def queryForAllDeckTerms(self, deck: Deck):
         self.ensureDeckTablesExist(deck)
 
-        SELECT_SQL = f"SELECT * FROM {DECK_TERMS_TABLE_NAME}"
+        SELECT_SQL = f"SELECT {','.join(DECK_TERMS_LOAD_COLUMN_NAMES)} FROM {DECK_TERMS_TABLE_NAME}"
 
         con = self.getDbConnection()
         cur = con.cursor()
@@ -194,7 +381,7 @@ class DeckDatabase:
                 binWhereClauseSql += " OR bin = ?"
             binParams = binValues
 
-        columnNamesCommaStr = ",".join(DECK_TERMS_COLUMN_NAMES)
+        columnNamesCommaStr = ",".join(DECK_TERMS_LOAD_COLUMN_NAMES)
         querySQL = (
             f"SELECT {columnNamesCommaStr} FROM {DECK_TERMS_TABLE_NAME} WHERE "
         )
@@ -221,8 +408,6 @@ class DeckDatabase:
             querySQL += ")"
         querySQL += ";"
 
-        # print(f"DEBUG: query sql is \n{querySQL}")
-
         con = self.getDbConnection()
         cur = con.cursor()
         cur.execute(querySQL, queryParams)
@@ -238,17 +423,34 @@ class DeckDatabase:
         will match either. Criteria from different categores are treated
         as AND clauses. For instance if there is a category criterion and
         a tag criterion, the results will be terms that match both.
+        Bin values and bin ranges are OR'ed together, as are tags and tag
+        subtrees; required tags are each AND'ed.
+        """
+        whereClauseSQL, params, tagCriteria = DeckDatabase.compileQueryCriteria(queryCriteriaList)
+
+        results = self.queryTermsWhere(whereClauseSQL, params)
+        if len(results) == 0:
+            return []
+
+        return DeckDatabase.filterByTagCriteria(deck, results, tagCriteria)
+
+    def compileQueryCriteria(queryCriteriaList, tagsInSQL=False):
+        """
+        Compile a list of QueryCriterion into a WHERE clause (empty string
+        if there are no column criteria) and its parameter list. Unless
+        tagsInSQL, tag criteria are not part of the SQL; they are returned
+        separately for filterByTagCriteria. With tagsInSQL they become
+        pkey IN (...) subqueries on the tag relation table, which SQLite
+        drives from idx_tagrel_tag, and tagCriteria is returned empty.
+
+        Returns (whereClauseSQL, params, tagCriteria)
         """
-        columnNamesCommaStr = ",".join(DECK_TERMS_COLUMN_NAMES)
-        querySQL = (
-            f"SELECT {columnNamesCommaStr} FROM {DECK_TERMS_TABLE_NAME}"
-        )
         whereClauses = []
         whereClauseSQL = ""
         
         params = []
         
-        tagCriteria = None
+        tagCriteria = []
         
         if len(queryCriteriaList) > 0:
             
@@ -257,124 +459,151 @@ class DeckDatabase:
             answerCriteria = list(filter(lambda cr: cr.criterionType == QueryCriterion.ANSWER, queryCriteriaList))
             binCriteria = list(filter(lambda cr: cr.criterionType == QueryCriterion.BIN, queryCriteriaList))
             reverseBinCriteria = list(filter(lambda cr: cr.criterionType == QueryCriterion.REVERSEBIN, queryCriteriaList))
+            binRangeCriteria = list(filter(lambda cr: cr.criterionType == QueryCriterion.BINRANGE, queryCriteriaList))
+            reverseBinRangeCriteria = list(filter(lambda cr: cr.criterionType == QueryCriterion.REVERSEBINRANGE, queryCriteriaList))
+            drillTimeCriteria = list(filter(lambda cr: cr.criterionType == QueryCriterion.DRILLTIME, queryCriteriaList))
             
-            numWhereCriteria = len(catCriteria) + len(questionCriteria) + len(answerCriteria) + len(binCriteria) + len(reverseBinCriteria)
-            
-            tagCriteria = list(filter(lambda cr: cr.criterionType == QueryCriterion.TAG, queryCriteriaList))
+            tagCriteria = list(filter(lambda cr: cr.criterionType in QueryCriterion.TAG_CRITERION_TYPES, queryCriteriaList))
+
+            DeckDatabase.appendOrClause(
+                whereClauses, params, "category = ?",
+                [cr.value.pkey for cr in catCriteria])
+            DeckDatabase.appendOrClause(
+                whereClauses, params, "question LIKE ?",
+                [cr.value.replace('*', '%') for cr in questionCriteria])
+            DeckDatabase.appendOrClause(
+                whereClauses, params, "answer LIKE ?",
+                [cr.value.replace('*', '%') for cr in answerCriteria])
+            DeckDatabase.appendBinClause(
+                whereClauses, params, "bin", binCriteria, binRangeCriteria)
+            DeckDatabase.appendBinClause(
+                whereClauses, params, "reversed_bin", reverseBinCriteria, reverseBinRangeCriteria)
+            DeckDatabase.appendDrillTimeClause(whereClauses, params, drillTimeCriteria)
+
+            if tagsInSQL:
+                DeckDatabase.appendTagClauses(whereClauses, params, tagCriteria)
+                tagCriteria = []
 
-            if numWhereCriteria > 0:
-                whereClauseSQL = " WHERE "
-                
-            if len(catCriteria) == 1:
-                whereClauses.append("category = ?")
-                params.append(catCriteria[0].value.pkey)
-            elif len(catCriteria) > 1:
-                catClause = "("
-                for n in range(0, len(catCriteria)):
-                    catClause += "category = ?"
-                    params.append(catCriteria[n].value.pkey)
-                    if n + 1 < len(catCriteria):
-                        catClause += " OR "
-                catClause += ")"
-                whereClauses.append(catClause)
-                
-            if len(questionCriteria) == 1:
-                whereClauses.append("question LIKE ?")
-            
-                params.append(questionCriteria[0].value.replace('*', '%'))
-            elif len(questionCriteria) > 1:
-                questionClause = "("
-                for n in range(0, len(questionCriteria)):
-                    questionClause += "question LIKE ?"
-                    params.append(questionCriteria[n].value.replace('*', '%'))
-                    if n + 1 < len(questionCriteria):
-                        questionClause += " OR "
-                questionClause += ")"
-                whereClauses.append(questionClause)
-                
-            if len(answerCriteria) == 1:
-                whereClauses.append("answer LIKE ?")
-            
-                params.append(answerCriteria[0].value.replace('*', '%'))
-            elif len(answerCriteria) > 1:
-                answerClause = "("
-                for n in range(0, len(answerClause)):
-                    answerClause += "answer LIKE ?"
-                    params.append(answerCriteria[n].value.replace('*', '%'))
-                    if n + 1 < len(answerCriteria):
-                        answerClause += " OR "
-                answerClause += ")"
-                whereClauses.append(answerClause)
-                
-            if len(binCriteria) == 1:
-                whereClauses.append("bin = ?")
-                params.append(int(binCriteria[0].value))
-            elif len(binCriteria) > 1:
-                binClause = "("
-                for n in range(0, len(binCriteria)):
-                    binClause += "bin = ?"
-                    params.append(int(binCriteria[n].value))
-                    if n + 1 < len(binCriteria):
-                        binClause += " OR "
-                binClause += ")"
-                whereClauses.append(binClause)
-                
-            if len(reverseBinCriteria) == 1:
-                whereClauses.append("reversed_bin = ?")
-                params.append(int(reverseBinCriteria[0].value))
-            elif len(reverseBinCriteria) > 1:
-                revbinClause = "("
-                for n in range(0, len(reverseBinCriteria)):
-                    revbinClause += "reversed_bin = ?"
-                    params.append(int(reverseBinCriteria[n].value))
-                    if n + 1 < len(reverseBinCriteria):
-                        revbinClause += " OR "
-                revbinClause += ")"
-                whereClauses.append(revbinClause)
-            
-                
-            print(f"DEBUG: whereClauses: {whereClauses}")
-            # TODO: tags - as JOIN clause, or just post-process filtering step?
             if len(whereClauses) == 1:
-                whereClauseSQL += whereClauses[0]
-            else: 
-                for wcIndex in range(0, len(whereClauses)):
-                    whereClauseSQL += f"({whereClauses[wcIndex]})"
-                    if wcIndex + 1 < len(whereClauses):
-                        whereClauseSQL += " AND "
-                    
-        
-        if len(whereClauseSQL) > 0:
-            querySQL += whereClauseSQL
-        querySQL += ";"
-            
+                whereClauseSQL = " WHERE " + whereClauses[0]
+            elif len(whereClauses) > 1:
+                whereClauseSQL = " WHERE " + " AND ".join([f"({wc})" for wc in whereClauses])
+
+        return (whereClauseSQL, params, tagCriteria)
+
+    def appendOrClause(whereClauses: list, params: list, clauseSQL, values: list):
+        """
+        Append clauseSQL OR'ed once per value to whereClauses,
+        and the values to params.
+        """
+        if len(values) == 0:
+            return
+        if len(values) == 1:
+            whereClauses.append(clauseSQL)
+        else:
+            whereClauses.append("(" + " OR ".join([clauseSQL] * len(values)) + ")")
+        params.extend(values)
+
+    def appendBinClause(whereClauses: list, params: list, columnName, binCriteria: list, rangeCriteria: list):
+        """
+        Append the bin value and bin range criteria for columnName,
+        OR'ed together, to whereClauses.
+        """
+        clauses = []
+        for cr in binCriteria:
+            clauses.append(f"{columnName} = ?")
+            params.append(int(cr.value))
+        for cr in rangeCriteria:
+            clauses.append(f"{columnName} BETWEEN ? AND ?")
+            params.extend([int(cr.value[0]), int(cr.value[1])])
+        if len(clauses) == 1:
+            whereClauses.append(clauses[0])
+        elif len(clauses) > 1:
+            whereClauses.append("(" + " OR ".join(clauses) + ")")
+
+    def appendDrillTimeClause(whereClauses: list, params: list, drillTimeCriteria: list):
+        """
+        Append the drill time ranges, OR'ed, to whereClauses; each is a
+        range scan of idx_terms_last_drill_time.
+        """
+        clauses = []
+        for cr in drillTimeCriteria:
+            start, end = cr.value
+            rangeClauses = ["last_drill_time IS NOT NULL"]
+            if None != start:
+                rangeClauses = ["last_drill_time >= ?"]
+                params.append(start)
+            if None != end:
+                rangeClauses.append("last_drill_time < ?")
+                params.append(end)
+            clauses.append(" AND ".join(rangeClauses))
+        if len(clauses) == 1:
+            whereClauses.append(clauses[0])
+        elif len(clauses) > 1:
+            whereClauses.append("(" + " OR ".join([f"({c})" for c in clauses]) + ")")
+
+    def appendTagClauses(whereClauses: list, params: list, tagCriteria: list):
+        """
+        Append the tag criteria to whereClauses as subqueries on the tag
+        relation table: one for the OR'ed tags and tag subtrees (joined to
+        the tag closure table), one per required tag.
+        """
+        memberSQL = f"pkey IN (SELECT term FROM {TAG_RELATION_TABLE_NAME} WHERE tag "
+        anyTagPKs = [cr.value.pkey for cr in tagCriteria if cr.criterionType == QueryCriterion.TAG]
+        treeTagPKs = [cr.value.pkey for cr in tagCriteria if cr.criterionType == QueryCriterion.TAGTREE]
+        anySelects = []
+        if len(anyTagPKs) > 0:
+            anySelects.append(
+                f"SELECT term FROM {TAG_RELATION_TABLE_NAME} WHERE tag IN ({','.join(['?'] * len(anyTagPKs))})"
+            )
+            params.extend(anyTagPKs)
+        if len(treeTagPKs) > 0:
+            anySelects.append(
+                f"SELECT r.term FROM {TAG_CLOSURE_TABLE_NAME} c JOIN {TAG_RELATION_TABLE_NAME} r ON r.tag = c.descendant"
+                f" WHERE c.ancestor IN ({','.join(['?'] * len(treeTagPKs))})"
+            )
+            params.extend(treeTagPKs)
+        if len(anySelects) > 0:
+            whereClauses.append(f"pkey IN ({' UNION '.join(anySelects)})")
+        for cr in tagCriteria:
+            if cr.criterionType == QueryCriterion.REQUIREDTAG:
+                whereClauses.append(memberSQL + "= ?)")
+                params.append(cr.value.pkey)
+
+    def queryTermsWhere(self, whereClauseSQL, params):
+        """
+        Run a term SELECT with a where clause from compileQueryCriteria
+        and return the resulting Term list.
+        """
+        columnNamesCommaStr = ",".join(DECK_TERMS_LOAD_COLUMN_NAMES)
+        querySQL = (
+            f"SELECT {columnNamesCommaStr} FROM {DECK_TERMS_TABLE_NAME}{whereClauseSQL};"
+        )
+
+        logging.debug(f"queryTermsWhere: {querySQL} {params}")
+
         con = self.getDbConnection()
         cur = con.cursor()
-        
-        print(f"DEBUG - executing SQL: {querySQL}")
-        
-        termResults = None
-        if len(params) == 0:
-            cur.execute(querySQL)
-            termResults = cur.fetchall()
-        else:
-            print(f"DEBUG params:\n  {params}")
-            cur.execute(querySQL, params)
-            termResults = cur.fetchall()
+        cur.execute(querySQL, params)
+        termResults = cur.fetchall()
         if None == termResults or len(termResults) == 0:
             return []
         
-        results = DeckDatabase.queryResultsToTermArray(termResults)
-        
-        # TODO - now we filter by tags - probably more expensive than
-        #  join but less complex to implement dynamically
+        return DeckDatabase.queryResultsToTermArray(termResults)
+
+    def filterByTagCriteria(deck: Deck, results: list, tagCriteria: list):
+        # tag membership comes from the deck's per-tag term bitsets
         if tagCriteria and len(tagCriteria) > 0:
-            taggedTermPKs = []
-            for tagCriterion in tagCriteria:
-                tag = tagCriterion.value
-                taggedTerms = deck.getTermsWithTag(tag)
-                taggedTermPKs.extend(list(map(lambda t: t.pkey, taggedTerms)))
-                
+            anyTags = []
+            for cr in tagCriteria:
+                if cr.criterionType == QueryCriterion.TAG:
+                    anyTags.append(cr.value)
+                elif cr.criterionType == QueryCriterion.TAGTREE:
+                    anyTags.extend(deck.getTagSubtree(cr.value))
+            taggedTermPKs = deck.getTermPKeysMatchingTags(
+                anyTags,
+                [cr.value for cr in tagCriteria if cr.criterionType == QueryCriterion.REQUIREDTAG],
+            )
             results = list(filter(lambda tt: tt.pkey in taggedTermPKs, results))
                 
         return results
@@ -382,7 +611,7 @@ class DeckDatabase:
     def queryResultsToTermArray(results):
         terms = []
         for row in results:
-            if not len(row) == len(DECK_TERMS_COLUMN_NAMES):
+            if not len(row) in [len(DECK_TERMS_COLUMN_NAMES), len(DECK_TERMS_LOAD_COLUMN_NAMES)]:
                 raise Exception(
                     f"Unexpected row results for Term object: {row}"
                 )
@@ -396,92 +625,224 @@ class DeckDatabase:
             term.bin = int(row[4])
             term.reversedBin = int(row[5])
             term.lastDrillTime = row[6]
+            term.hasPaperCard = bool(row[7])
+            if len(row) > 8:
+                term.rowVersion = int(row[8])
 
             terms.append(term)
 
         return terms
 
+    def allocateTermVersion(cur):
+        """
+        Bump the deck's term version and return it, for the rows written
+        in cur's transaction. Rows written with an explicit row_version
+        skip the per-row version triggers.
+        """
+        cur.execute(f"UPDATE {DECK_META_TABLE_NAME} SET term_version = term_version + 1 WHERE pkey = 1;")
+        return int(
+            cur.execute(f"SELECT term_version FROM {DECK_META_TABLE_NAME} WHERE pkey = 1;").fetchone()[0]
+        )
+
+    def readStoredTerms(self, cur, pkeys: list):
+        """
+        Return a dict of pkey -> Term for the stored rows of pkeys.
+        """
+        columnNamesCommaStr = ",".join(DECK_TERMS_LOAD_COLUMN_NAMES)
+        storedTerms = {}
+        for start in range(0, len(pkeys), PKEY_LOOKUP_CHUNK):
+            chunk = pkeys[start : start + PKEY_LOOKUP_CHUNK]
+            placeholders = ", ".join(["?"] * len(chunk))
+            rows = cur.execute(
+                f"SELECT {columnNamesCommaStr} FROM {DECK_TERMS_TABLE_NAME} WHERE pkey IN ({placeholders});",
+                chunk,
+            ).fetchall()
+            for term in DeckDatabase.queryResultsToTermArray(rows):
+                storedTerms[term.pkey] = term
+        return storedTerms
+
+    def findTermConflicts(self, cur, termList: list):
+        """
+        Return a TermConflict for each term in termList with a known
+        rowVersion whose row has since been changed or deleted. Call in
+        the transaction writing the terms.
+        """
+        checkedTerms = [t for t in termList if None != t.rowVersion]
+        if len(checkedTerms) == 0:
+            return []
+        storedTerms = self.readStoredTerms(cur, [t.pkey for t in checkedTerms])
+
+        conflicts = []
+        for term in checkedTerms:
+            storedTerm = storedTerms.get(term.pkey)
+            if None == storedTerm or storedTerm.rowVersion != term.rowVersion:
+                conflicts.append(TermConflict(term, storedTerm))
+        if len(conflicts) > 0:
+            logging.info(f"{len(conflicts)} of {len(termList)} terms changed by another writer")
+        return conflicts
+
     def insertTerms(self, deck: Deck, termList: list):
         self.ensureDeckTablesExist(deck)
 
-        # Note that terms are always inserted with last_drill_time NULL.
-        # If we want to support importing terms from an active database and
-        # preserving drill time a new method will be required, esp. if we
-        # want to use last_drill_time to reconcile any conflicts.
+        # Terms are inserted with their lastDrillTime and hasPaperCard
+        # values, so terms merged in from another deck database keep their
+        # drill history (new terms simply have last_drill_time NULL).
 
-        insertSQL = f"""INSERT INTO {DECK_TERMS_TABLE_NAME} (question, answer, category, bin, reversed_bin) 
-    VALUES (?, ?, ?, ?, ?);
+        insertSQL = f"""INSERT INTO {DECK_TERMS_TABLE_NAME} (question, answer, category, bin, reversed_bin, last_drill_time, has_paper_card, row_version) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?);
 """
         
         tagRelateSQL = f"""INSERT INTO {TAG_RELATION_TABLE_NAME} (term, tag) VALUES (?, ?);"""
 
-        con = self.getDbConnection()
-        cur = con.cursor()
-        
+        with self.transaction() as cur:
+            version = DeckDatabase.allocateTermVersion(cur)
+
+            tagRows = []
+            for term in termList:
+                category_pkey = term.category
+                if type(term.category) is Category:
+                    category_pkey = term.category.pkey
+
+                termParams = [
+                    (term.question),
+                    (term.answer),
+                    (category_pkey),
+                    (term.bin),
+                    (term.reversedBin),
+                    (term.lastDrillTime),
+                    (1 if term.hasPaperCard else 0),
+                    (version),
+                ]
+
+                cur.execute(insertSQL, termParams)
+
+                term.pkey = cur.lastrowid
+                term.rowVersion = version
+                if term.tags is not None:
+                    for tag in term.tags:
+                        tagRows.append((term.pkey, tag.pkey))
+
+            cur.executemany(tagRelateSQL, tagRows)
+
+    def insertTermRows(self, rows: list):
+        """
+        Bulk insert complete term rows, including pkey and drill state.
+        Each row is a sequence of values in DECK_TERMS_COLUMN_NAMES order.
+        Returns the row version of the inserted rows.
+        """
+        columnNamesCommaStr = ",".join(DECK_TERMS_COLUMN_NAMES)
+        placeholders = ", ".join(["?"] * len(DECK_TERMS_COLUMN_NAMES))
+        insertSQL = f"INSERT INTO {DECK_TERMS_TABLE_NAME} ({columnNamesCommaStr}, row_version) VALUES ({placeholders}, ?);"
 
-        for term in termList:
-            category_pkey = term.category
-            if type(term.category) is Category:
-                category_pkey = term.category.pkey
-                
-            termParams = [
-                (term.question),
-                (term.answer),
-                (category_pkey),
-                (term.bin),
-                (term.reversedBin),
-            ]
-
-            cur.execute(insertSQL, termParams)
-            
-            term.pkey = cur.lastrowid
-            if term.tags is not None:
-                for tag in term.tags:
-                    term_tag_params = [term.pkey, tag.pkey]
-                    cur.execute(tagRelateSQL, term_tag_params)
+        with self.transaction() as cur:
+            version = DeckDatabase.allocateTermVersion(cur)
+            cur.executemany(insertSQL, [tuple(row) + (version,) for row in rows])
+        return version
 
-        con.commit()
+    @contextmanager
+    def bulkLoadTransaction(self, tableNames: list):
+        """
+        Write transaction for loading many more rows into tableNames than
+        they hold: their indexes and triggers are dropped for the block
+        and recreated at its end, so each index is built in one pass
+        instead of row by row, and the deck revision is bumped once
+        instead of per row. Rows written in the block must set their
+        row_version explicitly (see allocateTermVersion).
+        """
+        with self.transaction() as cur:
+            placeholders = ", ".join(["?"] * len(tableNames))
+            schemaRows = cur.execute(
+                f"""SELECT type, name, sql FROM sqlite_master
+WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({placeholders});""",
+                tableNames,
+            ).fetchall()
+            for schemaType, name, sql in schemaRows:
+                cur.execute(f"DROP {schemaType.upper()} {name};")
+
+            yield cur
+
+            startTime = time.perf_counter()
+            for schemaType, name, sql in schemaRows:
+                cur.execute(sql)
+            cur.execute(f"UPDATE {DECK_META_TABLE_NAME} SET revision = revision + 1;")
+            logging.debug(f"Rebuilt {len(schemaRows)} indexes and triggers in {time.perf_counter() - startTime:.3f}s")
+
+    def readMaxTermPKey(self):
+        """
+        The largest term pkey in use (0 if there are no terms), for
+        callers allocating pkeys for insertGeneratedTermRows; read it in
+        the same transaction as the insert.
+        """
+        return self.getDbConnection().execute(
+            f"SELECT COALESCE(MAX(pkey), 0) FROM {DECK_TERMS_TABLE_NAME};"
+        ).fetchone()[0]
 
-    def updateTerms(self, deck: Deck, termList: list):
+    def insertGeneratedTermRows(self, deck: Deck, rows: list, tagRows: list):
+        """
+        Bulk insert term rows with explicit pkeys (as for insertTermRows)
+        and their (term, tag) relation rows in one transaction, the fast
+        path for generated decks.
+        """
         self.ensureDeckTablesExist(deck)
+        with self.transaction() as cur:
+            self.insertTermRows(rows)
+            cur.executemany(f"INSERT INTO {TAG_RELATION_TABLE_NAME} (term, tag) VALUES (?, ?);", tagRows)
 
-        con = self.getDbConnection()
-        cur = con.cursor()
-
-        for term in termList:
-            timeSetter = ""
-        if not None == term.lastDrillTime:
-            timeSetter = ", last_drill_time = ?"
+    def updateTerms(self, deck: Deck, termList: list):
+        """
+        Write the fields of the terms in termList. A term with a known
+        rowVersion is only written if its row is unchanged since it was
+        read; otherwise the term is refreshed from the row (or left as
+        is if the row was deleted). Returns the TermConflicts for the
+        terms not written. Written terms get their new rowVersion.
+        """
+        self.ensureDeckTablesExist(deck)
 
+        # a term without lastDrillTime keeps its stored value
         updateSql = f"""UPDATE {DECK_TERMS_TABLE_NAME} 
-SET question = ?, answer = ?, category = ?, bin = ?, reversed_bin = ? {timeSetter}
+SET question = ?, answer = ?, category = ?, bin = ?, reversed_bin = ?,
+    last_drill_time = COALESCE(?, last_drill_time), has_paper_card = ?, row_version = ?
 WHERE pkey = ?;
 """
 
-        params = [
-            (term.question),
-            (term.answer),
-            (term.category),
-            (term.bin),
-            (term.reversedBin),
-        ]
-
-        if not None == term.lastDrillTime:
-            params.append((term.lastDrillTime))
-
-        params.append((term.pkey))
-
-        cur.execute(updateSql, params)
-
-        con.commit()
+        with self.transaction() as cur:
+            conflicts = self.findTermConflicts(cur, termList)
+            conflictedTerms = set([id(c.term) for c in conflicts])
+            writeTerms = [t for t in termList if not id(t) in conflictedTerms]
+            if len(writeTerms) > 0:
+                version = DeckDatabase.allocateTermVersion(cur)
+                params = [
+                    (
+                        term.question,
+                        term.answer,
+                        term.category,
+                        term.bin,
+                        term.reversedBin,
+                        term.lastDrillTime,
+                        1 if term.hasPaperCard else 0,
+                        version,
+                        term.pkey,
+                    )
+                    for term in writeTerms
+                ]
+                cur.executemany(updateSql, params)
+
+        for term in writeTerms:
+            term.rowVersion = version
+        for conflict in conflicts:
+            if None != conflict.storedTerm:
+                conflict.term.copyStoredFields(conflict.storedTerm)
+        return conflicts
         
     def udpateTermCategory(self, deck: Deck, catpk, termpk):
-        con = self.getDbConnection()
-        cur = con.cursor()
-        updateSQL = f"UPDATE {DECK_TERMS_TABLE_NAME} SET category = ? WHERE pkey = ?;"
-        params = [(catpk), (termpk),]
-        cur.execute(updateSQL, params)
-        con.commit()
+        """
+        Set the category of a term; returns its new row version.
+        """
+        updateSQL = f"UPDATE {DECK_TERMS_TABLE_NAME} SET category = ?, row_version = ? WHERE pkey = ?;"
+        with self.transaction() as cur:
+            version = DeckDatabase.allocateTermVersion(cur)
+            cur.execute(updateSQL, [(catpk), (version), (termpk),])
+        return version
 
     def deleteTerm(self, deck: Deck, term: Term):
         self.ensureDeckTablesExist(deck)
@@ -489,51 +850,142 @@ WHERE pkey = ?;
         con = self.getDbConnection()
         cur = con.cursor()
         
+        # tag relations are removed by ON DELETE CASCADE
         deleteSql = f"DELETE from {DECK_TERMS_TABLE_NAME} WHERE pkey = ?;"
         params = [(term.pkey),]
         cur.execute(deleteSql, params)
         con.commit()
         
+    def deleteTermsByPKeys(self, deck: Deck, pkeys: list):
+        """
+        Delete a set of terms, and (by cascade) their tag relations, in
+        one transaction.
+        """
+        self.ensureDeckTablesExist(deck)
+
+        params = [(pk,) for pk in pkeys]
+        con = self.getDbConnection()
+        con.executemany(f"DELETE FROM {DECK_TERMS_TABLE_NAME} WHERE pkey = ?;", params)
+        con.commit()
+
+    def iterTermRowsByQuestion(self, fetchSize=MERGE_FETCH_SIZE):
+        """
+        Stream all term rows (in DECK_TERMS_COLUMN_NAMES order) sorted by
+        question, then pkey, without loading the whole table.
+        """
+        columnNamesCommaStr = ",".join(DECK_TERMS_COLUMN_NAMES)
+        cur = self.getDbConnection().cursor()
+        cur.execute(
+            f"SELECT {columnNamesCommaStr} FROM {DECK_TERMS_TABLE_NAME} ORDER BY question, pkey;"
+        )
+        while True:
+            rows = cur.fetchmany(fetchSize)
+            if len(rows) == 0:
+                break
+            yield from rows
+
     def updateTermBins(
         self, deck: Deck, termList: list, isReversedDrill=False
     ):
+        """
+        Write the bin (or reversed bin) and drill time of the terms in
+        termList. If a term's row changed since it was read, the later
+        drill wins: the term's bin is written over the row (and its other
+        fields refreshed from it) if it was drilled after the stored
+        drill time, otherwise the term is refreshed from the row. Rows
+        deleted meanwhile are skipped. Returns the TermConflicts.
+        """
         self.ensureDeckTablesExist(deck)
 
-        UPDATE_BIN_SQL = f"UPDATE {DECK_TERMS_TABLE_NAME} SET bin = ?, last_drill_time = ? WHERE pkey = ?;"
+        UPDATE_BIN_SQL = f"UPDATE {DECK_TERMS_TABLE_NAME} SET bin = ?, last_drill_time = ?, row_version = ? WHERE pkey = ?;"
 
         UPDATE_REVERSED_BIN_SQL = f"""UPDATE {DECK_TERMS_TABLE_NAME} 
-SET reversed_bin = ?, last_drill_time = ? WHERE pkey = ?;"""
+SET reversed_bin = ?, last_drill_time = ?, row_version = ? WHERE pkey = ?;"""
 
         updateSql = UPDATE_BIN_SQL
         if isReversedDrill:
             updateSql = UPDATE_REVERSED_BIN_SQL
 
-        currentTime = datetime.utcnow().isoformat()
-
-        con = self.getDbConnection()
-        cur = con.cursor()
-
-        params = None
-
+        currentTime = int(time.time())
         for term in termList:
-            if isReversedDrill:
-                params = [(term.reversedBin)]
-            else:
-                params = [(term.bin)]
-
             if term.lastDrillTime == None:
                 term.lastDrillTime = currentTime
 
-            params.append((term.lastDrillTime))
+        with self.transaction() as cur:
+            conflicts = self.findTermConflicts(cur, termList)
+            skippedTerms = set()
+            for conflict in conflicts:
+                storedTerm = conflict.storedTerm
+                if None == storedTerm or (
+                    None != storedTerm.lastDrillTime
+                    and storedTerm.lastDrillTime > conflict.term.lastDrillTime
+                ):
+                    skippedTerms.add(id(conflict.term))
+                else:
+                    conflict.isWritten = True
+
+            writeTerms = [t for t in termList if not id(t) in skippedTerms]
+            if len(writeTerms) > 0:
+                version = DeckDatabase.allocateTermVersion(cur)
+                params = []
+                for term in writeTerms:
+                    binValue = term.reversedBin if isReversedDrill else term.bin
+                    params.append((binValue, term.lastDrillTime, version, term.pkey))
+
+                logging.debug(f"updateTermBins: updating {len(params)} terms")
+                cur.executemany(updateSql, params)
+
+        for conflict in conflicts:
+            if None == conflict.storedTerm:
+                continue
+            term = conflict.term
+            binValue = term.reversedBin if isReversedDrill else term.bin
+            drillTime = term.lastDrillTime
+            term.copyStoredFields(conflict.storedTerm)
+            if conflict.isWritten:
+                if isReversedDrill:
+                    term.reversedBin = binValue
+                else:
+                    term.bin = binValue
+                term.lastDrillTime = drillTime
+        for term in writeTerms:
+            term.rowVersion = version
+        return conflicts
+
+    def appendReviewLog(self, deck: Deck, records: list):
+        """
+        Append ReviewRecords (see reviewlog) to the review log and add
+        them to the daily rollups, in one transaction.
+        """
+        from lexilogio.reviewlog import rollupIncrements
 
-            params.append((term.pkey))
+        if len(records) == 0:
+            return
+        self.ensureDeckTablesExist(deck)
 
-            logging.debug(
-                f"executing updateSql {updateSql} with params {params}"
+        with self.transaction() as cur:
+            cur.executemany(
+                f"""INSERT INTO {REVIEW_LOG_TABLE_NAME}
+    (term, category, review_time, rating, reversed, response_ms, previous_bin, interval_seconds)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?);""",
+                [
+                    (r.termPK, r.category, r.reviewTime, r.rating, 1 if r.isReversed else 0,
+                     r.responseMs, r.previousBin, r.intervalSeconds())
+                    for r in records
+                ],
+            )
+            cur.executemany(
+                f"""INSERT INTO {REVIEW_DAILY_TABLE_NAME}
+    (day, category, reversed, interval_bucket, review_count, recalled_count,
+     response_ms_total, response_count)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(day, category, reversed, interval_bucket) DO UPDATE SET
+    review_count = review_count + excluded.review_count,
+    recalled_count = recalled_count + excluded.recalled_count,
+    response_ms_total = response_ms_total + excluded.response_ms_total,
+    response_count = response_count + excluded.response_count;""",
+                rollupIncrements(records),
             )
-            cur.execute(updateSql, params)
-
-        con.commit()
 
     def getDeckCategories(self, deck: Deck):
         self.ensureDeckTablesExist(deck)
@@ -579,34 +1031,26 @@ SET reversed_bin = ?, last_drill_time = ? WHERE pkey = ?;"""
     def deleteDeckCategory(self, deck: Deck, category):
         self.ensureDeckTablesExist(deck)
 
-        # first clear the category from any assigned entries
-        updateSQL = f"UPDATE {CATEGORY_TABLE_NAME} SET category = NULL WHERE category = ?;"
-        deleteSql = f"DELETE FROM {CATEGORY_TABLE_NAME} WHERE category = ?;"
+        # terms in the category are cleared by ON DELETE SET NULL
+        deleteSql = f"DELETE FROM {CATEGORY_TABLE_NAME} WHERE pkey = ?;"
 
         con = self.getDbConnection()
         cur = con.cursor()
 
-        cur.execute(
-            updateSQL,
-            [
-                (category),
-            ],
-        )
         cur.execute(
             deleteSql,
             [
-                (category),
+                (category.pkey),
             ],
         )
         con.commit()
 
-        if category in deck.categories:
-            deck.categories.remove(category)
+        deck.removeCategory(category)
 
     def getDeckTags(self, deck: Deck):
         self.ensureDeckTablesExist(deck)
 
-        querySql = f"SELECT pkey, tag FROM {TAG_TABLE_NAME};"
+        querySql = f"SELECT pkey, tag, parent FROM {TAG_TABLE_NAME};"
 
         con = self.getDbConnection()
         cur = con.cursor()
@@ -618,7 +1062,7 @@ SET reversed_bin = ?, last_drill_time = ? WHERE pkey = ?;"""
         for tagRow in rows:
             tagPK = int(tagRow[0])
             tagName = str(tagRow[1])
-            tag = Tag(name=tagName, pkey=tagPK)
+            tag = Tag(name=tagName, pkey=tagPK, parent=tagRow[2])
             tags.append(tag)
 
         return tags
@@ -657,8 +1101,9 @@ SET reversed_bin = ?, last_drill_time = ? WHERE pkey = ?;"""
                 "applyTagToTerm needs objects with database primary keys set."
             )
 
+        # the unique (term, tag) index makes re-applying a tag a no-op
         insertSQL = (
-            f"INSERT INTO {TAG_RELATION_TABLE_NAME} (term, tag) VALUES (?, ?);"
+            f"INSERT OR IGNORE INTO {TAG_RELATION_TABLE_NAME} (term, tag) VALUES (?, ?);"
         )
         params = [
             (term.pkey),
@@ -671,15 +1116,7 @@ SET reversed_bin = ?, last_drill_time = ? WHERE pkey = ?;"""
         cur.execute(insertSQL, params)
         con.commit()
 
-        if term.pkey in deck.termToTags:
-            deck.termToTags[term.pkey].append(tag.pkey)
-        else:
-            deck.termToTags[term.pkey] = [tag.pkey]
-
-        if tag.pkey in deck.tagToTerms:
-            deck.tagToTerms[tag.pkey].append(term.pkey)
-        else:
-            deck.tagToTerms[tag.pkey] = [term.pkey]
+        deck.addTagRelations(tag.pkey, [term.pkey])
 
     def removeTagFromTerm(self, deck: Deck, tag: Tag, term: Term):
         deleteSQL = f"DELETE FROM {TAG_RELATION_TABLE_NAME} WHERE (term = ? AND tag = ?);"
@@ -689,6 +1126,8 @@ SET reversed_bin = ?, last_drill_time = ? WHERE pkey = ?;"""
 
         cur.execute(deleteSQL, params)
         con.commit()
+
+        deck.removeTagRelations(tag.pkey, [term.pkey])
         
     def clearTagFromAllTerms(self, deck: Deck, tag: Tag):
         clearSQL = f"DELETE FROM {TAG_RELATION_TABLE_NAME} WHERE (tag=?);"
@@ -698,21 +1137,250 @@ SET reversed_bin = ?, last_drill_time = ? WHERE pkey = ?;"""
 
         cur.execute(clearSQL, params)
         con.commit()
-        
-    def insertDeckTag(self, deck: Deck, tag_name):
+
+        deck.removeTagRelations(tag.pkey)
+
+    # -------------------------------------- bulk (set-based) operations
+
+    def termKeyTableName(self):
+        """
+        The table listing every term pkey in this database file, for
+        joins against tag relations.
+        """
+        return DECK_TERMS_TABLE_NAME
+
+    def clearBulkPKeys(self, cur):
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {BULK_PKEYS_TABLE_NAME} (pkey INTEGER PRIMARY KEY);")
+        cur.execute(f"DELETE FROM {BULK_PKEYS_TABLE_NAME};")
+
+    def loadBulkPKeys(self, cur, pkeys):
+        """
+        Fill the connection's temporary bulk pkey table with pkeys, for
+        use in set-based statements.
+        """
+        self.clearBulkPKeys(cur)
+        cur.executemany(
+            f"INSERT OR IGNORE INTO {BULK_PKEYS_TABLE_NAME} (pkey) VALUES (?);",
+            [(pk,) for pk in pkeys],
+        )
+
+    def applyTagToTermPKeys(self, deck: Deck, tag: Tag, pkeys: list):
+        """
+        Apply tag to every term in pkeys with a single INSERT ... SELECT;
+        terms that already have the tag are skipped by the unique index,
+        and pkeys of terms that do not exist are ignored. Returns the
+        number of terms newly tagged.
+        """
         self.ensureDeckTablesExist(deck)
+        if len(pkeys) == 0:
+            return 0
 
-        newTag = Tag(name=tag_name)
+        joinSQL = f"FROM {BULK_PKEYS_TABLE_NAME} b JOIN {self.termKeyTableName()} t ON t.pkey = b.pkey"
+        con = self.getDbConnection()
+        cur = con.cursor()
+        self.loadBulkPKeys(cur, pkeys)
+        cur.execute(f"""INSERT OR IGNORE INTO {TAG_RELATION_TABLE_NAME} (term, tag)
+SELECT b.pkey, ? {joinSQL};""", [tag.pkey])
+        taggedCount = cur.rowcount
+        # read in the same transaction, so this matches what was tagged
+        taggedPKs = [row[0] for row in cur.execute(f"SELECT b.pkey {joinSQL};").fetchall()]
+        con.commit()
 
-        querySql = f"INSERT INTO {TAG_TABLE_NAME} (tag) VALUES (?);"
+        deck.addTagRelations(tag.pkey, taggedPKs)
+        return taggedCount
+
+    def removeTagFromTermPKeys(self, deck: Deck, tag: Tag, pkeys: list):
+        """
+        Remove tag from every term in pkeys with a single DELETE.
+        Returns the number of terms untagged.
+        """
+        self.ensureDeckTablesExist(deck)
+        if len(pkeys) == 0:
+            return 0
 
         con = self.getDbConnection()
         cur = con.cursor()
+        self.loadBulkPKeys(cur, pkeys)
+        cur.execute(f"""DELETE FROM {TAG_RELATION_TABLE_NAME}
+WHERE tag = ? AND term IN (SELECT pkey FROM {BULK_PKEYS_TABLE_NAME});""", [tag.pkey])
+        untaggedCount = cur.rowcount
+        con.commit()
+
+        deck.removeTagRelations(tag.pkey, pkeys)
+        return untaggedCount
 
-        cur.execute(querySql, [tag_name])
+    def selectBulkPKeysByCriteria(self, cur, deck: Deck, queryCriteriaList):
+        """
+        Fill the bulk pkey table with the pkeys of the terms matching
+        queryCriteriaList.
+        """
+        whereClauseSQL, params, tagCriteria = DeckDatabase.compileQueryCriteria(
+            queryCriteriaList, tagsInSQL=True
+        )
+        self.clearBulkPKeys(cur)
+        cur.execute(
+            f"INSERT INTO {BULK_PKEYS_TABLE_NAME} (pkey) SELECT pkey FROM {DECK_TERMS_TABLE_NAME}{whereClauseSQL};",
+            params,
+        )
+
+    def bulkUpdateByCriteria(self, deck: Deck, queryCriteriaList, columnValues: dict):
+        """
+        Set the given columns (column name -> value, see BULK_EDIT_COLUMNS)
+        on every term matching queryCriteriaList, with one UPDATE in one
+        transaction, and on the matching Term objects in the deck.
+        Returns the number of terms updated.
+        """
+        self.ensureDeckTablesExist(deck)
+        for column in columnValues:
+            if not column in BULK_EDIT_COLUMNS:
+                raise Exception(f"Column {column} cannot be bulk edited.")
+
+        assignmentSQL = ", ".join([f"{column} = ?" for column in columnValues])
+
+        with self.transaction() as cur:
+            self.selectBulkPKeysByCriteria(cur, deck, queryCriteriaList)
+            version = DeckDatabase.allocateTermVersion(cur)
+            cur.execute(
+                f"UPDATE {DECK_TERMS_TABLE_NAME} SET {assignmentSQL}, row_version = ? WHERE pkey IN (SELECT pkey FROM {BULK_PKEYS_TABLE_NAME});",
+                list(columnValues.values()) + [version],
+            )
+            updatedCount = cur.rowcount
+            pkeys = [row[0] for row in cur.execute(f"SELECT pkey FROM {BULK_PKEYS_TABLE_NAME};").fetchall()]
+
+        attributeValues = {BULK_EDIT_COLUMNS[column]: value for column, value in columnValues.items()}
+        attributeValues["rowVersion"] = version
+        deck.updateTermAttributes(pkeys, attributeValues)
+        return updatedCount
+
+    def recategorizeByCriteria(self, deck: Deck, queryCriteriaList, category: Category):
+        catPK = None if None == category else category.pkey
+        return self.bulkUpdateByCriteria(deck, queryCriteriaList, {"category": catPK})
+
+    def resetBinsByCriteria(self, deck: Deck, queryCriteriaList, resetBin=True, resetReversedBin=True):
+        columnValues = {}
+        if resetBin:
+            columnValues["bin"] = 0
+        if resetReversedBin:
+            columnValues["reversed_bin"] = 0
+        if len(columnValues) == 0:
+            return 0
+        return self.bulkUpdateByCriteria(deck, queryCriteriaList, columnValues)
+
+    def setPaperCardByCriteria(self, deck: Deck, queryCriteriaList, hasPaperCard: bool):
+        # a bool binds as 1/0 and keeps the deck's Term flags boolean
+        return self.bulkUpdateByCriteria(
+            deck, queryCriteriaList, {"has_paper_card": bool(hasPaperCard)}
+        )
+
+    def deleteByCriteria(self, deck: Deck, queryCriteriaList):
+        """
+        Delete every term matching queryCriteriaList (and by cascade their
+        tag relations) with one DELETE, and remove them from the deck.
+        Returns the number of terms deleted.
+        """
+        self.ensureDeckTablesExist(deck)
+
+        with self.transaction() as cur:
+            self.selectBulkPKeysByCriteria(cur, deck, queryCriteriaList)
+            cur.execute(
+                f"DELETE FROM {DECK_TERMS_TABLE_NAME} WHERE pkey IN (SELECT pkey FROM {BULK_PKEYS_TABLE_NAME});"
+            )
+            deletedCount = cur.rowcount
+            pkeys = [row[0] for row in cur.execute(f"SELECT pkey FROM {BULK_PKEYS_TABLE_NAME};").fetchall()]
+
+        deck.removeTermsByPKeys(pkeys)
+        return deletedCount
+
+    def queryTermPKeysByCriteria(self, deck: Deck, queryCriteriaList):
+        """
+        Return the pkeys of the terms matching queryCriteriaList, in pkey
+        order, with a single indexed query (tag criteria included).
+        """
+        whereClauseSQL, params, tagCriteria = DeckDatabase.compileQueryCriteria(
+            queryCriteriaList, tagsInSQL=True
+        )
+        return [
+            row[0]
+            for row in self.getDbConnection().execute(
+                f"SELECT pkey FROM {DECK_TERMS_TABLE_NAME}{whereClauseSQL} ORDER BY pkey;", params
+            )
+        ]
+
+    def applyTagByCriteria(self, deck: Deck, tag: Tag, queryCriteriaList):
+        """
+        Apply tag to every term matching queryCriteriaList with a single
+        INSERT ... SELECT. Returns the number of terms newly tagged.
+        """
+        self.ensureDeckTablesExist(deck)
+        whereClauseSQL, params, tagCriteria = DeckDatabase.compileQueryCriteria(queryCriteriaList)
+        if len(tagCriteria) > 0:
+            # the criteria may involve the tag being applied, so resolve
+            # the matching pkeys before changing it
+            return self.applyTagToTermPKeys(
+                deck, tag, self.queryTermPKeysByCriteria(deck, queryCriteriaList)
+            )
+
+        con = self.getDbConnection()
+        cur = con.cursor()
+        cur.execute(f"""INSERT OR IGNORE INTO {TAG_RELATION_TABLE_NAME} (term, tag)
+SELECT pkey, ? FROM {DECK_TERMS_TABLE_NAME}{whereClauseSQL};""", [tag.pkey] + params)
+        taggedCount = cur.rowcount
+        # read in the same transaction, so this matches what was tagged
+        pkeys = [row[0] for row in cur.execute(
+            f"SELECT pkey FROM {DECK_TERMS_TABLE_NAME}{whereClauseSQL};", params
+        ).fetchall()]
+        con.commit()
+
+        deck.addTagRelations(tag.pkey, pkeys)
+        return taggedCount
+
+    def removeTagByCriteria(self, deck: Deck, tag: Tag, queryCriteriaList):
+        """
+        Remove tag from every term matching queryCriteriaList with a
+        single DELETE. Returns the number of terms untagged.
+        """
+        self.ensureDeckTablesExist(deck)
+        whereClauseSQL, params, tagCriteria = DeckDatabase.compileQueryCriteria(queryCriteriaList)
+        if len(tagCriteria) > 0:
+            return self.removeTagFromTermPKeys(
+                deck, tag, self.queryTermPKeysByCriteria(deck, queryCriteriaList)
+            )
+
+        con = self.getDbConnection()
+        cur = con.cursor()
+        cur.execute(f"""DELETE FROM {TAG_RELATION_TABLE_NAME} WHERE tag = ? AND term IN (
+    SELECT pkey FROM {DECK_TERMS_TABLE_NAME}{whereClauseSQL});""", [tag.pkey] + params)
+        untaggedCount = cur.rowcount
+        pkeys = [row[0] for row in cur.execute(
+            f"SELECT pkey FROM {DECK_TERMS_TABLE_NAME}{whereClauseSQL};", params
+        ).fetchall()]
+        con.commit()
+
+        deck.removeTagRelations(tag.pkey, pkeys)
+        return untaggedCount
+
+
+    def insertDeckTag(self, deck: Deck, tag_name, parent: Tag = None):
+        self.ensureDeckTablesExist(deck)
+
+        parentPK = None if None == parent else parent.pkey
+        newTag = Tag(name=tag_name, parent=parentPK)
+
+        querySql = f"INSERT INTO {TAG_TABLE_NAME} (tag, parent) VALUES (?, ?);"
+
+        con = self.getDbConnection()
+        cur = con.cursor()
+
+        cur.execute(querySql, [tag_name, parentPK])
 
         newTag.pkey = int(cur.lastrowid)
 
+        # the new tag is below each of its parent's ancestors (and the
+        # parent itself) and its own ancestor at depth 0
+        cur.execute(f"""INSERT INTO {TAG_CLOSURE_TABLE_NAME} (ancestor, descendant, depth)
+SELECT ancestor, ?, depth + 1 FROM {TAG_CLOSURE_TABLE_NAME} WHERE descendant = ?
+UNION ALL SELECT ?, ?, 0;""", [newTag.pkey, parentPK, newTag.pkey, newTag.pkey])
+
         con.commit()
 
         deck.tags.append(newTag)
@@ -731,184 +1399,329 @@ SET reversed_bin = ?, last_drill_time = ? WHERE pkey = ?;"""
         )
         deleteTagSQL = f"DELETE FROM {TAG_TABLE_NAME} WHERE pkey = ?;"
 
-        con = self.getDbConnection()
-        cur = con.cursor()
-
-        cur.execute(deleteTagRelationSQL, [tag.pkey])
-        cur.execute(deleteTagSQL, [tag.pkey])
-        con.commit()
+        with self.transaction() as cur:
+            # child tags move up to the deleted tag's parent
+            parentRow = cur.execute(
+                f"SELECT parent FROM {TAG_TABLE_NAME} WHERE pkey = ?;", [tag.pkey]
+            ).fetchone()
+            parentPK = None if None == parentRow else parentRow[0]
+            childPKs = [row[0] for row in cur.execute(
+                f"SELECT pkey FROM {TAG_TABLE_NAME} WHERE parent = ?;", [tag.pkey]
+            ).fetchall()]
+            for childPK in childPKs:
+                self.moveTagSubtree(cur, childPK, parentPK)
+
+            cur.execute(
+                f"DELETE FROM {TAG_CLOSURE_TABLE_NAME} WHERE ancestor = ? OR descendant = ?;",
+                [tag.pkey, tag.pkey],
+            )
+            cur.execute(deleteTagRelationSQL, [tag.pkey])
+            cur.execute(f"DELETE FROM {TAG_PREFS_TABLE_NAME} WHERE tag = ?;", [tag.pkey])
+            cur.execute(deleteTagSQL, [tag.pkey])
 
-        # note, caller should reload deck
+        deck.removeTag(tag, childPKs, parentPK)
 
-    def readDeckPreferences(self, deck: Deck):
+    def moveTagSubtree(self, cur, tagPK, newParentPK):
+        """
+        Make newParentPK (None for top level) the parent of tag tagPK,
+        updating the closure rows of the tag's whole subtree: the links
+        from the subtree to its old ancestors are deleted and the links
+        to the new parent's ancestors added, so the work is proportional
+        to subtree size x depth rather than to the number of tags.
+        """
+        cur.execute(f"""DELETE FROM {TAG_CLOSURE_TABLE_NAME}
+WHERE descendant IN (SELECT descendant FROM {TAG_CLOSURE_TABLE_NAME} WHERE ancestor = ?)
+AND ancestor NOT IN (SELECT descendant FROM {TAG_CLOSURE_TABLE_NAME} WHERE ancestor = ?);""",
+            [tagPK, tagPK])
+        if None != newParentPK:
+            cur.execute(f"""INSERT INTO {TAG_CLOSURE_TABLE_NAME} (ancestor, descendant, depth)
+SELECT above.ancestor, below.descendant, above.depth + below.depth + 1
+FROM {TAG_CLOSURE_TABLE_NAME} above, {TAG_CLOSURE_TABLE_NAME} below
+WHERE above.descendant = ? AND below.ancestor = ?;""", [newParentPK, tagPK])
+        cur.execute(f"UPDATE {TAG_TABLE_NAME} SET parent = ? WHERE pkey = ?;", [newParentPK, tagPK])
+
+    def moveDeckTag(self, deck: Deck, tag: Tag, newParent: Tag = None):
+        """
+        Move tag (with the tags below it) under newParent, or to the top
+        level if newParent is None.
+        """
         self.ensureDeckTablesExist(deck)
 
-        READ_SQL = f"""SELECT 
-        bin0_weight,
-        bin1_weight,
-        bin2_weight,
-        bin3_weight,
-        bin4_weight,
-        bin5_weight,
-        drill_question_count, 
-        space_repetition_bias, 
-        reverse_drill
-        FROM {PREFS_TABLE_NAME};
+        newParentPK = None if None == newParent else newParent.pkey
+        with self.transaction() as cur:
+            if None != newParentPK:
+                cycleRow = cur.execute(
+                    f"SELECT 1 FROM {TAG_CLOSURE_TABLE_NAME} WHERE ancestor = ? AND descendant = ?;",
+                    [tag.pkey, newParentPK],
+                ).fetchone()
+                if None != cycleRow:
+                    raise Exception(f"Cannot move tag {tag.name} below itself.")
+            self.moveTagSubtree(cur, tag.pkey, newParentPK)
+
+        tag.parent = newParentPK
+        deckTag = deck.getTagByPK(tag.pkey)
+        if None != deckTag:
+            deckTag.parent = newParentPK
+        deck.invalidateResolvedPrefs()
+
+    def getTagSubtreePKeys(self, deck: Deck, tag: Tag):
+        """
+        Return the pkeys of tag and every tag below it.
         """
+        self.ensureDeckTablesExist(deck)
+        return [row[0] for row in self.getDbConnection().execute(
+            f"SELECT descendant FROM {TAG_CLOSURE_TABLE_NAME} WHERE ancestor = ?;", [tag.pkey]
+        )]
 
+    def readDeckPreferences(self, deck: Deck):
+        """
+        Read the deck preferences into deck.prefs and the category and
+        tag overrides into deck.scopedPrefs (which then serve as their
+        cache). Preferences without a stored value get their default;
+        nothing is written.
+        """
+        self.ensureDeckTablesExist(deck)
         con = self.getDbConnection()
-        cur = con.cursor()
 
-        resultRow = cur.execute(READ_SQL).fetchone()
-        if None == resultRow:
-            # write default prefs
-            cur.execute(INSERT_DEFAULT_PREFS_SQL)
-            con.commit()
-            cur = con.cursor()
-            resultRow = cur.execute(READ_SQL).fetchone()
-
-        binDist = {}
-        for n in range(0, 6):
-            binDist[n] = float(resultRow[n])
-        qCount = resultRow[6]
-        # print (f"DEBUG: qCount = {qCount}")
-        useSR = resultRow[7]
-        # print (f"DEBUG: useSR = {useSR}")
-        reversedDrill = resultRow[8]
-
-        deck.prefs = {
-            Deck.PREFSKEY_QUESTION_COUNT: int(qCount),
-            Deck.PREFSKEY_SPACED_REPETITION: int(useSR) != 0,
-            Deck.PREFSKEY_REVERSED_DRILL: int(reversedDrill) != 0,
-            Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION: binDist,
-        }
+        prefs = defaultPrefs()
+        for key, text in con.execute(f"SELECT key, value FROM {PREF_VALUES_TABLE_NAME};"):
+            if key in DECK_PREF_DEFINITIONS:
+                prefs[key] = decodePrefValue(key, text)
+            else:
+                logging.warning(f"Ignoring unknown deck preference {key}")
+
+        scopedPrefs = {}
+        for scope, (tableName, scopeColumn) in SCOPED_PREFS_TABLES.items():
+            for scopePK, key, text in con.execute(
+                f"SELECT {scopeColumn}, key, value FROM {tableName};"
+            ):
+                if key in DECK_PREF_DEFINITIONS:
+                    scopedPrefs.setdefault((scope, scopePK), {})[key] = decodePrefValue(key, text)
+                else:
+                    logging.warning(f"Ignoring unknown deck preference {key} ({scope} {scopePK})")
+
+        deck.prefs = prefs
+        deck.scopedPrefs = scopedPrefs
+        deck.invalidateResolvedPrefs()
         return deck.prefs
 
-    def writeDeckPreferences(self, deck: Deck):
+    def updateDeckPreferences(self, deck: Deck, newPrefs: dict):
+        """
+        Write the entries of newPrefs that differ from deck.prefs, in one
+        transaction, and update deck.prefs. Returns the changed entries.
+        """
+        changes = changedPrefs(deck.prefs, newPrefs)
+        if len(changes) > 0:
+            self.writePrefValues(deck, changes)
+            deck.prefs.update(changes)
+            deck.invalidateResolvedPrefs()
+        return changes
+
+    def updateScopedPreferences(self, deck: Deck, scope, scopePK, newPrefs: dict):
+        """
+        Set the overrides of the category or tag scopePK (scope is
+        Deck.PREFS_SCOPE_CATEGORY or PREFS_SCOPE_TAG) in one transaction,
+        writing only the changed ones; a value of None removes the
+        override. Returns the changed entries (None for removed ones).
+        """
+        if not scope in SCOPED_PREFS_TABLES:
+            raise Exception(f"Unsupported pref scope: {scope}")
+        tableName, scopeColumn = SCOPED_PREFS_TABLES[scope]
+        overrides = deck.getScopedPrefs(scope, scopePK)
+        changes = changedPrefs(overrides, {k: v for k, v in newPrefs.items() if None != v})
+        for key, value in newPrefs.items():
+            if None == value and key in overrides:
+                changes[key] = None
+        if len(changes) == 0:
+            return changes
         self.ensureDeckTablesExist(deck)
 
-        qCount = deck.prefs[Deck.PREFSKEY_QUESTION_COUNT]
-        useSR = deck.prefs[Deck.PREFSKEY_SPACED_REPETITION]
-        useSRintValue = 1
-        if not useSR:
-            useSRintValue = 0
-        reversedDrill = deck.prefs[Deck.PREFSKEY_REVERSED_DRILL]
-        reversedDrillIntValue = 0
-        if reversedDrill:
-            reversedDrillIntValue = 1
+        with self.transaction() as cur:
+            cur.executemany(
+                f"""INSERT INTO {tableName} ({scopeColumn}, key, value) VALUES (?, ?, ?)
+ON CONFLICT({scopeColumn}, key) DO UPDATE SET value = excluded.value;""",
+                [
+                    (scopePK, key, encodePrefValue(key, value))
+                    for key, value in changes.items()
+                    if None != value
+                ],
+            )
+            cur.executemany(
+                f"DELETE FROM {tableName} WHERE {scopeColumn} = ? AND key = ?;",
+                [(scopePK, key) for key, value in changes.items() if None == value],
+            )
 
-        binDist = deck.prefs[Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION]
+        overrides = dict(overrides)
+        for key, value in changes.items():
+            if None == value:
+                del overrides[key]
+            else:
+                overrides[key] = value
+        if len(overrides) > 0:
+            deck.scopedPrefs[(scope, scopePK)] = overrides
+        else:
+            deck.scopedPrefs.pop((scope, scopePK), None)
+        deck.invalidateResolvedPrefs()
+        return changes
 
-        DELETE_OLD_ENTRY_SQL = f"DELETE FROM {PREFS_TABLE_NAME};"
+    def writeDeckPreferences(self, deck: Deck):
+        """
+        Write every preference in deck.prefs.
+        """
+        self.writePrefValues(deck, deck.prefs)
 
-        con = self.getDbConnection()
-        cur = con.cursor()
-        cur.execute(DELETE_OLD_ENTRY_SQL)
-        con.commit()
+    def writePrefValues(self, deck: Deck, values: dict):
+        self.ensureDeckTablesExist(deck)
 
-        WRITE_SQL = f"""INSERT INTO {PREFS_TABLE_NAME} (
-        bin0_weight, bin1_weight, bin2_weight, bin3_weight, bin4_weight, bin5_weight,
-    drill_question_count, space_repetition_bias, reverse_drill) VALUES (
-    ?, ?, ?, ?, ?, ?, ?, ?, ?
-);"""
-        cur = con.cursor()
-        cur.execute(
-            WRITE_SQL,
-            [
-                (binDist[0]),
-                (binDist[1]),
-                (binDist[2]),
-                (binDist[3]),
-                (binDist[4]),
-                (binDist[5]),
-                (qCount),
-                (useSRintValue),
-                (reversedDrillIntValue),
-            ],
-        )
-        con.commit()
+        with self.transaction() as cur:
+            cur.executemany(
+                f"""INSERT INTO {PREF_VALUES_TABLE_NAME} (key, value) VALUES (?, ?)
+ON CONFLICT(key) DO UPDATE SET value = excluded.value;""",
+                [(key, encodePrefValue(key, value)) for key, value in values.items()],
+            )
 
     def ensureDeckTablesExist(self, deck: Deck):
+        """
+        Make sure the deck tables exist and are migrated to the current
+        schema. This is called at the top of most DeckDatabase methods,
+        so the check is done once per connection; a database stamped with
+        the current DECK_SCHEMA_VERSION needs only the user_version read.
+        """
+        self.getDbConnection()
+        if self.schemaVerified:
+            return
+
+        if self.readSchemaVersion() >= DECK_SCHEMA_VERSION:
+            self.schemaVerified = True
+            return
+
+        self.migrateSchema()
         if not self.checkDeckTableExists(deck):
-            self.createDeckTables(deck)
-            if not self.checkDeckTableExists(deck):
-                raise Exception(
-                    f"Could not find or create table for deck {deck.name}"
-                )
+            raise Exception(
+                f"Could not find or create table for deck {deck.name}"
+            )
 
-    def checkDeckTableExists(self, deck: Deck):
-        CHECK_SQL = "SELECT name FROM sqlite_master;"
+    def checkIntegrity(self, deck: Deck, repair=False):
+        """
+        Count (and with repair, remove) tag relations whose term or tag no
+        longer exists and pref overrides whose category or tag no longer
+        exists, and clear categories that no longer exist from their
+        terms. Returns a dict of check name -> orphaned row count.
+        """
+        from lexilogio.deckintegrity import (
+            runIntegrityChecks,
+            tagRelationChecks,
+            termCategoryCheck,
+            scopedPrefChecks,
+        )
+
+        self.ensureDeckTablesExist(deck)
+        checks = tagRelationChecks(self.termKeyTableName()) + [termCategoryCheck()] + scopedPrefChecks()
+        return runIntegrityChecks(self.getDbConnection(), checks, repair)
 
+    def readDeckRevision(self):
+        """
+        Return the deck revision, a counter bumped by triggers on every
+        change to terms, categories, tags, tag relations or prefs, or None
+        if the database has no revision counter (not yet migrated).
+        """
         con = self.getDbConnection()
-        cur = con.cursor()
-        cur.execute(CHECK_SQL)
+        try:
+            row = con.execute(f"SELECT revision FROM {DECK_META_TABLE_NAME} WHERE pkey = 1;").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        if None == row:
+            return None
+        return int(row[0])
+
+    def readTermVersion(self):
+        """
+        Return the deck's term version, the row version of the latest
+        term write or delete, or None if the database has no row
+        versions (not yet migrated). See queryTermChangesSince.
+        """
+        con = self.getDbConnection()
+        try:
+            row = con.execute(f"SELECT term_version FROM {DECK_META_TABLE_NAME} WHERE pkey = 1;").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        if None == row:
+            return None
+        return int(row[0])
+
+    def queryTermChangesSince(self, deck: Deck, termVersion):
+        """
+        Return (terms, deleted pkeys, new term version) for the term rows
+        written and deleted after termVersion (from readTermVersion, or
+        the previous call). Rows written while this runs may be returned
+        again by the next call; a pkey can be both deleted and written
+        (a reused pkey, a term moved between shards), the written term
+        is then current.
+        """
+        self.ensureDeckTablesExist(deck)
 
-        nameRows = cur.execute(CHECK_SQL).fetchall()
-        names = [r[0] for r in nameRows if len(r) > 0]
-        # print(f"DEBUG - sqlite_master table names: {names}")
+        # read the version first, so nothing committed up to it is missed
+        newVersion = self.readTermVersion()
+        con = self.getDbConnection()
+        columnNamesCommaStr = ",".join(DECK_TERMS_LOAD_COLUMN_NAMES)
+        terms = DeckDatabase.queryResultsToTermArray(
+            con.execute(
+                f"SELECT {columnNamesCommaStr} FROM {DECK_TERMS_TABLE_NAME} WHERE row_version > ?;",
+                [termVersion],
+            ).fetchall()
+        )
+        deletedPKeys = [
+            row[0]
+            for row in con.execute(
+                f"SELECT pkey FROM {TERM_DELETES_TABLE_NAME} WHERE row_version > ?;", [termVersion]
+            )
+        ]
+        return (terms, deletedPKeys, newVersion)
 
-        return DECK_TERMS_TABLE_NAME in names
+    def readSchemaVersion(self):
+        con = self.getDbConnection()
+        row = con.execute("PRAGMA user_version;").fetchone()
+        if None == row:
+            return 0
+        return int(row[0])
+
+    def checkDeckTableExists(self, deck: Deck):
+        CHECK_SQL = "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?;"
 
-    def createDeckTables(self, deck: Deck):
         con = self.getDbConnection()
         cur = con.cursor()
 
-        CREATE_SQL_categories = f"""CREATE TABLE IF NOT EXISTS {CATEGORY_TABLE_NAME} (
-    pkey INTEGER PRIMARY KEY,
-    category TEXT NOT NULL
-);
-"""
-        cur.execute(CREATE_SQL_categories)
+        nameRow = cur.execute(CHECK_SQL, [DECK_TERMS_TABLE_NAME]).fetchone()
+        return None != nameRow
 
-        CREATE_SQL_tags = f"""CREATE TABLE IF NOT EXISTS {TAG_TABLE_NAME} (
-    pkey INTEGER PRIMARY KEY,
-    tag TEXT NOT NULL
-);
-"""
-        cur.execute(CREATE_SQL_tags)
-
-        CREATE_SQL_terms = f"""CREATE TABLE IF NOT EXISTS {DECK_TERMS_TABLE_NAME} (
-    pkey INTEGER PRIMARY KEY,
-    question TEXT NOT NULL,
-    answer TEXT NOT NULL,
-    category INT NULL,
-    bin INTEGER DEFAULT 0 NOT NULL,
-    reversed_bin INTEGER DEFAULT 0 NOT NULL,
-    last_drill_time TEXT DEFAULT NULL,
-    has_paper_card INT DEFAULT 0,
-    FOREIGN KEY(category) REFERENCES {CATEGORY_TABLE_NAME}(pkey)
-);
-"""
-
-        cur.execute(CREATE_SQL_terms)
+    def createDeckTables(self, deck: Deck):
+        self.migrateSchema()
 
-        CREATE_SQL_tagrelation = f"""CREATE TABLE IF NOT EXISTS {TAG_RELATION_TABLE_NAME} (
-    pkey INTEGER PRIMARY KEY,
-    term INTEGER NOT NULL,
-    tag INTEGER NOT NULL,
-    FOREIGN KEY(term) REFERENCES {DECK_TERMS_TABLE_NAME}(pkey),
-    FOREIGN KEY(tag) REFERENCES {TAG_TABLE_NAME}(pkey)
-);
-"""
-        cur.execute(CREATE_SQL_tagrelation)
-
-        CREATE_SQL_prefs = f"""CREATE TABLE IF NOT EXISTS {PREFS_TABLE_NAME} (
-    pkey INTEGER PRIMARY KEY,
-    drill_question_count INTEGER DEFAULT 25 NOT NULL,
-    space_repetition_bias INTEGER DEFAULT 1 NOT NULL,
-    reverse_drill INTEGER DEFAULT 0 NOT NULL,
-    category TEXT DEFAULT NULL,
-    bin0_weight REAL DEFAULT 0.36,
-    bin1_weight REAL DEFAULT 0.25,
-    bin2_weight REAL DEFAULT 0.16,
-    bin3_weight REAL DEFAULT 0.11,
-    bin4_weight REAL DEFAULT 0.07,
-    bin5_weight REAL DEFAULT 0.05
-);
-"""
-        cur.execute(CREATE_SQL_prefs)
+    def getSchemaMigrator(self):
+        # imported here, deckmigrations depends on this module's constants
+        from lexilogio.deckmigrations import DECK_MIGRATIONS
 
-        # Also insert default prefs row (category NULL)
-        cur.execute(INSERT_DEFAULT_PREFS_SQL)
+        return SchemaMigrator(self.getDbConnection(), DECK_MIGRATIONS)
 
-        con.commit()
+    def migrateSchema(self, online=False, batchSize=DEFAULT_MIGRATION_BATCH_SIZE):
+        """
+        Bring the database up to DECK_SCHEMA_VERSION. With online=True,
+        migrations that rewrite large tables commit in batches of
+        batchSize rows instead of holding the write lock throughout.
+        Returns a list of MigrationReportEntry for the applied steps.
+        """
+        # table rebuilds must not cascade
+        self.setForeignKeysEnforced(False)
+        try:
+            report = self.getSchemaMigrator().migrate(online, batchSize)
+        finally:
+            self.setForeignKeysEnforced(self.enforceForeignKeys)
+        self.schemaVerified = self.readSchemaVersion() >= DECK_SCHEMA_VERSION
+        return report
+
+    def dryRunSchemaMigration(self, online=False, batchSize=DEFAULT_MIGRATION_BATCH_SIZE):
+        """
+        Report the pending migrations and the time each takes when run on
+        an in-memory copy of this database, without modifying it.
+        """
+        return self.getSchemaMigrator().dryRun(online, batchSize)
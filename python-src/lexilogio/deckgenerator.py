@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 15:10:44 2026
+
+@author: mathaes
+
+Synthetic deck generation for benchmarks and scale tests. Generated terms
+are Greek (or Latin) pseudo-words built from syllables, spread over
+categories with a skewed (Zipf-like) distribution, tagged with a few tags
+each and assigned bins according to a configurable distribution.
+
+populateDeck writes generated term rows straight through the bulk insert
+path (explicit pkeys, executemany, one row version per batch), with drill
+times spread over a drill history consistent with each term's bins and,
+optionally, the review log rows of that history.
+"""
+
+import contextlib
+import itertools
+import logging
+import random
+import time
+
+from lexilogio.deck import Deck
+from lexilogio.deckdatabase import (
+    DeckDatabase,
+    DECK_TERMS_TABLE_NAME,
+    TAG_RELATION_TABLE_NAME,
+    REVIEW_LOG_TABLE_NAME,
+)
+from lexilogio.deckprefs import DEFAULT_BIN_REVIEW_INTERVAL_DAYS
+from lexilogio.reviewlog import ReviewRecord, SECONDS_PER_DAY, RECALLED_MIN_RATING
+from lexilogio.term import Term
+
+LANGUAGE_GREEK = "greek"
+LANGUAGE_LATIN = "latin"
+
+GREEK_SYLLABLES = [
+    "λε", "ξη", "κα", "λη", "μέ", "ρα", "σπί", "τι", "θά", "λασ", "σα", "νε",
+    "ρό", "γά", "τα", "ψω", "μί", "φί", "λος", "δρό", "μος", "χρό", "νος", "ου",
+    "ρα", "νός", "βι", "βλί", "ο", "πό", "λη", "ζω", "ή", "ἄν", "θρω", "πος",
+]
+LATIN_SYLLABLES = [
+    "ver", "bum", "ca", "ni", "lu", "pus", "a", "qua", "ter", "ra", "do", "mus",
+    "por", "ta", "vi", "ta", "ro", "sa", "ma", "nus", "pa", "ter", "fi", "li",
+    "us", "tem", "pus", "lex", "rex", "cor", "pus", "mi", "les", "ur", "bs", "o",
+]
+ENGLISH_WORDS = [
+    "word", "house", "sea", "time", "road", "book", "city", "life", "person",
+    "friend", "water", "earth", "light", "hand", "door", "name", "day", "night",
+]
+
+# relative weights of bins 0-5 for generated terms
+DEFAULT_BIN_WEIGHTS = [0.4, 0.15, 0.15, 0.12, 0.1, 0.08]
+
+DEFAULT_INSERT_BATCH_SIZE = 10000
+
+# days of drill history generated drill times are spread over
+DEFAULT_HISTORY_DAYS = 365
+DEFAULT_PAPER_CARD_FRACTION = 0.05
+# share of reviews in a generated history that were missed
+DEFAULT_MISS_FRACTION = 0.15
+
+
+class DeckGenerator:
+    def __init__(
+        self,
+        seed=0,
+        language=LANGUAGE_GREEK,
+        categoryCount=12,
+        tagCount=40,
+        maxTagsPerTerm=3,
+        binWeights=None,
+        historyDays=DEFAULT_HISTORY_DAYS,
+        paperCardFraction=DEFAULT_PAPER_CARD_FRACTION,
+        reviewHistory=False,
+    ):
+        self.rng = random.Random(seed)
+        if language == LANGUAGE_LATIN:
+            self.syllables = LATIN_SYLLABLES
+        elif language == LANGUAGE_GREEK:
+            self.syllables = GREEK_SYLLABLES
+        else:
+            raise Exception(f"Unsupported generator language: {language}")
+        self.language = language
+        self.categoryCount = categoryCount
+        self.tagCount = tagCount
+        self.maxTagsPerTerm = maxTagsPerTerm
+        self.binWeights = binWeights if binWeights else DEFAULT_BIN_WEIGHTS
+        # Zipf-like category sizes: category n gets weight 1/(n+1)
+        self.categoryWeights = [1.0 / (n + 1) for n in range(0, categoryCount)]
+        self.tagWeights = [1.0 / (n + 1) for n in range(0, tagCount)]
+        self.historyDays = historyDays
+        self.paperCardFraction = paperCardFraction
+        # also generate the review log of each drilled term
+        self.reviewHistory = reviewHistory
+        self.binIntervalDays = DEFAULT_BIN_REVIEW_INTERVAL_DAYS
+
+    def makeWord(self, serial):
+        syllableCount = self.rng.randint(2, 4)
+        word = "".join(self.rng.choices(self.syllables, k=syllableCount))
+        # serial suffix keeps questions unique
+        return f"{word} {serial}"
+
+    def makeAnswer(self):
+        return " ".join(self.rng.choices(ENGLISH_WORDS, k=self.rng.randint(1, 3)))
+
+    def makeTerms(self, count, categories: list, tags: list, serialStart=0):
+        """
+        Create count new Term objects using the given (database) categories
+        and tags.
+        """
+        # cumulative weights computed once per batch, not per choice
+        categoryCumWeights = list(itertools.accumulate(self.categoryWeights[: len(categories)]))
+        tagCumWeights = list(itertools.accumulate(self.tagWeights[: len(tags)]))
+        binCumWeights = list(itertools.accumulate(self.binWeights))
+        bins = range(0, len(self.binWeights))
+
+        terms = []
+        for n in range(0, count):
+            term = Term()
+            term.question = self.makeWord(serialStart + n)
+            term.answer = self.makeAnswer()
+            if len(categories) > 0:
+                term.category = self.rng.choices(categories, cum_weights=categoryCumWeights)[0].pkey
+            term.bin = self.rng.choices(bins, cum_weights=binCumWeights)[0]
+            term.reversedBin = self.rng.choices(bins, cum_weights=binCumWeights)[0]
+            if len(tags) > 0 and self.maxTagsPerTerm > 0:
+                tagCount = self.rng.randint(0, self.maxTagsPerTerm)
+                term.tags = list(
+                    set(self.rng.choices(tags, cum_weights=tagCumWeights, k=tagCount))
+                )
+            terms.append(term)
+        return terms
+
+    def makeDrillTime(self, bin, reversedBin, now):
+        """
+        A last drill time (epoch seconds) for a term with the given bins,
+        or None if it was never rated (both bins 0): terms in higher bins
+        were last drilled longer ago, as their review intervals are
+        longer.
+        """
+        if bin == 0 and reversedBin == 0:
+            return None
+        intervalDays = self.binIntervalDays.get(max(bin, reversedBin), 0.0)
+        # up to twice the interval ago (overdue terms), at least a day
+        ageDays = min(self.historyDays, self.rng.random() * max(1.0, 2.0 * intervalDays))
+        return int(now - ageDays * SECONDS_PER_DAY)
+
+    def makeReviewHistory(self, termPK, categoryPK, bin, reversedBin, lastDrillTime):
+        """
+        ReviewRecords of a drill history ending at lastDrillTime with a
+        rating of bin (or of reversedBin in reversed drills if the term
+        was only drilled that way). A rating becomes the term's bin, so
+        earlier ratings climb a bin per review, with some misses.
+        """
+        isReversed = bin == 0
+        # a first review puts the term in bin 1 to 3, later ones move it up
+        # a bin when recalled, down to bin 1 or 2 when missed
+        ratings = []
+        previousRating = 0
+        for n in range(0, self.rng.randint(0, max(bin, reversedBin) + 1)):
+            if previousRating == 0:
+                previousRating = self.rng.randint(1, RECALLED_MIN_RATING)
+            elif self.rng.random() < DEFAULT_MISS_FRACTION:
+                previousRating = self.rng.randint(1, RECALLED_MIN_RATING - 1)
+            else:
+                previousRating = min(len(self.binWeights) - 1, previousRating + 1)
+            ratings.append(previousRating)
+        ratings.append(reversedBin if isReversed else bin)
+
+        # review times backwards from the last review, each interval
+        # about the review interval of the bin the term was in
+        reviewTimes = [lastDrillTime]
+        for rating in reversed(ratings[:-1]):
+            intervalDays = max(0.1, self.binIntervalDays.get(rating, 0.0))
+            reviewTimes.append(reviewTimes[-1] - int(intervalDays * self.rng.uniform(0.8, 1.5) * SECONDS_PER_DAY))
+        reviewTimes.reverse()
+
+        records = []
+        previousBin = 0
+        previousReviewTime = None
+        for rating, reviewTime in zip(ratings, reviewTimes):
+            records.append(
+                ReviewRecord(
+                    termPK, reviewTime, rating, isReversed=isReversed,
+                    responseMs=self.rng.randint(800, 9000), previousBin=previousBin,
+                    previousReviewTime=previousReviewTime, category=categoryPK,
+                )
+            )
+            previousBin = rating
+            previousReviewTime = reviewTime
+        return records
+
+    def makeTermRows(self, count, categories: list, tags: list, firstPKey, now=None):
+        """
+        Generate count term rows (in DECK_TERMS_COLUMN_NAMES order, pkeys
+        from firstPKey), their (term, tag) relation rows and, with
+        reviewHistory, their ReviewRecords. Returns (rows, tagRows,
+        reviewRecords).
+        """
+        if None == now:
+            now = int(time.time())
+
+        bins = range(0, len(self.binWeights))
+        binCumWeights = list(itertools.accumulate(self.binWeights))
+        termBins = self.rng.choices(bins, cum_weights=binCumWeights, k=count)
+        termReversedBins = self.rng.choices(bins, cum_weights=binCumWeights, k=count)
+        termCategoryPKs = [None] * count
+        if len(categories) > 0:
+            categoryCumWeights = list(itertools.accumulate(self.categoryWeights[: len(categories)]))
+            categoryPKs = [c.pkey for c in categories]
+            termCategoryPKs = self.rng.choices(categoryPKs, cum_weights=categoryCumWeights, k=count)
+        tagPKs = [t.pkey for t in tags]
+        tagCumWeights = list(itertools.accumulate(self.tagWeights[: len(tags)]))
+        termTagPKs = [()] * count
+        if len(tagPKs) > 0 and self.maxTagsPerTerm > 0:
+            # draw all the tags of the batch at once, then deal them out
+            tagCounts = self.rng.choices(range(0, self.maxTagsPerTerm + 1), k=count)
+            drawnTagPKs = self.rng.choices(tagPKs, cum_weights=tagCumWeights, k=sum(tagCounts))
+            start = 0
+            for n, tagCount in enumerate(tagCounts):
+                termTagPKs[n] = set(drawnTagPKs[start : start + tagCount])
+                start += tagCount
+
+        # words as makeWord and makeAnswer make them, drawn for the batch
+        syllableCounts = self.rng.choices(range(2, 5), k=count)
+        syllables = self.rng.choices(self.syllables, k=sum(syllableCounts))
+        answerWordCounts = self.rng.choices(range(1, 4), k=count)
+        answerWords = self.rng.choices(ENGLISH_WORDS, k=sum(answerWordCounts))
+        syllableStart = 0
+        answerStart = 0
+
+        rows = []
+        tagRows = []
+        reviewRecords = []
+        for n in range(0, count):
+            pkey = firstPKey + n
+            syllableEnd = syllableStart + syllableCounts[n]
+            question = "".join(syllables[syllableStart:syllableEnd]) + f" {pkey}"
+            syllableStart = syllableEnd
+            answerEnd = answerStart + answerWordCounts[n]
+            answer = " ".join(answerWords[answerStart:answerEnd])
+            answerStart = answerEnd
+
+            bin = termBins[n]
+            reversedBin = termReversedBins[n]
+            lastDrillTime = self.makeDrillTime(bin, reversedBin, now)
+            rows.append(
+                (
+                    pkey,
+                    question,
+                    answer,
+                    termCategoryPKs[n],
+                    bin,
+                    reversedBin,
+                    lastDrillTime,
+                    1 if self.rng.random() < self.paperCardFraction else 0,
+                )
+            )
+            for tagPK in termTagPKs[n]:
+                tagRows.append((pkey, tagPK))
+            if self.reviewHistory and None != lastDrillTime:
+                reviewRecords.extend(
+                    self.makeReviewHistory(pkey, termCategoryPKs[n], bin, reversedBin, lastDrillTime)
+                )
+        return rows, tagRows, reviewRecords
+
+    def populateDeck(self, database: DeckDatabase, deck: Deck, termCount,
+                     batchSize=DEFAULT_INSERT_BATCH_SIZE, bulkLoad=None):
+        """
+        Add termCount generated terms to the deck database, in categories
+        and with tags named after the generator language (created unless
+        the deck has them already). Terms are written in batches through
+        insertGeneratedTermRows, each batch taking its pkeys in its write
+        transaction.
+
+        With bulkLoad (by default when the deck has fewer terms than are
+        added) all batches are written in one bulkLoadTransaction, which
+        rebuilds the term, tag relation and review log indexes at the end.
+        """
+        database.ensureDeckTablesExist(deck)
+
+        categoriesByName = dict([(c.name, c) for c in database.getDeckCategories(deck)])
+        categories = []
+        for n in range(0, self.categoryCount):
+            name = f"{self.language}-category-{n}"
+            if not name in categoriesByName:
+                categoriesByName[name] = database.insertDeckCategory(deck, name)
+            categories.append(categoriesByName[name])
+        deck.categories = list(categoriesByName.values())
+
+        deck.tags = database.getDeckTags(deck)
+        tagsByName = dict([(t.name, t) for t in deck.tags])
+        tags = []
+        for n in range(0, self.tagCount):
+            name = f"{self.language}-tag-{n}"
+            if not name in tagsByName:
+                # insertDeckTag also appends the tag to deck.tags
+                tagsByName[name] = database.insertDeckTag(deck, name)
+            tags.append(tagsByName[name])
+
+        if None == bulkLoad:
+            bulkLoad = termCount > database.readMaxTermPKey()
+        bulkContext = contextlib.nullcontext()
+        if bulkLoad:
+            bulkContext = database.bulkLoadTransaction(
+                [DECK_TERMS_TABLE_NAME, TAG_RELATION_TABLE_NAME, REVIEW_LOG_TABLE_NAME]
+            )
+
+        now = int(time.time())
+        with bulkContext:
+            for start in range(0, termCount, batchSize):
+                count = min(batchSize, termCount - start)
+                with database.transaction():
+                    firstPKey = database.readMaxTermPKey() + 1
+                    rows, tagRows, reviewRecords = self.makeTermRows(count, categories, tags, firstPKey, now)
+                    database.insertGeneratedTermRows(deck, rows, tagRows)
+                    if len(reviewRecords) > 0:
+                        database.appendReviewLog(deck, reviewRecords)
+                logging.debug(f"  generated {start + count} of {termCount} terms")
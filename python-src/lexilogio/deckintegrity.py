@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:05:41 2026
+
+@author: mathaes
+
+Referential integrity checks for deck databases. Each check counts the
+orphaned rows with a set-based anti-join (NOT EXISTS against the primary
+key) and can repair them with a single DELETE or UPDATE, so a check of a
+large deck costs one index probe per row rather than per-row queries.
+
+Deck files with enforced foreign keys (see DeckDatabase) cannot gain new
+orphans; the checks find rows left by older versions, and rows in sharded
+decks, whose references cross database files.
+"""
+
+import logging
+import time
+
+from lexilogio.connectionmanager import retryOnBusy
+from lexilogio.deckdatabase import (
+    DECK_TERMS_TABLE_NAME,
+    CATEGORY_TABLE_NAME,
+    TAG_TABLE_NAME,
+    TAG_RELATION_TABLE_NAME,
+    CATEGORY_PREFS_TABLE_NAME,
+    TAG_PREFS_TABLE_NAME,
+)
+
+
+class IntegrityCheck:
+    def __init__(self, name, countSQL, repairSQL):
+        self.name = name
+        self.countSQL = countSQL
+        self.repairSQL = repairSQL
+
+
+def tagRelationChecks(termTableName=DECK_TERMS_TABLE_NAME):
+    """
+    Checks for tag relations whose term (looked up in termTableName) or
+    tag no longer exists.
+    """
+    missingTermSQL = f"""FROM {TAG_RELATION_TABLE_NAME} WHERE NOT EXISTS (
+    SELECT 1 FROM {termTableName} t WHERE t.pkey = {TAG_RELATION_TABLE_NAME}.term)"""
+    missingTagSQL = f"""FROM {TAG_RELATION_TABLE_NAME} WHERE NOT EXISTS (
+    SELECT 1 FROM {TAG_TABLE_NAME} g WHERE g.pkey = {TAG_RELATION_TABLE_NAME}.tag)"""
+    return [
+        IntegrityCheck(
+            "tag relations without a term",
+            f"SELECT COUNT(*) {missingTermSQL};",
+            f"DELETE {missingTermSQL};",
+        ),
+        IntegrityCheck(
+            "tag relations without a tag",
+            f"SELECT COUNT(*) {missingTagSQL};",
+            f"DELETE {missingTagSQL};",
+        ),
+    ]
+
+
+def termCategoryCheck(categoryTableName=CATEGORY_TABLE_NAME):
+    """
+    Check for terms whose category (looked up in categoryTableName) no
+    longer exists; repairing clears their category.
+    """
+    whereSQL = f"""WHERE category IS NOT NULL AND NOT EXISTS (
+    SELECT 1 FROM {categoryTableName} c WHERE c.pkey = {DECK_TERMS_TABLE_NAME}.category)"""
+    return IntegrityCheck(
+        "terms with a missing category",
+        f"SELECT COUNT(*) FROM {DECK_TERMS_TABLE_NAME} {whereSQL};",
+        f"UPDATE {DECK_TERMS_TABLE_NAME} SET category = NULL {whereSQL};",
+    )
+
+
+def scopedPrefChecks():
+    """
+    Checks for category and tag pref overrides whose category or tag no
+    longer exists.
+    """
+    checks = []
+    for tableName, scopeColumn, scopeTableName in [
+        (CATEGORY_PREFS_TABLE_NAME, "category", CATEGORY_TABLE_NAME),
+        (TAG_PREFS_TABLE_NAME, "tag", TAG_TABLE_NAME),
+    ]:
+        fromSQL = f"""FROM {tableName} WHERE NOT EXISTS (
+    SELECT 1 FROM {scopeTableName} s WHERE s.pkey = {tableName}.{scopeColumn})"""
+        checks.append(
+            IntegrityCheck(
+                f"{scopeColumn} prefs without a {scopeColumn}",
+                f"SELECT COUNT(*) {fromSQL};",
+                f"DELETE {fromSQL};",
+            )
+        )
+    return checks
+
+
+def runIntegrityChecks(con, checks: list, repair=False):
+    """
+    Run the checks on connection con, and with repair, fix what they
+    find in a single transaction. Returns a dict of check name -> number
+    of orphaned rows found.
+    """
+    startTime = time.perf_counter()
+    report = {}
+    cur = con.cursor()
+    con.commit()
+    if repair:
+        retryOnBusy(lambda: cur.execute("BEGIN IMMEDIATE;"))
+    try:
+        for check in checks:
+            count = cur.execute(check.countSQL).fetchone()[0]
+            report[check.name] = report.get(check.name, 0) + count
+            if repair and count > 0:
+                cur.execute(check.repairSQL)
+    except Exception:
+        if repair:
+            con.rollback()
+        raise
+    retryOnBusy(con.commit)
+    logging.debug(f"Integrity checks took {time.perf_counter() - startTime:.3f}s: {report}")
+    return report
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 13:05:18 2026
+
+@author: mathaes
+
+Diff and merge of two deck databases, e.g. to sync a learner's offline
+copy of a deck back into the main one.
+
+Terms are matched by question text: both decks are streamed in
+(question, pkey) order and merge-joined, so a diff is linear in deck size
+and only the differences are held in memory. Terms with the same question
+are paired in pkey order.
+
+For matched terms, the content (answer, category name, paper card flag)
+is compared by hash and the source content wins when it differs. Drill
+state (bin, reversed bin, last drill time) is taken from whichever side
+was drilled most recently. The source tags of new and changed terms are
+added to them in the target (existing tags are kept), matching tags by
+name; missing tags are created.
+"""
+
+import hashlib
+import logging
+
+from lexilogio.deck import Deck
+from lexilogio.deckdatabase import (
+    DeckDatabase,
+    CATEGORY_TABLE_NAME,
+    TAG_TABLE_NAME,
+    TAG_RELATION_TABLE_NAME,
+)
+from lexilogio.tag import Tag
+from lexilogio.reviewlog import drillTimeToEpoch
+
+# indexes into rows from DeckDatabase.iterTermRowsByQuestion
+ROW_PKEY = 0
+ROW_QUESTION = 1
+ROW_ANSWER = 2
+ROW_CATEGORY = 3
+ROW_BIN = 4
+ROW_REVERSED_BIN = 5
+ROW_LAST_DRILL_TIME = 6
+ROW_HAS_PAPER_CARD = 7
+
+
+class DeckDiff:
+    def __init__(self):
+        self.added = []  # source rows with no matching target term
+        self.deleted = []  # target rows with no matching source term
+        self.changed = []  # (target row, source row) pairs with different content
+        self.drilled = []  # (target row, source row) pairs drilled more recently in source
+        self.unchangedCount = 0
+
+        # category pkey -> name for each side
+        self.sourceCategories = {}
+        self.targetCategories = {}
+
+        # tag pkey -> (name, parent pkey) for each side, and the source
+        # tag pkeys of the added and changed source terms
+        self.sourceTags = {}
+        self.targetTags = {}
+        self.sourceTermTags = {}
+        self.taggedCount = 0  # tag relations added to the target
+        self.skippedTagCount = 0  # source tag relations without a tag
+
+    def isEmpty(self):
+        return (
+            len(self.added) == 0
+            and len(self.deleted) == 0
+            and len(self.changed) == 0
+            and len(self.drilled) == 0
+        )
+
+    def __repr__(self):
+        return (
+            f"{len(self.added)} new, {len(self.changed)} changed, "
+            f"{len(self.drilled)} newer drill results, {len(self.deleted)} missing from source, "
+            f"{self.unchangedCount} unchanged, {self.taggedCount} tag relations merged"
+            f" ({self.skippedTagCount} without a tag skipped)"
+        )
+
+
+def readCategoryNames(database: DeckDatabase):
+    # read directly, so a source deck is never migrated as a side effect
+    rows = database.getDbConnection().execute(
+        f"SELECT pkey, category FROM {CATEGORY_TABLE_NAME};"
+    ).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def readTags(database: DeckDatabase):
+    con = database.getDbConnection()
+    # deck files from before the tag hierarchy (migration 7) have no parents
+    columns = [row[1] for row in con.execute(f"PRAGMA table_info({TAG_TABLE_NAME});").fetchall()]
+    parentSQL = "parent" if "parent" in columns else "NULL"
+    rows = con.execute(f"SELECT pkey, tag, {parentSQL} FROM {TAG_TABLE_NAME};").fetchall()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def readTermTags(database: DeckDatabase, termPKs: set):
+    """
+    The tag pkeys of each term in termPKs that has tags, read in one pass
+    over the tag relations.
+    """
+    termTags = {}
+    if len(termPKs) == 0:
+        return termTags
+    cur = database.getDbConnection().execute(f"SELECT term, tag FROM {TAG_RELATION_TABLE_NAME};")
+    for termPK, tagPK in cur:
+        if termPK in termPKs:
+            termTags.setdefault(termPK, []).append(tagPK)
+    return termTags
+
+
+def contentHash(row, categoryNames: dict):
+    categoryName = categoryNames.get(row[ROW_CATEGORY], "")
+    content = f"{row[ROW_ANSWER]}\x1f{categoryName}\x1f{int(row[ROW_HAS_PAPER_CARD] or 0)}"
+    return hashlib.sha1(content.encode("utf-8")).digest()
+
+
+def isNewerDrillTime(drillTime, otherDrillTime):
+    if None == drillTime:
+        return False
+    if None == otherDrillTime:
+        return True
+    return drillTime > otherDrillTime
+
+
+def epochDrillTimeRows(rows):
+    # a source deck that was never migrated has ISO-8601 drill times
+    for row in rows:
+        if type(row[ROW_LAST_DRILL_TIME]) == str:
+            row = list(row)
+            row[ROW_LAST_DRILL_TIME] = drillTimeToEpoch(row[ROW_LAST_DRILL_TIME])
+            row = tuple(row)
+        yield row
+
+
+def diffDecks(sourceDb: DeckDatabase, targetDb: DeckDatabase):
+    """
+    Compare two deck databases in a single merge-join pass.
+    Returns a DeckDiff describing how the target differs from the source.
+    """
+    diff = DeckDiff()
+    diff.sourceCategories = readCategoryNames(sourceDb)
+    diff.targetCategories = readCategoryNames(targetDb)
+
+    sourceRows = epochDrillTimeRows(sourceDb.iterTermRowsByQuestion())
+    targetRows = iter(targetDb.iterTermRowsByQuestion())
+
+    sourceRow = next(sourceRows, None)
+    targetRow = next(targetRows, None)
+
+    while None != sourceRow or None != targetRow:
+        if None == targetRow or (
+            None != sourceRow and sourceRow[ROW_QUESTION] < targetRow[ROW_QUESTION]
+        ):
+            diff.added.append(sourceRow)
+            sourceRow = next(sourceRows, None)
+            continue
+
+        if None == sourceRow or targetRow[ROW_QUESTION] < sourceRow[ROW_QUESTION]:
+            diff.deleted.append(targetRow)
+            targetRow = next(targetRows, None)
+            continue
+
+        unchanged = True
+        if contentHash(sourceRow, diff.sourceCategories) != contentHash(
+            targetRow, diff.targetCategories
+        ):
+            diff.changed.append((targetRow, sourceRow))
+            unchanged = False
+        if isNewerDrillTime(sourceRow[ROW_LAST_DRILL_TIME], targetRow[ROW_LAST_DRILL_TIME]):
+            diff.drilled.append((targetRow, sourceRow))
+            unchanged = False
+        if unchanged:
+            diff.unchangedCount += 1
+
+        sourceRow = next(sourceRows, None)
+        targetRow = next(targetRows, None)
+
+    diff.sourceTags = readTags(sourceDb)
+    diff.targetTags = readTags(targetDb)
+    sourceTermPKs = set([row[ROW_PKEY] for row in diff.added])
+    sourceTermPKs.update([sourceRow[ROW_PKEY] for targetRow, sourceRow in diff.changed])
+    diff.sourceTermTags = readTermTags(sourceDb, sourceTermPKs)
+    return diff
+
+
+def applyDiff(diff: DeckDiff, targetDb: DeckDatabase, deck: Deck, applyDeletes=False):
+    """
+    Apply a DeckDiff to the target database with bulk inserts, updates
+    and (if applyDeletes) deletes. Categories and tags missing from the
+    target are created by name.
+    """
+    targetCategoryPKs = {name: pk for pk, name in diff.targetCategories.items()}
+
+    def targetCategoryFor(sourceRow):
+        sourceCatPK = sourceRow[ROW_CATEGORY]
+        if None == sourceCatPK or not sourceCatPK in diff.sourceCategories:
+            return None
+        catName = diff.sourceCategories[sourceCatPK]
+        if not catName in targetCategoryPKs:
+            newCat = targetDb.insertDeckCategory(deck, catName)
+            targetCategoryPKs[catName] = newCat.pkey
+        return targetCategoryPKs[catName]
+
+    targetTagPKs = {name: pk for pk, (name, parentPK) in diff.targetTags.items()}
+
+    def targetTagFor(sourceTagPK):
+        # parents first, so a created tag keeps its place in the hierarchy
+        name, sourceParentPK = diff.sourceTags[sourceTagPK]
+        if not name in targetTagPKs:
+            parent = None
+            if None != sourceParentPK and sourceParentPK in diff.sourceTags:
+                parent = Tag(name=diff.sourceTags[sourceParentPK][0], pkey=targetTagFor(sourceParentPK))
+            targetTagPKs[name] = targetDb.insertDeckTag(deck, name, parent).pkey
+        return targetTagPKs[name]
+
+    newTerms = []
+    for sourceRow in diff.added:
+        term = termFromRow(sourceRow)
+        term.category = targetCategoryFor(sourceRow)
+        newTerms.append(term)
+
+    updatedTerms = {}
+    for targetRow, sourceRow in diff.changed:
+        term = updatedTerms.setdefault(targetRow[ROW_PKEY], termFromRow(targetRow))
+        term.answer = sourceRow[ROW_ANSWER]
+        term.category = targetCategoryFor(sourceRow)
+        term.hasPaperCard = bool(sourceRow[ROW_HAS_PAPER_CARD])
+
+    for targetRow, sourceRow in diff.drilled:
+        term = updatedTerms.setdefault(targetRow[ROW_PKEY], termFromRow(targetRow))
+        term.bin = int(sourceRow[ROW_BIN])
+        term.reversedBin = int(sourceRow[ROW_REVERSED_BIN])
+        term.lastDrillTime = sourceRow[ROW_LAST_DRILL_TIME]
+
+    if len(newTerms) > 0:
+        logging.info(f"Merge: inserting {len(newTerms)} terms...")
+        targetDb.insertTerms(deck, newTerms)
+
+    if len(updatedTerms) > 0:
+        logging.info(f"Merge: updating {len(updatedTerms)} terms...")
+        targetDb.updateTerms(deck, list(updatedTerms.values()))
+
+    # source term pkey -> target term pkey; insertTerms set the new pkeys
+    targetTermPKs = {row[ROW_PKEY]: term.pkey for row, term in zip(diff.added, newTerms)}
+    for targetRow, sourceRow in diff.changed:
+        targetTermPKs[sourceRow[ROW_PKEY]] = targetRow[ROW_PKEY]
+
+    termPKsByTag = {}
+    for sourceTermPK, sourceTagPKs in diff.sourceTermTags.items():
+        for sourceTagPK in sourceTagPKs:
+            if not sourceTagPK in diff.sourceTags:
+                diff.skippedTagCount += 1
+                continue
+            termPKsByTag.setdefault(targetTagFor(sourceTagPK), []).append(targetTermPKs[sourceTermPK])
+
+    if len(termPKsByTag) > 0:
+        logging.info(f"Merge: tagging terms with {len(termPKsByTag)} tags...")
+        targetTags = {pk: name for name, pk in targetTagPKs.items()}
+        for tagPK, termPKs in termPKsByTag.items():
+            diff.taggedCount += targetDb.applyTagToTermPKeys(deck, Tag(name=targetTags[tagPK], pkey=tagPK), termPKs)
+
+    if applyDeletes and len(diff.deleted) > 0:
+        logging.info(f"Merge: deleting {len(diff.deleted)} terms...")
+        targetDb.deleteTermsByPKeys(deck, [row[ROW_PKEY] for row in diff.deleted])
+
+
+def mergeDecks(sourceDb: DeckDatabase, targetDb: DeckDatabase, deck: Deck, applyDeletes=False):
+    """
+    Merge the source deck database into the target. Returns the DeckDiff
+    that was applied.
+    """
+    targetDb.ensureDeckTablesExist(deck)
+    diff = diffDecks(sourceDb, targetDb)
+    logging.info(f"Merge diff: {diff}")
+    if not diff.isEmpty():
+        applyDiff(diff, targetDb, deck, applyDeletes)
+    return diff
+
+
+def termFromRow(row):
+    return DeckDatabase.queryResultsToTermArray([row])[0]
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 10:27:10 2026
+
+@author: mathaes
+
+Ordered schema migrations for deck databases. Each migration's version
+is the PRAGMA user_version a deck file has once it is applied; the last
+version here must match DECK_SCHEMA_VERSION in deckdatabase.
+
+Never edit a migration that has been released - add a new one.
+"""
+
+from lexilogio.deckdatabase import (
+    DECK_TERMS_TABLE_NAME,
+    DECK_TERMS_ISO_VIEW_NAME,
+    DECK_META_TABLE_NAME,
+    TERM_DELETES_TABLE_NAME,
+    CATEGORY_TABLE_NAME,
+    TAG_TABLE_NAME,
+    TAG_RELATION_TABLE_NAME,
+    TAG_CLOSURE_TABLE_NAME,
+    PREFS_TABLE_NAME,
+    PREF_VALUES_TABLE_NAME,
+    CATEGORY_PREFS_TABLE_NAME,
+    TAG_PREFS_TABLE_NAME,
+    REVIEW_LOG_TABLE_NAME,
+    REVIEW_DAILY_TABLE_NAME,
+    REVIEW_BIN_STATS_TABLE_NAME,
+    INSERT_DEFAULT_PREFS_SQL,
+)
+from lexilogio.deck import Deck
+from lexilogio.deckprefs import encodePrefValue
+from lexilogio.schemamigration import MigrationStep
+
+
+def _createBaseTables(cur):
+    # Version 1 is the original (pre-migration) schema. Older deck files
+    # already have these tables, so everything here is IF NOT EXISTS.
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS {CATEGORY_TABLE_NAME} (
+    pkey INTEGER PRIMARY KEY,
+    category TEXT NOT NULL
+);
+""")
+
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS {TAG_TABLE_NAME} (
+    pkey INTEGER PRIMARY KEY,
+    tag TEXT NOT NULL
+);
+""")
+
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS {DECK_TERMS_TABLE_NAME} (
+    pkey INTEGER PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    category INT NULL,
+    bin INTEGER DEFAULT 0 NOT NULL,
+    reversed_bin INTEGER DEFAULT 0 NOT NULL,
+    last_drill_time TEXT DEFAULT NULL,
+    has_paper_card INT DEFAULT 0,
+    FOREIGN KEY(category) REFERENCES {CATEGORY_TABLE_NAME}(pkey)
+);
+""")
+
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS {TAG_RELATION_TABLE_NAME} (
+    pkey INTEGER PRIMARY KEY,
+    term INTEGER NOT NULL,
+    tag INTEGER NOT NULL,
+    FOREIGN KEY(term) REFERENCES {DECK_TERMS_TABLE_NAME}(pkey),
+    FOREIGN KEY(tag) REFERENCES {TAG_TABLE_NAME}(pkey)
+);
+""")
+
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS {PREFS_TABLE_NAME} (
+    pkey INTEGER PRIMARY KEY,
+    drill_question_count INTEGER DEFAULT 25 NOT NULL,
+    space_repetition_bias INTEGER DEFAULT 1 NOT NULL,
+    reverse_drill INTEGER DEFAULT 0 NOT NULL,
+    category TEXT DEFAULT NULL,
+    bin0_weight REAL DEFAULT 0.36,
+    bin1_weight REAL DEFAULT 0.25,
+    bin2_weight REAL DEFAULT 0.16,
+    bin3_weight REAL DEFAULT 0.11,
+    bin4_weight REAL DEFAULT 0.07,
+    bin5_weight REAL DEFAULT 0.05
+);
+""")
+
+    # default prefs row (category NULL)
+    prefsRow = cur.execute(f"SELECT pkey FROM {PREFS_TABLE_NAME} LIMIT 1;").fetchone()
+    if None == prefsRow:
+        cur.execute(INSERT_DEFAULT_PREFS_SQL)
+
+
+def _createLookupIndexes(cur):
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_terms_category ON {DECK_TERMS_TABLE_NAME} (category);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_terms_bin ON {DECK_TERMS_TABLE_NAME} (bin);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_terms_reversed_bin ON {DECK_TERMS_TABLE_NAME} (reversed_bin);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_tagrel_term ON {TAG_RELATION_TABLE_NAME} (term);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_tagrel_tag ON {TAG_RELATION_TABLE_NAME} (tag);")
+
+
+def _createQuestionIndex(cur):
+    # lets deck merges stream terms in question order without a sort step
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_terms_question ON {DECK_TERMS_TABLE_NAME} (question, pkey);")
+
+
+def _createDrillTimeIndex(cur):
+    # from migration 12, for table rebuilds after it
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_terms_last_drill_time ON {DECK_TERMS_TABLE_NAME} (last_drill_time);")
+
+
+def createRowVersionTriggers(cur):
+    # from migration 13, for table rebuilds after it. Writes that set
+    # row_version themselves (see DeckDatabase.allocateTermVersion) skip
+    # the per-row counter update; all others get the next term version.
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS ver_{DECK_TERMS_TABLE_NAME}_insert
+AFTER INSERT ON {DECK_TERMS_TABLE_NAME} WHEN NEW.row_version = 0
+BEGIN
+    UPDATE {DECK_META_TABLE_NAME} SET term_version = term_version + 1 WHERE pkey = 1;
+    UPDATE {DECK_TERMS_TABLE_NAME} SET row_version = (SELECT term_version FROM {DECK_META_TABLE_NAME} WHERE pkey = 1)
+    WHERE pkey = NEW.pkey;
+END;
+""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS ver_{DECK_TERMS_TABLE_NAME}_update
+AFTER UPDATE OF question, answer, category, bin, reversed_bin, last_drill_time, has_paper_card
+ON {DECK_TERMS_TABLE_NAME} WHEN NEW.row_version = OLD.row_version
+BEGIN
+    UPDATE {DECK_META_TABLE_NAME} SET term_version = term_version + 1 WHERE pkey = 1;
+    UPDATE {DECK_TERMS_TABLE_NAME} SET row_version = (SELECT term_version FROM {DECK_META_TABLE_NAME} WHERE pkey = 1)
+    WHERE pkey = NEW.pkey;
+END;
+""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS ver_{DECK_TERMS_TABLE_NAME}_delete
+AFTER DELETE ON {DECK_TERMS_TABLE_NAME}
+BEGIN
+    UPDATE {DECK_META_TABLE_NAME} SET term_version = term_version + 1 WHERE pkey = 1;
+    INSERT OR REPLACE INTO {TERM_DELETES_TABLE_NAME} (pkey, row_version)
+    SELECT OLD.pkey, term_version FROM {DECK_META_TABLE_NAME} WHERE pkey = 1;
+END;
+""")
+
+
+# tables whose changes bump the deck revision
+REVISION_TRACKED_TABLES = [
+    DECK_TERMS_TABLE_NAME,
+    CATEGORY_TABLE_NAME,
+    TAG_TABLE_NAME,
+    TAG_RELATION_TABLE_NAME,
+    PREFS_TABLE_NAME,
+]
+
+
+def createRevisionTriggers(cur, tableName):
+    for event in ["INSERT", "UPDATE", "DELETE"]:
+        cur.execute(f"""CREATE TRIGGER IF NOT EXISTS rev_{tableName}_{event.lower()}
+AFTER {event} ON {tableName}
+BEGIN
+    UPDATE {DECK_META_TABLE_NAME} SET revision = revision + 1;
+END;
+""")
+
+
+def _createDeckRevision(cur):
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS {DECK_META_TABLE_NAME} (
+    pkey INTEGER PRIMARY KEY,
+    revision INTEGER DEFAULT 0 NOT NULL
+);
+""")
+    cur.execute(f"INSERT INTO {DECK_META_TABLE_NAME} (pkey, revision) VALUES (1, 0);")
+    for tableName in REVISION_TRACKED_TABLES:
+        createRevisionTriggers(cur, tableName)
+
+
+def _uniqueTagRelations(cur):
+    # keep the first of any duplicate (term, tag) rows, then let the
+    # unique index suppress duplicates from bulk tagging
+    cur.execute(f"""DELETE FROM {TAG_RELATION_TABLE_NAME} WHERE pkey NOT IN (
+    SELECT MIN(pkey) FROM {TAG_RELATION_TABLE_NAME} GROUP BY term, tag
+);""")
+    cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_tagrel_term_tag ON {TAG_RELATION_TABLE_NAME} (term, tag);")
+    # (term) lookups are covered by the unique index
+    cur.execute("DROP INDEX IF EXISTS idx_tagrel_term;")
+
+
+def _createTermIndexes(cur):
+    # indexes on deck_terms from migrations 2 and 3, for table rebuilds
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_terms_category ON {DECK_TERMS_TABLE_NAME} (category);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_terms_bin ON {DECK_TERMS_TABLE_NAME} (bin);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_terms_reversed_bin ON {DECK_TERMS_TABLE_NAME} (reversed_bin);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_terms_question ON {DECK_TERMS_TABLE_NAME} (question, pkey);")
+
+
+def _tableExists(cur, tableName):
+    row = cur.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?;", [tableName]
+    ).fetchone()
+    return None != row
+
+
+def _copyRowsBatch(cur, tableName, newTableName, newTableSQL, columnExprs, batchSize):
+    """
+    Copy the next batchSize rows of tableName (all remaining rows if
+    batchSize is None), in pkey order, into newTableName and return the
+    number of rows copied. columnExprs maps the new table's columns to
+    SQL expressions over a row of tableName, written with a {row} prefix
+    for its columns.
+
+    The first call creates newTableName with newTableSQL, and triggers
+    that carry later updates and deletes of rows already copied over to
+    it, so writes made between the batches of an online migration are
+    kept. Rows inserted later have larger pkeys and are copied by a later
+    batch. The triggers are dropped along with tableName.
+    """
+    if not _tableExists(cur, newTableName):
+        cur.execute(newTableSQL)
+        setSQL = ", ".join([f"{column} = {expr.format(row='NEW.')}" for column, expr in columnExprs])
+        cur.execute(f"""CREATE TRIGGER copy_{tableName}_update AFTER UPDATE ON {tableName}
+BEGIN
+    UPDATE {newTableName} SET {setSQL} WHERE pkey = NEW.pkey;
+END;
+""")
+        cur.execute(f"""CREATE TRIGGER copy_{tableName}_delete AFTER DELETE ON {tableName}
+BEGIN
+    DELETE FROM {newTableName} WHERE pkey = OLD.pkey;
+END;
+""")
+
+    lastPKey = cur.execute(f"SELECT COALESCE(MAX(pkey), 0) FROM {newTableName};").fetchone()[0]
+    columnsSQL = ", ".join([column for column, expr in columnExprs])
+    exprsSQL = ", ".join([expr.format(row="") for column, expr in columnExprs])
+    # LIMIT -1 is no limit
+    cur.execute(
+        f"""INSERT INTO {newTableName} ({columnsSQL})
+SELECT {exprsSQL} FROM {tableName} WHERE pkey > ? ORDER BY pkey LIMIT ?;""",
+        [lastPKey, -1 if None == batchSize else batchSize],
+    )
+    return cur.rowcount
+
+
+_TERM_V6_COLUMNS = ["pkey", "question", "answer", "category", "bin", "reversed_bin", "last_drill_time", "has_paper_card"]
+
+
+def _copyForeignKeyTables(cur, batchSize):
+    # SQLite cannot alter constraints, so both tables are rebuilt; the
+    # terms are copied first, then their tag relations
+    rowCount = _copyRowsBatch(
+        cur,
+        DECK_TERMS_TABLE_NAME,
+        f"{DECK_TERMS_TABLE_NAME}_v6",
+        f"""CREATE TABLE {DECK_TERMS_TABLE_NAME}_v6 (
+    pkey INTEGER PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    category INT NULL,
+    bin INTEGER DEFAULT 0 NOT NULL,
+    reversed_bin INTEGER DEFAULT 0 NOT NULL,
+    last_drill_time TEXT DEFAULT NULL,
+    has_paper_card INT DEFAULT 0,
+    FOREIGN KEY(category) REFERENCES {CATEGORY_TABLE_NAME}(pkey) ON DELETE SET NULL
+);
+""",
+        [(column, "{row}" + column) for column in _TERM_V6_COLUMNS],
+        batchSize,
+    )
+    if None != batchSize and rowCount >= batchSize:
+        return rowCount
+
+    return rowCount + _copyRowsBatch(
+        cur,
+        TAG_RELATION_TABLE_NAME,
+        f"{TAG_RELATION_TABLE_NAME}_v6",
+        f"""CREATE TABLE {TAG_RELATION_TABLE_NAME}_v6 (
+    pkey INTEGER PRIMARY KEY,
+    term INTEGER NOT NULL,
+    tag INTEGER NOT NULL,
+    FOREIGN KEY(term) REFERENCES {DECK_TERMS_TABLE_NAME}(pkey) ON DELETE CASCADE,
+    FOREIGN KEY(tag) REFERENCES {TAG_TABLE_NAME}(pkey) ON DELETE CASCADE
+);
+""",
+        [(column, "{row}" + column) for column in ["pkey", "term", "tag"]],
+        None if None == batchSize else batchSize - rowCount,
+    )
+
+
+def _enforceForeignKeys(cur):
+    # imported here to avoid a module import cycle
+    from lexilogio.deckintegrity import tagRelationChecks, termCategoryCheck
+    from lexilogio.shardeddeckdatabase import SHARD_CONFIG_TABLE_NAME, SHARD_KEYS_TABLE_NAME
+
+    # copy the rows not copied by the online batches, then swap in the
+    # rebuilt tables (this runs with foreign key enforcement off, see
+    # DeckDatabase.migrateSchema)
+    _copyForeignKeyTables(cur, None)
+    cur.execute(f"DROP TABLE {DECK_TERMS_TABLE_NAME};")
+    cur.execute(f"ALTER TABLE {DECK_TERMS_TABLE_NAME}_v6 RENAME TO {DECK_TERMS_TABLE_NAME};")
+    _createTermIndexes(cur)
+    createRevisionTriggers(cur, DECK_TERMS_TABLE_NAME)
+
+    cur.execute(f"DROP TABLE {TAG_RELATION_TABLE_NAME};")
+    cur.execute(f"ALTER TABLE {TAG_RELATION_TABLE_NAME}_v6 RENAME TO {TAG_RELATION_TABLE_NAME};")
+    cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_tagrel_term_tag ON {TAG_RELATION_TABLE_NAME} (term, tag);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_tagrel_tag ON {TAG_RELATION_TABLE_NAME} (tag);")
+    createRevisionTriggers(cur, TAG_RELATION_TABLE_NAME)
+
+    # Remove orphans; in the main file of a sharded deck the terms are in
+    # the shards and only their keys are here.
+    termTableName = DECK_TERMS_TABLE_NAME
+    if _tableExists(cur, SHARD_CONFIG_TABLE_NAME):
+        termTableName = SHARD_KEYS_TABLE_NAME
+    for check in tagRelationChecks(termTableName):
+        cur.execute(check.repairSQL)
+    # shard files have no categories of their own; skip them
+    if None != cur.execute(f"SELECT 1 FROM {CATEGORY_TABLE_NAME} LIMIT 1;").fetchone():
+        cur.execute(termCategoryCheck().repairSQL)
+
+
+def _addTagHierarchy(cur):
+    cur.execute(f"ALTER TABLE {TAG_TABLE_NAME} ADD COLUMN parent INTEGER DEFAULT NULL REFERENCES {TAG_TABLE_NAME}(pkey);")
+    cur.execute(f"""CREATE TABLE {TAG_CLOSURE_TABLE_NAME} (
+    ancestor INTEGER NOT NULL,
+    descendant INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor, descendant),
+    FOREIGN KEY(ancestor) REFERENCES {TAG_TABLE_NAME}(pkey) ON DELETE CASCADE,
+    FOREIGN KEY(descendant) REFERENCES {TAG_TABLE_NAME}(pkey) ON DELETE CASCADE
+) WITHOUT ROWID;
+""")
+    cur.execute(f"CREATE INDEX idx_tagclosure_descendant ON {TAG_CLOSURE_TABLE_NAME} (descendant, ancestor);")
+    # existing tags are all top level
+    cur.execute(f"""INSERT INTO {TAG_CLOSURE_TABLE_NAME} (ancestor, descendant, depth)
+SELECT pkey, pkey, 0 FROM {TAG_TABLE_NAME};""")
+
+
+def _addPrefValues(cur):
+    cur.execute(f"""CREATE TABLE {PREF_VALUES_TABLE_NAME} (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+""")
+    createRevisionTriggers(cur, PREF_VALUES_TABLE_NAME)
+
+    # carry over the single prefs row; keys without a row read as defaults
+    if _tableExists(cur, PREFS_TABLE_NAME):
+        row = cur.execute(f"""SELECT drill_question_count, space_repetition_bias, reverse_drill,
+    bin0_weight, bin1_weight, bin2_weight, bin3_weight, bin4_weight, bin5_weight
+FROM {PREFS_TABLE_NAME} ORDER BY pkey LIMIT 1;""").fetchone()
+        if None != row:
+            values = {
+                Deck.PREFSKEY_QUESTION_COUNT: int(row[0]),
+                Deck.PREFSKEY_SPACED_REPETITION: int(row[1]) != 0,
+                Deck.PREFSKEY_REVERSED_DRILL: int(row[2]) != 0,
+                Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION: {n: float(row[3 + n]) for n in range(0, 6)},
+            }
+            cur.executemany(
+                f"INSERT INTO {PREF_VALUES_TABLE_NAME} (key, value) VALUES (?, ?);",
+                [(key, encodePrefValue(key, value)) for key, value in values.items()],
+            )
+        cur.execute(f"DROP TABLE {PREFS_TABLE_NAME};")
+
+
+def _addScopedPrefs(cur):
+    for tableName, scopeColumn, scopeTableName in [
+        (CATEGORY_PREFS_TABLE_NAME, "category", CATEGORY_TABLE_NAME),
+        (TAG_PREFS_TABLE_NAME, "tag", TAG_TABLE_NAME),
+    ]:
+        cur.execute(f"""CREATE TABLE {tableName} (
+    {scopeColumn} INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY ({scopeColumn}, key),
+    FOREIGN KEY({scopeColumn}) REFERENCES {scopeTableName}(pkey) ON DELETE CASCADE
+) WITHOUT ROWID;
+""")
+        createRevisionTriggers(cur, tableName)
+
+
+def _addReviewLog(cur):
+    # no foreign keys: the log outlives deleted terms and categories, and
+    # in sharded decks the terms are in other files
+    cur.execute(f"""CREATE TABLE {REVIEW_LOG_TABLE_NAME} (
+    pkey INTEGER PRIMARY KEY,
+    term INTEGER NOT NULL,
+    category INTEGER DEFAULT NULL,
+    review_time INTEGER NOT NULL,
+    rating INTEGER NOT NULL,
+    reversed INTEGER DEFAULT 0 NOT NULL,
+    response_ms INTEGER DEFAULT NULL,
+    previous_bin INTEGER DEFAULT NULL,
+    interval_seconds INTEGER DEFAULT NULL
+);
+""")
+    cur.execute(f"CREATE INDEX idx_reviewlog_term ON {REVIEW_LOG_TABLE_NAME} (term, review_time);")
+    cur.execute(f"CREATE INDEX idx_reviewlog_time ON {REVIEW_LOG_TABLE_NAME} (review_time);")
+    cur.execute(f"""CREATE TABLE {REVIEW_DAILY_TABLE_NAME} (
+    day INTEGER NOT NULL,
+    category INTEGER NOT NULL,
+    reversed INTEGER NOT NULL,
+    interval_bucket INTEGER NOT NULL,
+    review_count INTEGER DEFAULT 0 NOT NULL,
+    recalled_count INTEGER DEFAULT 0 NOT NULL,
+    response_ms_total INTEGER DEFAULT 0 NOT NULL,
+    response_count INTEGER DEFAULT 0 NOT NULL,
+    PRIMARY KEY (day, category, reversed, interval_bucket)
+) WITHOUT ROWID;
+""")
+
+
+def _addReviewBinStats(cur):
+    cur.execute(f"""CREATE TABLE {REVIEW_BIN_STATS_TABLE_NAME} (
+    previous_bin INTEGER NOT NULL,
+    interval_bucket INTEGER NOT NULL,
+    review_count INTEGER DEFAULT 0 NOT NULL,
+    recalled_count INTEGER DEFAULT 0 NOT NULL,
+    interval_seconds_total INTEGER DEFAULT 0 NOT NULL,
+    PRIMARY KEY (previous_bin, interval_bucket)
+) WITHOUT ROWID;
+""")
+    # review log rows up to this pkey are counted in the bin stats
+    cur.execute(f"ALTER TABLE {DECK_META_TABLE_NAME} ADD COLUMN tuned_review_pkey INTEGER DEFAULT 0 NOT NULL;")
+
+
+def _copyEpochDrillTimes(cur, batchSize):
+    # SQLite cannot change a column type, so rebuild deck_terms with an
+    # INTEGER last_drill_time (a TEXT column would store the epoch seconds
+    # as text). The old values are naive UTC ISO-8601 strings; anything
+    # strftime cannot parse becomes NULL (never drilled).
+    columnExprs = [(column, "{row}" + column) for column in _TERM_V6_COLUMNS]
+    columnExprs[_TERM_V6_COLUMNS.index("last_drill_time")] = (
+        "last_drill_time",
+        "CAST(strftime('%s', {row}last_drill_time) AS INTEGER)",
+    )
+    return _copyRowsBatch(
+        cur,
+        DECK_TERMS_TABLE_NAME,
+        f"{DECK_TERMS_TABLE_NAME}_v12",
+        f"""CREATE TABLE {DECK_TERMS_TABLE_NAME}_v12 (
+    pkey INTEGER PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    category INT NULL,
+    bin INTEGER DEFAULT 0 NOT NULL,
+    reversed_bin INTEGER DEFAULT 0 NOT NULL,
+    last_drill_time INTEGER DEFAULT NULL,
+    has_paper_card INT DEFAULT 0,
+    FOREIGN KEY(category) REFERENCES {CATEGORY_TABLE_NAME}(pkey) ON DELETE SET NULL
+);
+""",
+        columnExprs,
+        batchSize,
+    )
+
+
+def _epochDrillTimes(cur):
+    # copy the rows not copied by the online batches, then swap in the
+    # rebuilt table
+    _copyEpochDrillTimes(cur, None)
+    cur.execute(f"DROP TABLE {DECK_TERMS_TABLE_NAME};")
+    cur.execute(f"ALTER TABLE {DECK_TERMS_TABLE_NAME}_v12 RENAME TO {DECK_TERMS_TABLE_NAME};")
+    _createTermIndexes(cur)
+    _createDrillTimeIndex(cur)
+    createRevisionTriggers(cur, DECK_TERMS_TABLE_NAME)
+
+    cur.execute(f"""CREATE VIEW {DECK_TERMS_ISO_VIEW_NAME} AS
+SELECT pkey, question, answer, category, bin, reversed_bin,
+    strftime('%Y-%m-%dT%H:%M:%S', last_drill_time, 'unixepoch') AS last_drill_time,
+    has_paper_card
+FROM {DECK_TERMS_TABLE_NAME};""")
+
+
+def _addTermRowVersions(cur):
+    # every term write stores the deck's next term version in the row, so
+    # writers can detect that a row changed since they read it, and
+    # readers can fetch just the rows changed since a version they hold
+    cur.execute(f"ALTER TABLE {DECK_META_TABLE_NAME} ADD COLUMN term_version INTEGER DEFAULT 0 NOT NULL;")
+    cur.execute(f"ALTER TABLE {DECK_TERMS_TABLE_NAME} ADD COLUMN row_version INTEGER DEFAULT 0 NOT NULL;")
+    cur.execute(f"""CREATE TABLE {TERM_DELETES_TABLE_NAME} (
+    pkey INTEGER PRIMARY KEY,
+    row_version INTEGER NOT NULL
+);
+""")
+    cur.execute(f"CREATE INDEX idx_terms_row_version ON {DECK_TERMS_TABLE_NAME} (row_version);")
+    cur.execute(f"CREATE INDEX idx_term_deletes_row_version ON {TERM_DELETES_TABLE_NAME} (row_version);")
+    createRowVersionTriggers(cur)
+
+
+DECK_MIGRATIONS = [
+    MigrationStep(1, "create deck tables", _createBaseTables),
+    MigrationStep(2, "add category, bin and tag lookup indexes", _createLookupIndexes),
+    MigrationStep(3, "add question index", _createQuestionIndex),
+    MigrationStep(4, "add deck revision counter", _createDeckRevision),
+    MigrationStep(5, "make tag relations unique per term and tag", _uniqueTagRelations),
+    MigrationStep(
+        6, "add cascading foreign keys and remove orphaned rows", _enforceForeignKeys, _copyForeignKeyTables
+    ),
+    MigrationStep(7, "add tag hierarchy with closure table", _addTagHierarchy),
+    MigrationStep(8, "move deck prefs to a key/value table", _addPrefValues),
+    MigrationStep(9, "add per-category and per-tag pref overrides", _addScopedPrefs),
+    MigrationStep(10, "add review log and daily review rollups", _addReviewLog),
+    MigrationStep(11, "add review stats by bin for bin tuning", _addReviewBinStats),
+    MigrationStep(
+        12, "store drill times as epoch seconds, with an index", _epochDrillTimes, _copyEpochDrillTimes
+    ),
+    MigrationStep(13, "add term row versions for concurrent writers", _addTermRowVersions),
+]
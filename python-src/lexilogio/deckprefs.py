@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 20:12:36 2026
+
+@author: mathaes
+
+Typed deck preferences. Each preference is stored as one key/value row
+(see DeckDatabase.readDeckPreferences and updateDeckPreferences), its
+value JSON-encoded and checked against the type in its PrefDefinition,
+so a changed setting is written as one row and a missing row reads as
+the definition's default.
+"""
+
+import json
+
+from lexilogio.deck import Deck
+
+PREF_TYPE_INT = "int"
+PREF_TYPE_FLOAT = "float"
+PREF_TYPE_BOOL = "bool"
+PREF_TYPE_STRING = "string"
+# dict of bin number (0-5) -> float (a weight or interval), stored as a list
+PREF_TYPE_BIN_WEIGHTS = "bin_weights"
+
+BIN_COUNT = 6
+
+DEFAULT_BIN_REVIEW_INTERVAL_DAYS = {0: 0.0, 1: 1.0, 2: 2.0, 3: 4.0, 4: 8.0, 5: 16.0}
+
+
+class PrefDefinition:
+    def __init__(self, key, prefType, default):
+        self.key = key
+        self.prefType = prefType
+        self.default = default
+
+
+DECK_PREF_DEFINITIONS = {
+    d.key: d
+    for d in [
+        PrefDefinition(Deck.PREFSKEY_QUESTION_COUNT, PREF_TYPE_INT, 25),
+        PrefDefinition(Deck.PREFSKEY_SPACED_REPETITION, PREF_TYPE_BOOL, True),
+        PrefDefinition(Deck.PREFSKEY_REVERSED_DRILL, PREF_TYPE_BOOL, False),
+        PrefDefinition(
+            Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION,
+            PREF_TYPE_BIN_WEIGHTS,
+            {0: 0.36, 1: 0.25, 2: 0.16, 3: 0.11, 4: 0.07, 5: 0.05},
+        ),
+        PrefDefinition(
+            Deck.PREFSKEY_SPACED_BIN_INTERVALS,
+            PREF_TYPE_BIN_WEIGHTS,
+            DEFAULT_BIN_REVIEW_INTERVAL_DAYS,
+        ),
+        PrefDefinition(Deck.PREFSKEY_RETENTION_TARGET, PREF_TYPE_FLOAT, 0.9),
+    ]
+}
+
+
+def getPrefDefinition(key):
+    definition = DECK_PREF_DEFINITIONS.get(key)
+    if None == definition:
+        raise Exception(f"Unknown deck preference: {key}")
+    return definition
+
+
+def defaultPrefs():
+    return {key: checkPrefValue(key, d.default) for key, d in DECK_PREF_DEFINITIONS.items()}
+
+
+def checkPrefValue(key, value):
+    """
+    Return value converted to the type of preference key, or raise if it
+    cannot be.
+    """
+    prefType = getPrefDefinition(key).prefType
+    try:
+        if prefType == PREF_TYPE_INT:
+            if type(value) == bool or int(value) != value:
+                raise ValueError(value)
+            return int(value)
+        elif prefType == PREF_TYPE_FLOAT:
+            return float(value)
+        elif prefType == PREF_TYPE_BOOL:
+            if not type(value) == bool and not value in [0, 1]:
+                raise ValueError(value)
+            return bool(value)
+        elif prefType == PREF_TYPE_STRING:
+            if not type(value) == str:
+                raise ValueError(value)
+            return value
+        elif prefType == PREF_TYPE_BIN_WEIGHTS:
+            weights = {int(n): float(w) for n, w in dict(value).items()}
+            if sorted(weights.keys()) != list(range(0, BIN_COUNT)):
+                raise ValueError(value)
+            return weights
+    except (TypeError, ValueError):
+        raise Exception(f"Invalid value for deck preference {key} ({prefType}): {value!r}")
+    raise Exception(f"Unsupported preference type {prefType} for {key}")
+
+
+def encodePrefValue(key, value):
+    value = checkPrefValue(key, value)
+    if getPrefDefinition(key).prefType == PREF_TYPE_BIN_WEIGHTS:
+        value = [value[n] for n in range(0, BIN_COUNT)]
+    return json.dumps(value)
+
+
+def decodePrefValue(key, text):
+    value = json.loads(text)
+    if getPrefDefinition(key).prefType == PREF_TYPE_BIN_WEIGHTS:
+        value = {n: w for n, w in enumerate(value)}
+    return checkPrefValue(key, value)
+
+
+def changedPrefs(currentPrefs, newPrefs):
+    """
+    Return the entries of newPrefs (checked and converted) whose value
+    differs from currentPrefs.
+    """
+    changes = {}
+    for key, value in newPrefs.items():
+        value = checkPrefValue(key, value)
+        if currentPrefs.get(key) != value:
+            changes[key] = value
+    return changes
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 23:57:02 2026
+
+@author: mathaes
+
+Search all decks of a data directory at once.
+
+Each deck is searched on a worker thread (SQLite releases the GIL while
+it runs a query) through read-only connections to its files, so a search
+never migrates, locks or loads a deck. The criteria are compiled with
+DeckDatabase.compileQueryCriteria; category and tag criteria are matched
+by name, since their pkeys differ from deck to deck. Results are yielded
+per deck as each deck finishes, and merged into one ranked list by
+mergeSearchHits.
+"""
+
+import heapq
+import time
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from lexilogio.category import Category
+from lexilogio.tag import Tag
+from lexilogio.deckcatalog import DeckCatalog, shardFilePaths, readOnlyConnection
+from lexilogio.deckdatabase import (
+    DeckDatabase,
+    QueryCriterion,
+    DECK_TERMS_TABLE_NAME,
+    DECK_TERMS_COLUMN_NAMES,
+    CATEGORY_TABLE_NAME,
+    TAG_TABLE_NAME,
+    TAG_RELATION_TABLE_NAME,
+)
+
+DEFAULT_SEARCH_WORKERS = 8
+
+# match ranks, best first
+MATCH_EXACT = 0
+MATCH_PREFIX = 1
+MATCH_WORD = 2
+MATCH_OTHER = 3
+
+
+def textCriteriaLists(text):
+    """
+    Criteria lists for terms with text anywhere in their question or
+    answer ('*' matches anything, as in QueryCriterion).
+    """
+    pattern = f"*{text.strip('*')}*"
+    return [[QueryCriterion.question(pattern)], [QueryCriterion.answer(pattern)]]
+
+
+def matchRank(term, texts):
+    """
+    How well the term's question or answer matches the best of texts:
+    MATCH_EXACT, MATCH_PREFIX, MATCH_WORD (one of its words) or
+    MATCH_OTHER.
+    """
+    rank = MATCH_OTHER
+    for field in [term.question.lower(), term.answer.lower()]:
+        for text in texts:
+            if field == text:
+                return MATCH_EXACT
+            elif field.startswith(text):
+                rank = min(rank, MATCH_PREFIX)
+            elif text in field.split():
+                rank = min(rank, MATCH_WORD)
+    return rank
+
+
+class SearchHit:
+    """
+    A term found in deck deckName, with the name of its category there.
+    """
+
+    def __init__(self, deckName, term, categoryName, rank):
+        self.deckName = deckName
+        self.term = term
+        self.categoryName = categoryName
+        self.rank = rank
+
+    def sortKey(self):
+        return (self.rank, len(self.term.question), self.term.question.lower(), self.deckName, self.term.pkey)
+
+    def __lt__(self, other):
+        return self.sortKey() < other.sortKey()
+
+    def __repr__(self):
+        return f"[{self.deckName}/{self.categoryName}] {self.term}"
+
+
+class DeckSearchResult:
+    """
+    The hits in one deck, ranked; error is set instead if the deck could
+    not be searched.
+    """
+
+    def __init__(self, deckName, hits, seconds, error=None):
+        self.deckName = deckName
+        self.hits = hits
+        self.seconds = seconds
+        self.error = error
+
+
+def mergeSearchHits(deckResults, limit=None):
+    """
+    Merge the ranked hits of DeckSearchResults into one ranked list of
+    at most limit hits.
+    """
+    merged = heapq.merge(*[result.hits for result in deckResults])
+    hits = []
+    for hit in merged:
+        if None != limit and len(hits) >= limit:
+            break
+        hits.append(hit)
+    return hits
+
+
+class DeckSearch:
+    def __init__(self, dataDir, workerCount=DEFAULT_SEARCH_WORKERS):
+        self.dataDir = dataDir
+        self.workerCount = workerCount
+
+    def deckPaths(self):
+        return [(entry.deckName, entry.path) for entry in DeckCatalog(self.dataDir).refresh()]
+
+    def search(self, queryCriteriaLists, limit=None):
+        """
+        All hits for queryCriteriaLists in all decks, ranked; see
+        iterDeckResults. Decks that could not be searched are logged.
+        """
+        deckResults = []
+        for result in self.iterDeckResults(queryCriteriaLists):
+            if None != result.error:
+                logging.warning(f"Could not search deck {result.deckName}: {result.error}")
+            deckResults.append(result)
+        return mergeSearchHits(deckResults, limit)
+
+    def iterDeckResults(self, queryCriteriaLists, deckPaths=None):
+        """
+        Search the decks (all in the data dir unless deckPaths, a list
+        of (deckName, path)) for terms matching any of the criteria
+        lists, and yield a DeckSearchResult for each deck as soon as it
+        is done. Hits are ranked by how well they match the question and
+        answer criteria (see matchRank), then by question.
+        """
+        if None == deckPaths:
+            deckPaths = self.deckPaths()
+        if len(deckPaths) == 0:
+            return
+
+        texts = []
+        for criteriaList in queryCriteriaLists:
+            for cr in criteriaList:
+                if cr.criterionType in [QueryCriterion.QUESTION, QueryCriterion.ANSWER]:
+                    texts.append(cr.value.strip("*").lower())
+
+        workerCount = max(1, min(self.workerCount, len(deckPaths), os.cpu_count() or 1))
+        with ThreadPoolExecutor(max_workers=workerCount, thread_name_prefix="lexilogio-search") as executor:
+            futures = [
+                executor.submit(DeckSearch.searchDeck, deckName, path, queryCriteriaLists, texts)
+                for deckName, path in deckPaths
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def searchDeck(deckName, path, queryCriteriaLists, texts):
+        startTime = time.perf_counter()
+        con = readOnlyConnection(path)
+        try:
+            termsByPK = {}
+            for criteriaList in queryCriteriaLists:
+                localCriteria = DeckSearch.localizeCriteria(con, criteriaList)
+                if None == localCriteria:
+                    # a category or tag this deck does not have
+                    continue
+                for term in DeckSearch.queryDeckFiles(con, path, localCriteria):
+                    termsByPK[term.pkey] = term
+
+            categoryNames = dict(con.execute(f"SELECT pkey, category FROM {CATEGORY_TABLE_NAME};").fetchall())
+        except sqlite3.Error as ex:
+            return DeckSearchResult(deckName, [], time.perf_counter() - startTime, ex)
+        finally:
+            con.close()
+
+        hits = [
+            SearchHit(deckName, term, categoryNames.get(term.category), matchRank(term, texts))
+            for term in termsByPK.values()
+        ]
+        hits.sort()
+        return DeckSearchResult(deckName, hits, time.perf_counter() - startTime)
+
+    def localizeCriteria(con, criteriaList):
+        """
+        Copy criteriaList with its categories and tags replaced by the
+        ones of the same name in the deck of con. Returns None if no term
+        there can match: a category or tag missing from the deck leaves
+        nothing to match when it was the only one OR'ed.
+        """
+        categoryPKs = dict(con.execute(f"SELECT category, pkey FROM {CATEGORY_TABLE_NAME};").fetchall())
+        tagPKs = None
+
+        localCriteria = []
+        hadCategory = False
+        hadAnyTag = False
+        for cr in criteriaList:
+            if cr.criterionType == QueryCriterion.CATEGORY:
+                hadCategory = True
+                name = cr.value.name if isinstance(cr.value, Category) else str(cr.value)
+                if name in categoryPKs:
+                    localCriteria.append(QueryCriterion.category(Category(name, categoryPKs[name])))
+            elif cr.criterionType in QueryCriterion.TAG_CRITERION_TYPES:
+                if None == tagPKs:
+                    tagPKs = dict(con.execute(f"SELECT tag, pkey FROM {TAG_TABLE_NAME};").fetchall())
+                name = cr.value.name if isinstance(cr.value, Tag) else str(cr.value)
+                if cr.criterionType != QueryCriterion.REQUIREDTAG:
+                    hadAnyTag = True
+                if name in tagPKs:
+                    localCriteria.append(QueryCriterion(cr.criterionType, Tag(name, tagPKs[name])))
+                elif cr.criterionType == QueryCriterion.REQUIREDTAG:
+                    return None
+            else:
+                localCriteria.append(cr)
+
+        def hasType(types):
+            return len([cr for cr in localCriteria if cr.criterionType in types]) > 0
+
+        if hadCategory and not hasType([QueryCriterion.CATEGORY]):
+            return None
+        if hadAnyTag and not hasType([QueryCriterion.TAG, QueryCriterion.TAGTREE]):
+            return None
+        return localCriteria
+
+    def queryDeckFiles(con, path, localCriteria):
+        """
+        The terms matching localCriteria in the deck at path (con), read
+        from its shard files if it is sharded.
+        """
+        whereClauseSQL, params, tagCriteria = DeckDatabase.compileQueryCriteria(localCriteria)
+
+        taggedPKs = None
+        if len(tagCriteria) > 0:
+            # the tag relations are in the main file, also for sharded
+            # decks; every tagged term has a relation row
+            tagClauses = []
+            tagParams = []
+            DeckDatabase.appendTagClauses(tagClauses, tagParams, tagCriteria)
+            rows = con.execute(
+                f"SELECT pkey FROM (SELECT DISTINCT term AS pkey FROM {TAG_RELATION_TABLE_NAME})"
+                f" WHERE {' AND '.join([f'({tc})' for tc in tagClauses])};",
+                tagParams,
+            ).fetchall()
+            taggedPKs = set([row[0] for row in rows])
+            if len(taggedPKs) == 0:
+                return []
+
+        columnNamesCommaStr = ",".join(DECK_TERMS_COLUMN_NAMES)
+        querySQL = f"SELECT {columnNamesCommaStr} FROM {DECK_TERMS_TABLE_NAME}{whereClauseSQL};"
+
+        shardPaths = shardFilePaths(path)
+        rows = []
+        if len(shardPaths) == 0:
+            rows = con.execute(querySQL, params).fetchall()
+        for shardPath in shardPaths:
+            shardCon = readOnlyConnection(shardPath)
+            try:
+                rows.extend(shardCon.execute(querySQL, params).fetchall())
+            finally:
+                shardCon.close()
+
+        terms = DeckDatabase.queryResultsToTermArray(rows) if len(rows) > 0 else []
+        if None != taggedPKs:
+            terms = [term for term in terms if term.pkey in taggedPKs]
+        return terms
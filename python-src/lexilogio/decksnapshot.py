@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:21:36 2026
+
+@author: mathaes
+
+Binary deck snapshots, written next to the deck database as
+lexilogio_<deck>.db.snapshot so a deck can be loaded without running the
+term, category, tag and relation queries.
+
+File layout (all integers little-endian):
+    header          SNAPSHOT_HEADER
+    string offsets  (stringCount + 1) x uint32, into the string blob
+    terms           termCount x TERM_RECORD
+    categories      categoryCount x NAMED_RECORD
+    tags            tagCount x TAG_RECORD
+    relations       relationCount x RELATION_RECORD (term pkey, tag pkey)
+    string blob     UTF-8, strings deduplicated
+
+Strings are referenced by index into the string table; NO_STRING marks a
+NULL. The file is memory-mapped on load; terms are decoded from their
+records on first access, and question/answer text only when read.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import MutableSequence
+
+from lexilogio.category import Category
+from lexilogio.deck import Deck
+from lexilogio.deckprefs import checkPrefValue
+from lexilogio.tag import Tag
+from lexilogio.term import Term
+
+SNAPSHOT_MAGIC = b"LXSNAP\x00\x00"
+SNAPSHOT_FORMAT_VERSION = 5
+
+# magic, format version, deck revision, term/category/tag/relation/string
+# counts, prefs JSON string index (deck prefs and pref overrides)
+SNAPSHOT_HEADER = struct.Struct("<8sIqIIIIII")
+STRING_OFFSET = struct.Struct("<I")
+# pkey, question, answer, category (-1 for none), bin, reversed bin,
+# paper card flag, pad, last drill time (epoch seconds, -1 for none),
+# row version (-1 for unknown)
+TERM_RECORD = struct.Struct("<qIIqbbbxqq")
+NAMED_RECORD = struct.Struct("<qI")
+# pkey, name, parent tag pkey (-1 for none)
+TAG_RECORD = struct.Struct("<qIq")
+RELATION_RECORD = struct.Struct("<qq")
+
+NO_STRING = 0xFFFFFFFF
+NO_CATEGORY = -1
+NO_DRILL_TIME = -1
+NO_ROW_VERSION = -1
+NO_PARENT_TAG = -1
+
+
+def snapshotPathForDatabasePath(dbPath):
+    return f"{dbPath}.snapshot"
+
+
+class StringTableBuilder:
+    def __init__(self):
+        self.strings = []
+        self.indexes = {}
+
+    def add(self, value):
+        if None == value:
+            return NO_STRING
+        value = str(value)
+        if not value in self.indexes:
+            self.indexes[value] = len(self.strings)
+            self.strings.append(value)
+        return self.indexes[value]
+
+
+def writeDeckSnapshot(deck: Deck, revision: int, path):
+    """
+    Write the deck to a snapshot file at path, recording the deck
+    revision it was loaded at. The file is replaced atomically.
+    """
+    strings = StringTableBuilder()
+
+    termRecords = bytearray()
+    for term in deck.terms:
+        category = term.category
+        if None == category:
+            category = NO_CATEGORY
+        termRecords += TERM_RECORD.pack(
+            term.pkey,
+            strings.add(term.question),
+            strings.add(term.answer),
+            category,
+            term.bin,
+            term.reversedBin,
+            1 if term.hasPaperCard else 0,
+            NO_DRILL_TIME if None == term.lastDrillTime else term.lastDrillTime,
+            NO_ROW_VERSION if None == term.rowVersion else term.rowVersion,
+        )
+
+    categoryRecords = bytearray()
+    for cat in deck.categories:
+        categoryRecords += NAMED_RECORD.pack(cat.pkey, strings.add(cat.name))
+
+    tagRecords = bytearray()
+    for tag in deck.tags:
+        tagRecords += TAG_RECORD.pack(
+            tag.pkey, strings.add(tag.name), NO_PARENT_TAG if None == tag.parent else tag.parent
+        )
+
+    relationRecords = bytearray()
+    relationCount = 0
+    for termPK, tagPKs in deck.termToTags.items():
+        for tagPK in tagPKs:
+            relationRecords += RELATION_RECORD.pack(termPK, tagPK)
+            relationCount += 1
+
+    prefsIndex = strings.add(
+        json.dumps(
+            {
+                "prefs": deck.prefs,
+                "scopedPrefs": [
+                    [scope, scopePK, key, value]
+                    for (scope, scopePK), overrides in deck.scopedPrefs.items()
+                    for key, value in overrides.items()
+                ],
+            }
+        )
+    )
+
+    encodedStrings = [s.encode("utf-8") for s in strings.strings]
+    stringOffsets = bytearray()
+    offset = 0
+    for encoded in encodedStrings:
+        stringOffsets += STRING_OFFSET.pack(offset)
+        offset += len(encoded)
+    stringOffsets += STRING_OFFSET.pack(offset)
+
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_FORMAT_VERSION,
+        revision,
+        len(deck.terms),
+        len(deck.categories),
+        len(deck.tags),
+        relationCount,
+        len(encodedStrings),
+        prefsIndex,
+    )
+
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, "wb") as snapshotFile:
+        snapshotFile.write(header)
+        snapshotFile.write(stringOffsets)
+        snapshotFile.write(termRecords)
+        snapshotFile.write(categoryRecords)
+        snapshotFile.write(tagRecords)
+        snapshotFile.write(relationRecords)
+        for encoded in encodedStrings:
+            snapshotFile.write(encoded)
+    os.replace(tmpPath, path)
+
+
+class DeckSnapshot:
+    """
+    A memory-mapped snapshot file. Call close() once the deck loaded
+    from it is no longer used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            formatVersion,
+            self.revision,
+            self.termCount,
+            self.categoryCount,
+            self.tagCount,
+            self.relationCount,
+            self.stringCount,
+            self.prefsIndex,
+        ) = SNAPSHOT_HEADER.unpack_from(self.buffer, 0)
+
+        if magic != SNAPSHOT_MAGIC or formatVersion != SNAPSHOT_FORMAT_VERSION:
+            self.close()
+            raise Exception(f"Unsupported snapshot file {path}")
+
+        self.stringOffsetsStart = SNAPSHOT_HEADER.size
+        self.termsStart = self.stringOffsetsStart + (self.stringCount + 1) * STRING_OFFSET.size
+        self.categoriesStart = self.termsStart + self.termCount * TERM_RECORD.size
+        self.tagsStart = self.categoriesStart + self.categoryCount * NAMED_RECORD.size
+        self.relationsStart = self.tagsStart + self.tagCount * TAG_RECORD.size
+        self.stringsStart = self.relationsStart + self.relationCount * RELATION_RECORD.size
+
+    def close(self):
+        if None != self.buffer:
+            self.buffer.close()
+            self.buffer = None
+        if None != self.file:
+            self.file.close()
+            self.file = None
+
+    def stringAt(self, index):
+        if index == NO_STRING:
+            return None
+        start, end = struct.unpack_from(
+            "<II", self.buffer, self.stringOffsetsStart + index * STRING_OFFSET.size
+        )
+        return str(self.buffer[self.stringsStart + start : self.stringsStart + end], "utf-8")
+
+    def termRecordAt(self, index):
+        return TERM_RECORD.unpack_from(self.buffer, self.termsStart + index * TERM_RECORD.size)
+
+    def readNamedRecords(self, start, count):
+        return [
+            NAMED_RECORD.unpack_from(self.buffer, start + n * NAMED_RECORD.size)
+            for n in range(0, count)
+        ]
+
+    def toDeck(self, deckName):
+        deck = Deck(deckName)
+        deck.terms = SnapshotTermSequence(self)
+        deck.categories = [
+            Category(name=self.stringAt(nameIndex), pkey=pkey)
+            for pkey, nameIndex in self.readNamedRecords(self.categoriesStart, self.categoryCount)
+        ]
+        deck.tags = [
+            Tag(
+                name=self.stringAt(nameIndex),
+                pkey=pkey,
+                parent=None if parent == NO_PARENT_TAG else parent,
+            )
+            for pkey, nameIndex, parent in TAG_RECORD.iter_unpack(
+                self.buffer[self.tagsStart : self.relationsStart]
+            )
+        ]
+
+        termToTags = {}
+        tagToTerms = {}
+        relationBytes = self.buffer[self.relationsStart : self.stringsStart]
+        for termPK, tagPK in RELATION_RECORD.iter_unpack(relationBytes):
+            termToTags.setdefault(termPK, []).append(tagPK)
+            tagToTerms.setdefault(tagPK, []).append(termPK)
+        deck.termToTags = termToTags
+        deck.tagToTerms = tagToTerms
+
+        # checkPrefValue also restores the int bin keys JSON made strings
+        prefsData = json.loads(self.stringAt(self.prefsIndex))
+        deck.prefs = {
+            key: checkPrefValue(key, value) for key, value in prefsData["prefs"].items()
+        }
+        deck.scopedPrefs = {}
+        for scope, scopePK, key, value in prefsData["scopedPrefs"]:
+            deck.scopedPrefs.setdefault((scope, scopePK), {})[key] = checkPrefValue(key, value)
+        return deck
+
+
+class SnapshotTerm(Term):
+    """
+    A Term loaded from a snapshot record; question and answer text is
+    decoded from the snapshot on first access.
+    """
+
+    def __init__(self, snapshot: DeckSnapshot, record):
+        self._snapshot = snapshot
+        self._question = None
+        self._answer = None
+        super().__init__()
+
+        (
+            self.pkey,
+            self._questionIndex,
+            self._answerIndex,
+            category,
+            self.bin,
+            self.reversedBin,
+            hasPaperCard,
+            lastDrillTime,
+            rowVersion,
+        ) = record
+        self.category = None if category == NO_CATEGORY else category
+        self.hasPaperCard = hasPaperCard != 0
+        self.lastDrillTime = None if lastDrillTime == NO_DRILL_TIME else lastDrillTime
+        self.rowVersion = None if rowVersion == NO_ROW_VERSION else rowVersion
+
+    @property
+    def question(self):
+        if None == self._question and None != self._questionIndex:
+            self._question = self._snapshot.stringAt(self._questionIndex)
+        return self._question
+
+    @question.setter
+    def question(self, value):
+        self._question = value
+        self._questionIndex = None
+
+    @property
+    def answer(self):
+        if None == self._answer and None != self._answerIndex:
+            self._answer = self._snapshot.stringAt(self._answerIndex)
+        return self._answer
+
+    @answer.setter
+    def answer(self, value):
+        self._answer = value
+        self._answerIndex = None
+
+
+class SnapshotTermSequence(MutableSequence):
+    """
+    Sequence of the terms in a snapshot; each Term object is created on
+    first access and then reused. Modifying the sequence (e.g. removing
+    a deleted term) first decodes all remaining terms.
+    """
+
+    def __init__(self, snapshot: DeckSnapshot):
+        self.snapshot = snapshot
+        self.terms = [None] * snapshot.termCount
+        self.materialized = False
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[n] for n in range(*index.indices(len(self.terms)))]
+        term = self.terms[index]
+        if None == term:
+            if index < 0:
+                index += len(self.terms)
+            term = SnapshotTerm(self.snapshot, self.snapshot.termRecordAt(index))
+            self.terms[index] = term
+        return term
+
+    def __iter__(self):
+        for n in range(0, len(self.terms)):
+            yield self[n]
+
+    def materialize(self):
+        if not self.materialized:
+            for n in range(0, len(self.terms)):
+                self[n]
+            self.materialized = True
+
+    def __setitem__(self, index, value):
+        self.materialize()
+        self.terms[index] = value
+
+    def __delitem__(self, index):
+        self.materialize()
+        del self.terms[index]
+
+    def insert(self, index, value):
+        self.materialize()
+        self.terms.insert(index, value)
+
+
+def loadDeckSnapshot(path, deckName, expectedRevision):
+    """
+    Load a deck from the snapshot at path if it exists and was written at
+    expectedRevision. Returns None if there is no usable snapshot.
+    """
+    if None == expectedRevision or not os.path.isfile(path):
+        return None
+
+    try:
+        snapshot = DeckSnapshot(path)
+    except Exception as ex:
+        logging.warning(f"Ignoring unreadable deck snapshot {path}: {ex}")
+        return None
+
+    if snapshot.revision != expectedRevision:
+        logging.debug(f"Deck snapshot {path} is stale (revision {snapshot.revision}, deck at {expectedRevision})")
+        snapshot.close()
+        return None
+
+    return snapshot.toDeck(deckName)
@@ -8,21 +8,35 @@ Created on Sat Apr  8 23:45:44 2023
 
 import random
 import math
-from datetime import datetime
 import logging
 
 from lexilogio.deck import Deck
 from lexilogio.category import Category
 from lexilogio.tag import Tag
+from lexilogio.reviewlog import ReviewRecord, isTermDue
 import time
 
 class Drill:
-    def __init__(self, terms):
+    def __init__(self, terms, isReversed=False):
         self.terms = terms
         self.cursor = 0
+        # answers are shown first (from the prefs the drill was made with)
+        self.isReversed = isReversed
+        # ReviewRecords of the answers not yet written to the review log
+        self.reviews = []
+        # perf_counter time the current question was shown, if known
+        self.questionShownTime = None
 
     def advance(self):
         self.cursor += 1
+        self.questionShownTime = None
+
+    def markQuestionShown(self):
+        """
+        Note when the current question is shown, so the answer's
+        response time is logged.
+        """
+        self.questionShownTime = time.perf_counter()
 
     def isCompleted(self):
         return self.cursor >= len(self.terms)
@@ -40,7 +54,24 @@ class Drill:
         # we are setting timestamp - even if bin value has not changed
         # we want to track when the term was last seen
 
-        t.lastDrillTime = datetime.utcnow().isoformat()
+        reviewTime = int(time.time())
+        responseMs = None
+        if None != self.questionShownTime:
+            responseMs = int((time.perf_counter() - self.questionShownTime) * 1000)
+        self.reviews.append(
+            ReviewRecord(
+                t.pkey,
+                reviewTime,
+                binValue,
+                isReversed=reversedBin,
+                responseMs=responseMs,
+                previousBin=t.reversedBin if reversedBin else t.bin,
+                previousReviewTime=t.lastDrillTime,
+                category=t.category,
+            )
+        )
+
+        t.lastDrillTime = reviewTime
         t.updated = True
 
         if reversedBin:
@@ -48,6 +79,14 @@ class Drill:
         else:
             t.bin = binValue
 
+    def takeReviews(self):
+        """
+        Return the ReviewRecords not yet taken, and forget them.
+        """
+        reviews = self.reviews
+        self.reviews = []
+        return reviews
+
     def getUpdatedTerms(self):
         return [t for t in self.terms if t.updated]
     
@@ -57,45 +96,67 @@ class Drill:
         return [t for t in self.terms if t.bin <= 2]
 
     # Drill construction methods
-    def makeDrillFromDeck(deck: Deck, category: Category = None, tag: Tag = None):
+    def makeDrillFromDeck(deck: Deck, category: Category = None, tag: Tag = None,
+                          includeSubtags=False):
         """
         Create a new drill.
         
-        If category and tag or both nil, create a drill from all deck terms.
-        
-        Note that only *one* of category or tag can currently be non-nil
-        (drills by tag within a category are TBD).
+        If category and tag or both nil, create a drill from all deck terms;
+        if both are given, from the terms in category having tag. With
+        includeSubtags, terms with any tag below tag are included too.
+        The drill uses the prefs resolved for category and tag (see
+        Deck.resolvePrefs).
         
         """
         usingCategory = not None == category
         usingTag = not None == tag
-        if usingCategory and usingTag:
-            raise Exception("ERROR: a drill can specify a category or a tag, not both")
-            
-        questionCount = deck.getDrillQuestionCount()
-        usingSpacedRep = deck.isUsingSpacedRepetition()
-        isReversed = deck.isReversedDrill()
 
         logging.debug(
-            f"Creating drill from deck {deck.name}, category {str(category)}"
+            f"Creating drill from deck {deck.name}, category {str(category)}, tag {str(tag)}"
         )
+
+        if usingTag:
+            if includeSubtags:
+                tagBits = deck.getTagSubtreeBitset(tag)
+            else:
+                tagBits = deck.getTagBitset(tag)
+            if usingCategory:
+                tagBits &= deck.getCategoryBitset(category)
+            sourceTerms = deck.getTermMembership().termsForBitset(tagBits)
+        elif usingCategory:
+            sourceTerms = deck.getTermsInCategory(category)
+        else:
+            sourceTerms = deck.terms
+
+        return Drill.makeDrillFromTerms(deck, sourceTerms, deck.resolvePrefs(category, tag))
+
+    def makeDrillFromTerms(deck: Deck, sourceTerms, prefs=None):
+        """
+        Create a new drill from sourceTerms, the terms of deck matching
+        the drill's criteria (e.g. from DeckDatabase.queryTermPKeysByCriteria
+        and Deck.getTermsByPKeys), using prefs, or if None the deck's
+        drill preferences.
+        """
+        if None == prefs:
+            prefs = deck.prefs
+        questionCount = prefs[Deck.PREFSKEY_QUESTION_COUNT]
+        usingSpacedRep = prefs[Deck.PREFSKEY_SPACED_REPETITION]
+        isReversed = prefs[Deck.PREFSKEY_REVERSED_DRILL]
+
+        logging.debug(f"source terms: {len(sourceTerms)}")
         logging.debug(f"reversed: {str(isReversed)}")
         logging.debug(f"using-spaced-repetition: {str(usingSpacedRep)}")
 
-        drill = Drill([])
+        drill = Drill([], isReversed)
 
         if usingSpacedRep:
 
-            binTerms = {}
-            for n in range(0, 6):
-                if not usingTag:
-                    binTerms[n] = deck.getTermsInCategoryOfBinValue(
-                        category, n, isReversed
-                    )
-                else:
-                    binTerms[n] = deck.getTermsWithTagOfBinValue(
-                        tag, n, isReversed
-                    )
+            # group the source terms by bin in one pass
+            binTerms = {n: [] for n in range(0, 6)}
+            for t in sourceTerms:
+                binValue = t.reversedBin if isReversed else t.bin
+                if binValue in binTerms:
+                    binTerms[binValue].append(t)
 
             # sanity-check: do we even have enough terms for desired questionCount?
             termTotal = 0
@@ -115,7 +176,7 @@ class Drill:
                     f"  only {termTotal} matching terms available; adjusted questionCount: {questionCount}"
                 )
 
-            binDist = deck.getSpacedBinDistribution()
+            binDist = prefs[Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION]
 
 
             binCounts = {}
@@ -192,18 +253,29 @@ class Drill:
 
             logging.info("  making random term selections...")
             # now we are ready to randomly select terms from each bin
+            # within a bin, terms due for review (see
+            # reviewlog.isTermDue) are chosen before the others
             random.seed(int(time.monotonic()*1000))
+            binIntervals = prefs[Deck.PREFSKEY_SPACED_BIN_INTERVALS]
+            now = time.time()
             drill.terms = []
             for n in range(0, 6):
                 thisBinCount = binCounts[n]
                 thisBinTerms = binTerms[n]
                 if thisBinCount < len(thisBinTerms):
-                    indexSet = set()
-                    while len(indexSet) < thisBinCount:
-                        indexSet.add(random.randint(0, len(thisBinTerms) - 1))
-                    logging.info(f"  index set for bin {n}: {str(indexSet)}")
-                    for index in indexSet:
-                        drill.terms.append(thisBinTerms[index])
+                    dueTerms = []
+                    otherTerms = []
+                    for t in thisBinTerms:
+                        if isTermDue(t, binIntervals, now, isReversed):
+                            dueTerms.append(t)
+                        else:
+                            otherTerms.append(t)
+                    logging.info(f"  bin {n}: {len(dueTerms)} of {len(thisBinTerms)} terms due")
+                    if thisBinCount <= len(dueTerms):
+                        drill.terms.extend(random.sample(dueTerms, thisBinCount))
+                    else:
+                        drill.terms.extend(dueTerms)
+                        drill.terms.extend(random.sample(otherTerms, thisBinCount - len(dueTerms)))
                 else:
                     # use all this bin's terms
                     drill.terms.extend(thisBinTerms)
@@ -213,14 +285,6 @@ class Drill:
             logging.info(f"  drill completed, {len(drill.terms)} terms chosen.")
 
         else:  # not using spaced rep from bins, just random from all terms
-            sourceTerms = []
-            if usingCategory:
-                sourceTerms = deck.getTermsInCategory(category)
-            elif usingTag:
-                sourceTerms = deck.getTermsWithTag(tag)
-            else:
-                sourceTerms = deck.terms
-
             if len(sourceTerms) == 0:
                 print('No terms !')
                 return None
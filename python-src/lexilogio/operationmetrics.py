@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 16:48:13 2026
+
+@author: mathaes
+
+Latency histograms for Controller operations, exportable as Prometheus
+text exposition format or JSON.
+
+Timing is installed per Controller instance by wrapping the timed
+methods as instance attributes (see Controller.enableOperationTiming);
+disabling it removes the wrappers again, so a controller without timing
+runs its methods unchanged.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+# histogram bucket upper bounds, in seconds
+DEFAULT_BUCKET_BOUNDS = [
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+]
+
+PROMETHEUS_METRIC_NAME = "lexilogio_controller_operation_seconds"
+
+METRICS_FORMAT_PROMETHEUS = "prometheus"
+METRICS_FORMAT_JSON = "json"
+
+
+class LatencyHistogram:
+    def __init__(self, bucketBounds=DEFAULT_BUCKET_BOUNDS):
+        self.bucketBounds = bucketBounds
+        # last bucket counts observations above the largest bound
+        self.bucketCounts = [0] * (len(bucketBounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = 0
+        for bound in self.bucketBounds:
+            if seconds <= bound:
+                break
+            index += 1
+        self.bucketCounts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def cumulativeCounts(self):
+        counts = []
+        total = 0
+        for n in self.bucketCounts:
+            total += n
+            counts.append(total)
+        return counts
+
+    def quantile(self, q):
+        """
+        Estimate quantile q (0-1) by linear interpolation within the
+        bucket it falls in, as Prometheus' histogram_quantile does.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        lowerBound = 0.0
+        cumulative = 0
+        for index, n in enumerate(self.bucketCounts):
+            if index < len(self.bucketBounds):
+                upperBound = self.bucketBounds[index]
+            else:
+                upperBound = self.max
+            if cumulative + n >= rank and n > 0:
+                fraction = (rank - cumulative) / n
+                return min(lowerBound + (upperBound - lowerBound) * fraction, self.max)
+            cumulative += n
+            lowerBound = upperBound
+        return self.max
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.sum / self.count
+
+    def toDict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count > 0 else None,
+            "max": self.max,
+            "mean": self.mean(),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                str(bound): count
+                for bound, count in zip(self.bucketBounds + ["+Inf"], self.cumulativeCounts())
+            },
+        }
+
+
+class OperationMetrics:
+    """
+    One latency histogram per operation name.
+    """
+
+    def __init__(self, bucketBounds=DEFAULT_BUCKET_BOUNDS):
+        self.bucketBounds = bucketBounds
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def observe(self, operation, seconds):
+        with self.lock:
+            histogram = self.histograms.get(operation)
+            if None == histogram:
+                histogram = LatencyHistogram(self.bucketBounds)
+                self.histograms[operation] = histogram
+            histogram.observe(seconds)
+
+    def timed(self, operation, func):
+        """
+        Return a wrapper calling func and recording its duration under
+        operation (also when it raises).
+        """
+
+        def timedCall(*args, **kwargs):
+            startTime = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(operation, time.perf_counter() - startTime)
+
+        timedCall.__wrapped__ = func
+        return timedCall
+
+    def toDict(self):
+        with self.lock:
+            return {name: h.toDict() for name, h in sorted(self.histograms.items())}
+
+    def toJSON(self):
+        return json.dumps({"operations": self.toDict()}, indent=2)
+
+    def toPrometheusText(self):
+        lines = [
+            f"# HELP {PROMETHEUS_METRIC_NAME} Latency of lexilogio Controller operations.",
+            f"# TYPE {PROMETHEUS_METRIC_NAME} histogram",
+        ]
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                bounds = [repr(b) for b in histogram.bucketBounds] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.cumulativeCounts()):
+                    lines.append(
+                        f'{PROMETHEUS_METRIC_NAME}_bucket{{operation="{name}",le="{bound}"}} {count}'
+                    )
+                lines.append(f'{PROMETHEUS_METRIC_NAME}_sum{{operation="{name}"}} {histogram.sum!r}')
+                lines.append(f'{PROMETHEUS_METRIC_NAME}_count{{operation="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def writeToFile(self, path, format=None):
+        """
+        Write the metrics to path as Prometheus text or JSON. If format
+        is None it is chosen from the file extension (.json for JSON).
+        """
+        if None == format:
+            format = METRICS_FORMAT_JSON if path.endswith(".json") else METRICS_FORMAT_PROMETHEUS
+        if format == METRICS_FORMAT_JSON:
+            text = self.toJSON()
+        elif format == METRICS_FORMAT_PROMETHEUS:
+            text = self.toPrometheusText()
+        else:
+            raise Exception(f"Unsupported metrics format: {format}")
+
+        tmpPath = f"{path}.tmp"
+        with open(tmpPath, "w") as metricsFile:
+            metricsFile.write(text)
+        os.replace(tmpPath, path)
+
+    def profileLines(self):
+        """
+        Human-readable profile, one line per operation, by total time.
+        """
+        with self.lock:
+            histograms = sorted(self.histograms.items(), key=lambda item: item[1].sum, reverse=True)
+            lines = [f"  {'operation':24} {'count':>7} {'total':>10} {'mean':>10} {'p50':>10} {'p95':>10} {'max':>10}"]
+            for name, h in histograms:
+                lines.append(
+                    f"  {name:24} {h.count:7d} {h.sum * 1000:8.1f}ms {h.mean() * 1000:8.2f}ms "
+                    f"{h.quantile(0.5) * 1000:8.2f}ms {h.quantile(0.95) * 1000:8.2f}ms {h.max * 1000:8.2f}ms"
+                )
+        return lines
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 21:04:52 2026
+
+@author: mathaes
+
+The review log: one appended row per drill answer (see
+DeckDatabase.appendReviewLog), and analytics over it.
+
+Alongside each batch of log rows, DeckDatabase.appendReviewLog adds the
+batch to daily rollups (reviews per UTC day, category, direction and
+interval bucket), so the analytics here read the small rollup table
+rather than scanning the log. The log is history, not deck content:
+changes to it do not bump the deck revision, and rows are kept when
+their term is deleted.
+"""
+
+from datetime import datetime, timezone
+
+from lexilogio.connectionmanager import immediateTransaction
+from lexilogio.deckprefs import DEFAULT_BIN_REVIEW_INTERVAL_DAYS
+from lexilogio.deckdatabase import (
+    REVIEW_LOG_TABLE_NAME,
+    REVIEW_DAILY_TABLE_NAME,
+)
+
+SECONDS_PER_DAY = 86400
+
+# a rating from this up counts as recalled (lower ones are "missed", as
+# in Drill.getMissedTerms)
+RECALLED_MIN_RATING = 3
+
+# lower bounds, in days, of the intervals since a term's previous review
+# that retention is grouped by
+RETENTION_INTERVAL_BUCKET_DAYS = [0, 1, 2, 4, 7, 14, 30, 60, 120, 240]
+# bucket of first reviews, which have no interval
+FIRST_REVIEW_BUCKET = -1
+# rollup category of terms without one
+NO_CATEGORY = -1
+
+
+class ReviewRecord:
+    def __init__(self, termPK, reviewTime, rating, isReversed=False, responseMs=None,
+                 previousBin=None, previousReviewTime=None, category=None):
+        self.termPK = termPK
+        # epoch seconds, UTC
+        self.reviewTime = reviewTime
+        self.rating = rating
+        self.isReversed = isReversed
+        self.responseMs = responseMs
+        self.previousBin = previousBin
+        self.previousReviewTime = previousReviewTime
+        self.category = category
+
+    def intervalSeconds(self):
+        if None == self.previousReviewTime:
+            return None
+        return max(0, self.reviewTime - self.previousReviewTime)
+
+
+def drillTimeToEpoch(drillTime):
+    """
+    Epoch seconds of a drill time given as epoch seconds (as
+    Term.lastDrillTime) or as an ISO-8601 UTC string (as stored before
+    schema version 12), or None.
+    """
+    if None == drillTime or drillTime == "":
+        return None
+    if type(drillTime) != str:
+        return int(drillTime)
+    parsed = datetime.fromisoformat(drillTime)
+    if None == parsed.tzinfo:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def intervalBucket(intervalSeconds):
+    if None == intervalSeconds:
+        return FIRST_REVIEW_BUCKET
+    bucket = 0
+    for n, lowerBound in enumerate(RETENTION_INTERVAL_BUCKET_DAYS):
+        if intervalSeconds >= lowerBound * SECONDS_PER_DAY:
+            bucket = n
+    return bucket
+
+
+def intervalBucketSQL(intervalColumn):
+    # SQL for intervalBucket, for rebuilding the rollups
+    cases = " ".join(
+        f"WHEN {intervalColumn} >= {lowerBound * SECONDS_PER_DAY} THEN {n}"
+        for n, lowerBound in reversed(list(enumerate(RETENTION_INTERVAL_BUCKET_DAYS)))
+    )
+    return f"CASE WHEN {intervalColumn} IS NULL THEN {FIRST_REVIEW_BUCKET} {cases} ELSE 0 END"
+
+
+def bucketLabel(bucket):
+    if bucket == FIRST_REVIEW_BUCKET:
+        return "first review"
+    lowerBound = RETENTION_INTERVAL_BUCKET_DAYS[bucket]
+    if bucket + 1 < len(RETENTION_INTERVAL_BUCKET_DAYS):
+        return f"{lowerBound}-{RETENTION_INTERVAL_BUCKET_DAYS[bucket + 1]}d"
+    return f"{lowerBound}d+"
+
+
+def rollupIncrements(records):
+    """
+    Return the rollup rows (day, category, reversed, interval bucket,
+    reviews, recalled, response ms total, responses) for records.
+    """
+    rollups = {}
+    for r in records:
+        key = (
+            r.reviewTime // SECONDS_PER_DAY,
+            NO_CATEGORY if None == r.category else r.category,
+            1 if r.isReversed else 0,
+            intervalBucket(r.intervalSeconds()),
+        )
+        counts = rollups.setdefault(key, [0, 0, 0, 0])
+        counts[0] += 1
+        if r.rating >= RECALLED_MIN_RATING:
+            counts[1] += 1
+        if None != r.responseMs:
+            counts[2] += r.responseMs
+            counts[3] += 1
+    return [key + tuple(counts) for key, counts in rollups.items()]
+
+
+def rebuildDailyRollups(con):
+    """
+    Recompute the daily rollups from the whole review log.
+    """
+    with immediateTransaction(con) as cur:
+        cur.execute(f"DELETE FROM {REVIEW_DAILY_TABLE_NAME};")
+        cur.execute(f"""INSERT INTO {REVIEW_DAILY_TABLE_NAME}
+    (day, category, reversed, interval_bucket, review_count, recalled_count,
+     response_ms_total, response_count)
+SELECT review_time / {SECONDS_PER_DAY}, COALESCE(category, {NO_CATEGORY}), reversed,
+    {intervalBucketSQL("interval_seconds")}, COUNT(*),
+    SUM(rating >= {RECALLED_MIN_RATING}), COALESCE(SUM(response_ms), 0), COUNT(response_ms)
+FROM {REVIEW_LOG_TABLE_NAME}
+GROUP BY 1, 2, 3, 4;""")
+
+
+def isTermDue(term, binIntervalDays, now, isReversed=False):
+    """
+    True if term (never drilled, or last drilled binIntervalDays[bin]
+    days before epoch time now or earlier) is due for review.
+    """
+    lastTime = term.lastDrillTime
+    if None == lastTime:
+        return True
+    binValue = term.reversedBin if isReversed else term.bin
+    return lastTime + binIntervalDays.get(binValue, 0) * SECONDS_PER_DAY <= now
+
+
+def todayEpochDay():
+    return int(datetime.now(timezone.utc).timestamp()) // SECONDS_PER_DAY
+
+
+def retentionCurve(con, sinceDays=None, isReversed=None):
+    """
+    Return (bucket label, reviews, recall rate) per interval bucket, for
+    the reviews of the last sinceDays days (all if None) in either
+    direction, or only reversed/forward ones.
+    """
+    whereSQL, params = rollupWhere(sinceDays, isReversed)
+    rows = con.execute(f"""SELECT interval_bucket, SUM(review_count), SUM(recalled_count)
+FROM {REVIEW_DAILY_TABLE_NAME} {whereSQL}
+GROUP BY interval_bucket ORDER BY interval_bucket;""", params).fetchall()
+    return [(bucketLabel(bucket), reviews, recalled / reviews) for bucket, reviews, recalled in rows]
+
+
+def categoryAccuracy(con, sinceDays=None):
+    """
+    Return a dict of category pkey (None for no category) -> (reviews,
+    recall rate, mean response ms or None).
+    """
+    whereSQL, params = rollupWhere(sinceDays, None)
+    rows = con.execute(f"""SELECT category, SUM(review_count), SUM(recalled_count),
+    SUM(response_ms_total), SUM(response_count)
+FROM {REVIEW_DAILY_TABLE_NAME} {whereSQL}
+GROUP BY category;""", params).fetchall()
+    accuracy = {}
+    for category, reviews, recalled, responseTotal, responses in rows:
+        accuracy[None if category == NO_CATEGORY else category] = (
+            reviews,
+            recalled / reviews,
+            responseTotal / responses if responses > 0 else None,
+        )
+    return accuracy
+
+
+def dailyReviewCounts(con, sinceDays=30):
+    """
+    Return (epoch day, reviews, recalled) for each day with reviews in
+    the last sinceDays days.
+    """
+    whereSQL, params = rollupWhere(sinceDays, None)
+    return con.execute(f"""SELECT day, SUM(review_count), SUM(recalled_count)
+FROM {REVIEW_DAILY_TABLE_NAME} {whereSQL}
+GROUP BY day ORDER BY day;""", params).fetchall()
+
+
+def rollupWhere(sinceDays, isReversed):
+    clauses = []
+    params = []
+    if None != sinceDays:
+        clauses.append("day >= ?")
+        params.append(todayEpochDay() - sinceDays + 1)
+    if None != isReversed:
+        clauses.append("reversed = ?")
+        params.append(1 if isReversed else 0)
+    if len(clauses) == 0:
+        return "", params
+    return "WHERE " + " AND ".join(clauses), params
+
+
+def workloadForecast(terms, days=7, binIntervalDays=DEFAULT_BIN_REVIEW_INTERVAL_DAYS,
+                     isReversed=False):
+    """
+    Return the number of terms due for review on each of the next days
+    (index 0 is today, including overdue terms), a term being due
+    binIntervalDays[bin] days after its last drill. Terms never drilled
+    are not counted.
+    """
+    today = todayEpochDay()
+    counts = [0] * days
+    for t in terms:
+        lastTime = t.lastDrillTime
+        if None == lastTime:
+            continue
+        binValue = t.reversedBin if isReversed else t.bin
+        dueDay = int((lastTime + binIntervalDays.get(binValue, 0) * SECONDS_PER_DAY) // SECONDS_PER_DAY)
+        offset = max(0, dueDay - today)
+        if offset < days:
+            counts[offset] += 1
+    return counts
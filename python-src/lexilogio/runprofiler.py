@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 17:21:50 2026
+
+@author: mathaes
+
+CPU (cProfile) and memory (tracemalloc) profiling of a runner batch
+command. Each profiled run writes, to the output directory:
+
+    lexilogio_profile_<label>_<time>.pstats      cProfile stats, for pstats/snakeviz
+    lexilogio_profile_<label>_<time>_alloc.txt   top allocation sites and peak memory
+    lexilogio_profile_<label>_<time>_summary.txt the summary printed by the runner
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+
+PROFILE_MODE_cpu = "cpu"
+PROFILE_MODE_memory = "memory"
+PROFILE_MODE_all = "all"
+
+SUMMARY_FUNCTION_COUNT = 15
+ALLOCATION_SITE_COUNT = 25
+SUMMARY_ALLOCATION_COUNT = 5
+
+# only functions from files in this package are summarized
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def isProfileModeValid(mode):
+    return mode in [PROFILE_MODE_cpu, PROFILE_MODE_memory, PROFILE_MODE_all]
+
+
+class RunProfiler:
+    def __init__(self, outputDir, label, mode=PROFILE_MODE_all):
+        if not isProfileModeValid(mode):
+            raise Exception(f"Unsupported profile mode: {mode}")
+        self.outputDir = outputDir
+        self.label = label
+        self.profileCPU = mode in [PROFILE_MODE_cpu, PROFILE_MODE_all]
+        self.profileMemory = mode in [PROFILE_MODE_memory, PROFILE_MODE_all]
+
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.basePath = os.path.join(outputDir, f"lexilogio_profile_{label}_{timestamp}")
+
+        self.profile = None
+        self.snapshot = None
+        self.peakMemory = 0
+        self.elapsedSeconds = 0.0
+        self.startTime = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+        return False
+
+    def start(self):
+        if self.profileMemory:
+            tracemalloc.start()
+        if self.profileCPU:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.startTime = time.perf_counter()
+
+    def stop(self):
+        self.elapsedSeconds = time.perf_counter() - self.startTime
+        if self.profileCPU:
+            self.profile.disable()
+        if self.profileMemory:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.peakMemory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.writeOutputFiles()
+
+    def packageFunctionStats(self):
+        """
+        Return (cumulative seconds, own seconds, call count, location) for
+        the lexilogio functions in the profile, by cumulative time.
+        """
+        stats = pstats.Stats(self.profile)
+        rows = []
+        for (fileName, lineNumber, funcName), (cc, callCount, ownTime, cumTime, callers) in stats.stats.items():
+            filePath = os.path.abspath(fileName)
+            if not filePath.startswith(PACKAGE_DIR) or filePath == os.path.abspath(__file__):
+                continue
+            location = f"{os.path.basename(fileName)}:{lineNumber}({funcName})"
+            rows.append((cumTime, ownTime, callCount, location))
+        rows.sort(reverse=True)
+        return rows
+
+    def allocationSites(self, count):
+        snapshot = self.snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        return snapshot.statistics("lineno")[:count]
+
+    def summaryLines(self):
+        lines = [f"Profile of {self.label}: {self.elapsedSeconds:.3f}s"]
+        if self.profileCPU:
+            lines.append("  heaviest lexilogio functions (cumulative / own time, calls):")
+            for cumTime, ownTime, callCount, location in self.packageFunctionStats()[:SUMMARY_FUNCTION_COUNT]:
+                lines.append(f"    {cumTime:9.4f}s {ownTime:9.4f}s {callCount:9d}  {location}")
+        if self.profileMemory:
+            lines.append(f"  peak traced memory: {self.peakMemory / (1024 * 1024):.1f} MiB")
+            lines.append("  top allocation sites:")
+            for stat in self.allocationSites(SUMMARY_ALLOCATION_COUNT):
+                lines.append(f"    {stat.size / 1024:9.1f} KiB {stat.count:9d} blocks  {stat.traceback}")
+        lines.append(f"  output: {self.basePath}*")
+        return lines
+
+    def writeOutputFiles(self):
+        if self.profileCPU:
+            self.profile.dump_stats(f"{self.basePath}.pstats")
+
+        if self.profileMemory:
+            with open(f"{self.basePath}_alloc.txt", "w") as allocFile:
+                allocFile.write(f"peak traced memory: {self.peakMemory} bytes\n\n")
+                for stat in self.allocationSites(ALLOCATION_SITE_COUNT):
+                    allocFile.write(f"{stat}\n")
+
+        with open(f"{self.basePath}_summary.txt", "w") as summaryFile:
+            summaryFile.write("\n".join(self.summaryLines()) + "\n")
+            if self.profileCPU:
+                # full pstats listing of the top functions for reference
+                statsText = io.StringIO()
+                stats = pstats.Stats(self.profile, stream=statsText)
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(40)
+                summaryFile.write("\n" + statsText.getvalue())
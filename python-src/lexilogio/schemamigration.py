@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 10:02:31 2026
+
+@author: mathaes
+"""
+
+import logging
+import sqlite3
+import time
+
+from lexilogio.connectionmanager import retryOnBusy
+
+DEFAULT_MIGRATION_BATCH_SIZE = 5000
+
+
+class MigrationStep:
+    """
+    A single schema revision, identified by the PRAGMA user_version value
+    the database has once the step is applied.
+
+    apply(cursor) makes the schema change and is always run inside a
+    single transaction together with the user_version update.
+
+    batchApply(cursor, batchSize), if given, is for steps that rewrite the
+    rows of a large table. It must process at most batchSize rows per call
+    (all remaining rows if batchSize is None) and return the number of rows
+    processed, returning 0 once there is nothing left to do. It must be
+    safe to call again after an interrupted run. In online mode each batch
+    is committed separately, so the write lock is only held briefly;
+    apply() then finalizes the step.
+    """
+
+    def __init__(self, version: int, description: str, apply, batchApply=None):
+        self.version = version
+        self.description = description
+        self.apply = apply
+        self.batchApply = batchApply
+
+    def __repr__(self):
+        return f"[{self.version}] {self.description}"
+
+
+class MigrationReportEntry:
+    """
+    The time a step took, the number of transactions it ran in and the
+    longest of them, which is how long it held the write lock at a time.
+    """
+
+    def __init__(self, version, description, seconds, batches, longestBatchSeconds):
+        self.version = version
+        self.description = description
+        self.seconds = seconds
+        self.batches = batches
+        self.longestBatchSeconds = longestBatchSeconds
+
+    def __repr__(self):
+        return (
+            f"[{self.version}] {self.description}: {self.seconds:.3f}s"
+            f" ({self.batches} batches, longest {self.longestBatchSeconds:.3f}s)"
+        )
+
+
+class SchemaMigrator:
+    """
+    Applies an ordered list of MigrationSteps to a sqlite3 connection,
+    keyed on PRAGMA user_version.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, migrations: list):
+        self.connection = connection
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+
+    def currentVersion(self):
+        row = self.connection.execute("PRAGMA user_version;").fetchone()
+        if None == row:
+            return 0
+        return int(row[0])
+
+    def targetVersion(self):
+        if len(self.migrations) == 0:
+            return 0
+        return self.migrations[-1].version
+
+    def pendingMigrations(self):
+        current = self.currentVersion()
+        return [m for m in self.migrations if m.version > current]
+
+    def migrate(self, online=False, batchSize=DEFAULT_MIGRATION_BATCH_SIZE):
+        """
+        Apply all pending migrations in version order. Each step is
+        applied in its own transaction, so a failure leaves the database
+        at the last successfully applied version.
+
+        Returns the list of MigrationReportEntry for the applied steps.
+        """
+        report = []
+        for migration in self.pendingMigrations():
+            report.append(self.applyMigration(migration, online, batchSize))
+        return report
+
+    def applyMigration(self, migration: MigrationStep, online=False,
+                       batchSize=DEFAULT_MIGRATION_BATCH_SIZE):
+        con = self.connection
+        logging.info(f"Applying schema migration {migration}")
+        startTime = time.perf_counter()
+        batches = 0
+        longestBatchSeconds = 0.0
+
+        # make sure we start outside of any implicit transaction
+        con.commit()
+
+        if online and None != migration.batchApply:
+            while True:
+                batchStartTime = time.perf_counter()
+                rowCount = self.runInTransaction(
+                    lambda cur: migration.batchApply(cur, batchSize), migration
+                )
+                longestBatchSeconds = max(longestBatchSeconds, time.perf_counter() - batchStartTime)
+                batches += 1
+                logging.debug(f"  batch {batches}: {rowCount} rows")
+                if rowCount == 0:
+                    break
+
+        def finalize(cur):
+            if not online and None != migration.batchApply:
+                migration.batchApply(cur, None)
+            migration.apply(cur)
+            # PRAGMA values cannot be bound as parameters
+            cur.execute(f"PRAGMA user_version = {int(migration.version)};")
+
+        batchStartTime = time.perf_counter()
+        self.runInTransaction(finalize, migration)
+        longestBatchSeconds = max(longestBatchSeconds, time.perf_counter() - batchStartTime)
+        batches += 1
+
+        elapsed = time.perf_counter() - startTime
+        return MigrationReportEntry(
+            migration.version, migration.description, elapsed, batches, longestBatchSeconds
+        )
+
+    def runInTransaction(self, work, migration):
+        con = self.connection
+        cur = con.cursor()
+        retryOnBusy(lambda: cur.execute("BEGIN IMMEDIATE;"))
+        try:
+            result = work(cur)
+        except Exception as ex:
+            con.rollback()
+            raise Exception(f"Schema migration {migration} failed: {ex}") from ex
+        con.commit()
+        return result
+
+    def dryRun(self, online=False, batchSize=DEFAULT_MIGRATION_BATCH_SIZE):
+        """
+        Estimate the time required by the pending migrations by running
+        them against an in-memory copy of the database. The database
+        itself is not modified.
+        """
+        if len(self.pendingMigrations()) == 0:
+            return []
+
+        self.connection.commit()
+        scratch = sqlite3.connect(":memory:")
+        try:
+            self.connection.backup(scratch)
+            return SchemaMigrator(scratch, self.migrations).migrate(online, batchSize)
+        finally:
+            scratch.close()
@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:40:52 2026
+
+@author: mathaes
+"""
+
+import os
+import sqlite3
+import logging
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+from .deck import Deck
+from .term import Term
+from .category import Category
+from .tag import Tag
+from .deckdatabase import (
+    DeckDatabase,
+    TermConflict,
+    BULK_EDIT_COLUMNS,
+    QueryCriterion,
+    DECK_TERMS_TABLE_NAME,
+    DECK_TERMS_COLUMN_NAMES,
+    CATEGORY_TABLE_NAME,
+    CATEGORY_PREFS_TABLE_NAME,
+    TAG_RELATION_TABLE_NAME,
+    DEFAULT_MIGRATION_BATCH_SIZE,
+    MERGE_FETCH_SIZE,
+    PKEY_LOOKUP_CHUNK,
+)
+
+SHARD_CONFIG_TABLE_NAME = "deck_shard_config"
+SHARD_KEYS_TABLE_NAME = "deck_shard_keys"
+
+PARTITION_BY_CATEGORY = "category"
+PARTITION_BY_HASH = "hash"
+PARTITION_MODES = [PARTITION_BY_CATEGORY, PARTITION_BY_HASH]
+
+# main file category pkeys, copied into each shard for integrity checks
+INTEGRITY_CATEGORIES_TABLE_NAME = "temp.integrity_category_pkeys"
+
+
+def openDeckDatabase(dbPath):
+    """
+    Open the deck database at dbPath, sharded or not.
+    """
+    if ShardedDeckDatabase.isShardedDeckPath(dbPath):
+        return ShardedDeckDatabase(dbPath)
+    return DeckDatabase(dbPath)
+
+
+class ShardedDeckDatabase(DeckDatabase):
+    """
+    A deck whose terms are partitioned across several database files.
+
+    The main file (the usual lexilogio_<deck>.db) holds categories, tags,
+    tag relations and prefs, plus a directory mapping each term pkey to
+    its shard; the main deck_terms table stays empty. Each shard file is
+    a regular deck database holding the deck_terms rows of its partition.
+
+    Terms are partitioned by category pkey or by term pkey (hash mode).
+    Reads fan out to the shards in parallel on a thread pool, one worker
+    per shard, and the results are merged in pkey order.
+    """
+
+    def shardPathForIndex(dbPath, shardIndex):
+        # the suffix keeps shard files out of lexilogio_*.db deck listings
+        return f"{dbPath}.shard{shardIndex}"
+
+    def isShardedDeckPath(dbPath):
+        return os.path.isfile(ShardedDeckDatabase.shardPathForIndex(dbPath, 0))
+
+    def createShardedDeck(dbPath, shardCount: int, partitionMode=PARTITION_BY_HASH):
+        if os.path.exists(dbPath):
+            raise Exception(f"Cannot create sharded deck, {dbPath} already exists")
+        if shardCount < 2:
+            raise Exception(f"A sharded deck needs at least 2 shards, got {shardCount}")
+        if not partitionMode in PARTITION_MODES:
+            raise Exception(f"Unsupported partition mode: {partitionMode}")
+
+        con = sqlite3.connect(dbPath)
+        con.execute(f"""CREATE TABLE {SHARD_CONFIG_TABLE_NAME} (
+    pkey INTEGER PRIMARY KEY,
+    shard_count INTEGER NOT NULL,
+    partition_mode TEXT NOT NULL
+);
+""")
+        con.execute(f"""CREATE TABLE {SHARD_KEYS_TABLE_NAME} (
+    pkey INTEGER PRIMARY KEY,
+    shard INTEGER NOT NULL
+);
+""")
+        con.execute(
+            f"INSERT INTO {SHARD_CONFIG_TABLE_NAME} (shard_count, partition_mode) VALUES (?, ?);",
+            [shardCount, partitionMode],
+        )
+        con.commit()
+        con.close()
+
+        for n in range(0, shardCount):
+            shard = DeckDatabase(
+                ShardedDeckDatabase.shardPathForIndex(dbPath, n), enforceForeignKeys=False
+            )
+            shard.migrateSchema()
+            shard.close()
+
+        return ShardedDeckDatabase(dbPath)
+
+    def __init__(self, dbPath):
+        # tag relations (here) and categories (here) are referenced by
+        # terms in other files, so foreign keys are checked with
+        # checkIntegrity instead of being enforced
+        super().__init__(dbPath, enforceForeignKeys=False)
+
+        configRow = self.getDbConnection().execute(
+            f"SELECT shard_count, partition_mode FROM {SHARD_CONFIG_TABLE_NAME};"
+        ).fetchone()
+        if None == configRow:
+            raise Exception(f"Missing shard configuration in {dbPath}")
+
+        self.shardCount = int(configRow[0])
+        self.partitionMode = configRow[1]
+        self.shards = [
+            DeckDatabase(
+                ShardedDeckDatabase.shardPathForIndex(dbPath, n),
+                enforceForeignKeys=False,
+            )
+            for n in range(0, self.shardCount)
+        ]
+        self.executor = None
+
+    def close(self):
+        if None != self.executor:
+            self.executor.shutdown()
+            self.executor = None
+        for shard in self.shards:
+            shard.close()
+        super().close()
+
+    def setInstrumentation(self, instrumentation):
+        for shard in self.shards:
+            shard.setInstrumentation(instrumentation)
+        super().setInstrumentation(instrumentation)
+
+    # -------------------------------------- fan-out helpers
+
+    def mapShardGroups(self, groups: dict, func):
+        """
+        Call func(shard, items) in parallel for every (shardIndex, items)
+        entry in groups. Returns the results keyed by shard index.
+        """
+        if None == self.executor:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.shardCount, thread_name_prefix="lexilogio-shard"
+            )
+        indexes = list(groups.keys())
+        results = self.executor.map(
+            lambda n: func(self.shards[n], groups[n]), indexes
+        )
+        return dict(zip(indexes, results))
+
+    def mapShards(self, func, shardIndexes=None):
+        """
+        Call func(shard) in parallel on the given shards (default all)
+        and return the results in shard order.
+        """
+        if None == shardIndexes:
+            shardIndexes = range(0, self.shardCount)
+        results = self.mapShardGroups(
+            {n: None for n in shardIndexes}, lambda shard, unused: func(shard)
+        )
+        return [results[n] for n in sorted(results.keys())]
+
+    def mergeConflicts(conflictLists):
+        conflicts = []
+        for conflictList in conflictLists:
+            conflicts.extend(conflictList)
+        return conflicts
+
+    def mergeTermLists(termLists):
+        merged = []
+        for termList in termLists:
+            merged.extend(termList)
+        merged.sort(key=lambda t: t.pkey)
+        return merged
+
+    def shardIndexForCategory(self, categoryPK):
+        if None == categoryPK:
+            return 0
+        return int(categoryPK) % self.shardCount
+
+    def shardIndexForNewTerm(self, pkey, categoryPK):
+        if self.partitionMode == PARTITION_BY_CATEGORY:
+            return self.shardIndexForCategory(categoryPK)
+        return pkey % self.shardCount
+
+    def lookupShardIndexes(self, pkeys: list):
+        """
+        Return a dict of term pkey -> shard index from the shard directory.
+        """
+        con = self.getDbConnection()
+        shardIndexes = {}
+        for start in range(0, len(pkeys), PKEY_LOOKUP_CHUNK):
+            chunk = pkeys[start : start + PKEY_LOOKUP_CHUNK]
+            placeholders = ", ".join(["?"] * len(chunk))
+            rows = con.execute(
+                f"SELECT pkey, shard FROM {SHARD_KEYS_TABLE_NAME} WHERE pkey IN ({placeholders});",
+                chunk,
+            ).fetchall()
+            for row in rows:
+                shardIndexes[row[0]] = row[1]
+        return shardIndexes
+
+    def groupTermsByShard(self, termList: list):
+        """
+        Return a dict of shard index -> terms of termList in that shard,
+        and a TermConflict for each term in no shard (deleted by another
+        writer), as DeckDatabase.findTermConflicts reports deleted rows.
+        """
+        shardIndexes = self.lookupShardIndexes([t.pkey for t in termList])
+        groups = {}
+        deletedConflicts = []
+        for term in termList:
+            if not term.pkey in shardIndexes:
+                deletedConflicts.append(TermConflict(term, None))
+                continue
+            groups.setdefault(shardIndexes[term.pkey], []).append(term)
+        if len(deletedConflicts) > 0:
+            logging.info(f"{len(deletedConflicts)} of {len(termList)} terms deleted by another writer")
+        return groups, deletedConflicts
+
+    def shardIndexesForCriteria(self, queryCriteriaList):
+        """
+        With category partitioning, a query restricted to categories only
+        needs the shards holding those categories.
+        """
+        if self.partitionMode != PARTITION_BY_CATEGORY:
+            return None
+        catCriteria = [cr for cr in queryCriteriaList if cr.criterionType == QueryCriterion.CATEGORY]
+        if len(catCriteria) == 0:
+            return None
+        return sorted(set([self.shardIndexForCategory(cr.value.pkey) for cr in catCriteria]))
+
+    # -------------------------------------- schema
+
+    def ensureDeckTablesExist(self, deck: Deck):
+        super().ensureDeckTablesExist(deck)
+        for shard in self.shards:
+            shard.ensureDeckTablesExist(deck)
+
+    def migrateSchema(self, online=False, batchSize=DEFAULT_MIGRATION_BATCH_SIZE):
+        report = super().migrateSchema(online, batchSize)
+        for shard in self.shards:
+            report.extend(shard.migrateSchema(online, batchSize))
+        return report
+
+    def dryRunSchemaMigration(self, online=False, batchSize=DEFAULT_MIGRATION_BATCH_SIZE):
+        report = super().dryRunSchemaMigration(online, batchSize)
+        for shard in self.shards:
+            report.extend(shard.dryRunSchemaMigration(online, batchSize))
+        return report
+
+    def readDeckRevision(self):
+        # the main file and every shard keep their own counter
+        revisions = [super().readDeckRevision()]
+        revisions.extend([shard.readDeckRevision() for shard in self.shards])
+        if None in revisions:
+            return None
+        return sum(revisions)
+
+    def readTermVersion(self):
+        # one version per shard, only the shards have term rows
+        versions = tuple([shard.readTermVersion() for shard in self.shards])
+        if None in versions:
+            return None
+        return versions
+
+    def queryTermChangesSince(self, deck: Deck, termVersion):
+        self.ensureDeckTablesExist(deck)
+        results = self.mapShardGroups(
+            {n: termVersion[n] for n in range(0, self.shardCount)},
+            lambda shard, version: shard.queryTermChangesSince(deck, version),
+        )
+        terms = ShardedDeckDatabase.mergeTermLists([results[n][0] for n in sorted(results.keys())])
+        deletedPKeys = []
+        for n in sorted(results.keys()):
+            deletedPKeys.extend(results[n][1])
+        newVersion = tuple([results[n][2] for n in sorted(results.keys())])
+        return (terms, deletedPKeys, newVersion)
+
+    # -------------------------------------- term reads
+
+    def readTermAggregates(self):
+        shardAggregates = self.mapShards(lambda shard: shard.readTermAggregates())
+        count = sum([agg[0] for agg in shardAggregates])
+        binSum = sum([agg[1] for agg in shardAggregates])
+        rbinSum = sum([agg[2] for agg in shardAggregates])
+        return (count, binSum, rbinSum)
+
+    def queryForAllDeckTerms(self, deck: Deck):
+        self.ensureDeckTablesExist(deck)
+        return ShardedDeckDatabase.mergeTermLists(
+            self.mapShards(lambda shard: shard.queryForAllDeckTerms(deck))
+        )
+
+    def queryForDeckTerms(
+        self, deck: Deck, category: Category = None, binValues: list = None
+    ):
+        self.ensureDeckTablesExist(deck)
+        shardIndexes = None
+        if None != category and self.partitionMode == PARTITION_BY_CATEGORY:
+            shardIndexes = [self.shardIndexForCategory(category.pkey)]
+        return ShardedDeckDatabase.mergeTermLists(
+            self.mapShards(
+                lambda shard: shard.queryForDeckTerms(deck, category, binValues),
+                shardIndexes,
+            )
+        )
+
+    def queryByCriteria(self, deck: Deck, queryCriteriaList):
+        whereClauseSQL, params, tagCriteria = DeckDatabase.compileQueryCriteria(queryCriteriaList)
+
+        results = ShardedDeckDatabase.mergeTermLists(
+            self.mapShards(
+                lambda shard: shard.queryTermsWhere(whereClauseSQL, params),
+                self.shardIndexesForCriteria(queryCriteriaList),
+            )
+        )
+        if len(results) == 0:
+            return []
+
+        return DeckDatabase.filterByTagCriteria(deck, results, tagCriteria)
+
+    def iterTermRowsByQuestion(self, fetchSize=MERGE_FETCH_SIZE):
+        return heapq.merge(
+            *[shard.iterTermRowsByQuestion(fetchSize) for shard in self.shards],
+            key=lambda row: (row[1], row[0]),
+        )
+
+    # -------------------------------------- bulk tagging
+
+    def termKeyTableName(self):
+        # terms live in the shards; the main file has their pkeys
+        return SHARD_KEYS_TABLE_NAME
+
+    def queryTermPKeysByCriteria(self, deck: Deck, queryCriteriaList):
+        # the tag relations are not in the shards; filter by tag in memory
+        return [term.pkey for term in self.queryByCriteria(deck, queryCriteriaList)]
+
+    def applyTagByCriteria(self, deck: Deck, tag: Tag, queryCriteriaList):
+        return self.applyTagToTermPKeys(
+            deck, tag, self.queryTermPKeysByCriteria(deck, queryCriteriaList)
+        )
+
+    def removeTagByCriteria(self, deck: Deck, tag: Tag, queryCriteriaList):
+        return self.removeTagFromTermPKeys(
+            deck, tag, self.queryTermPKeysByCriteria(deck, queryCriteriaList)
+        )
+
+    # -------------------------------------- bulk edits
+
+    def bulkUpdateByCriteria(self, deck: Deck, queryCriteriaList, columnValues: dict):
+        # terms may have to move between shards, so update them as Terms
+        for column in columnValues:
+            if not column in BULK_EDIT_COLUMNS:
+                raise Exception(f"Column {column} cannot be bulk edited.")
+        attributeValues = {BULK_EDIT_COLUMNS[column]: value for column, value in columnValues.items()}
+
+        terms = self.queryByCriteria(deck, queryCriteriaList)
+        for term in terms:
+            for name, value in attributeValues.items():
+                setattr(term, name, value)
+        # only rows changed between the query and the update conflict
+        conflictedPKeys = set([c.term.pkey for c in self.updateTerms(deck, terms)])
+        terms = [t for t in terms if not t.pkey in conflictedPKeys]
+
+        deck.updateTermAttributes([t.pkey for t in terms], attributeValues)
+        for deckTerm, term in zip(deck.getTermsByPKeys([t.pkey for t in terms]), terms):
+            deckTerm.rowVersion = term.rowVersion
+        return len(terms)
+
+    def deleteByCriteria(self, deck: Deck, queryCriteriaList):
+        pkeys = self.queryTermPKeysByCriteria(deck, queryCriteriaList)
+        self.deleteTermsByPKeys(deck, pkeys)
+        deck.removeTermsByPKeys(pkeys)
+        return len(pkeys)
+
+    # -------------------------------------- term writes
+
+    def insertTerms(self, deck: Deck, termList: list):
+        self.ensureDeckTablesExist(deck)
+
+        tagRelateSQL = f"INSERT INTO {TAG_RELATION_TABLE_NAME} (term, tag) VALUES (?, ?);"
+
+        # allocate pkeys from the shard directory under a write lock
+        with self.transaction() as cur:
+            maxPK = cur.execute(
+                f"SELECT COALESCE(MAX(pkey), 0) FROM {SHARD_KEYS_TABLE_NAME};"
+            ).fetchone()[0]
+
+            keyRows = []
+            shardRows = {}
+            shardTerms = {}
+            tagRows = []
+            for term in termList:
+                maxPK += 1
+                term.pkey = maxPK
+
+                category_pkey = term.category
+                if type(term.category) is Category:
+                    category_pkey = term.category.pkey
+
+                shardIndex = self.shardIndexForNewTerm(term.pkey, category_pkey)
+                keyRows.append((term.pkey, shardIndex))
+                shardRows.setdefault(shardIndex, []).append(
+                    (term.pkey, term.question, term.answer, category_pkey,
+                     term.bin, term.reversedBin, term.lastDrillTime,
+                     1 if term.hasPaperCard else 0)
+                )
+                shardTerms.setdefault(shardIndex, []).append(term)
+                if term.tags is not None:
+                    for tag in term.tags:
+                        tagRows.append((term.pkey, tag.pkey))
+
+            cur.executemany(
+                f"INSERT INTO {SHARD_KEYS_TABLE_NAME} (pkey, shard) VALUES (?, ?);", keyRows
+            )
+            cur.executemany(tagRelateSQL, tagRows)
+
+            versions = self.mapShardGroups(shardRows, lambda shard, rows: shard.insertTermRows(rows))
+            for shardIndex, terms in shardTerms.items():
+                for term in terms:
+                    term.rowVersion = versions[shardIndex]
+
+    def bulkLoadTransaction(self, tableNames: list):
+        # the shards are written on the shard threads, which cannot join
+        # a transaction held here, so only the main file's tables (the
+        # tag relations) are loaded without their indexes
+        return super().bulkLoadTransaction(
+            [name for name in tableNames if name != DECK_TERMS_TABLE_NAME]
+        )
+
+    def readMaxTermPKey(self):
+        return self.getDbConnection().execute(
+            f"SELECT COALESCE(MAX(pkey), 0) FROM {SHARD_KEYS_TABLE_NAME};"
+        ).fetchone()[0]
+
+    def insertGeneratedTermRows(self, deck: Deck, rows: list, tagRows: list):
+        self.ensureDeckTablesExist(deck)
+
+        keyRows = []
+        shardRows = {}
+        for row in rows:
+            shardIndex = self.shardIndexForNewTerm(row[0], row[3])
+            keyRows.append((row[0], shardIndex))
+            shardRows.setdefault(shardIndex, []).append(row)
+
+        with self.transaction() as cur:
+            cur.executemany(
+                f"INSERT INTO {SHARD_KEYS_TABLE_NAME} (pkey, shard) VALUES (?, ?);", keyRows
+            )
+            cur.executemany(f"INSERT INTO {TAG_RELATION_TABLE_NAME} (term, tag) VALUES (?, ?);", tagRows)
+            self.mapShardGroups(shardRows, lambda shard, rows: shard.insertTermRows(rows))
+
+    def updateTerms(self, deck: Deck, termList: list):
+        self.ensureDeckTablesExist(deck)
+
+        # update (with version checks) where the terms are, then move the
+        # terms whose category now belongs to another shard
+        groups, deletedConflicts = self.groupTermsByShard(termList)
+        results = self.mapShardGroups(groups, lambda shard, terms: shard.updateTerms(deck, terms))
+        conflicts = ShardedDeckDatabase.mergeConflicts([deletedConflicts] + list(results.values()))
+
+        if self.partitionMode == PARTITION_BY_CATEGORY:
+            conflictedTerms = set([id(c.term) for c in conflicts])
+            for shardIndex, terms in groups.items():
+                for term in terms:
+                    if id(term) in conflictedTerms:
+                        continue
+                    targetIndex = self.shardIndexForCategory(term.category)
+                    if targetIndex != shardIndex:
+                        term.rowVersion = self.moveTerm(term.pkey, shardIndex, targetIndex)
+        return conflicts
+
+    def udpateTermCategory(self, deck: Deck, catpk, termpk):
+        shardIndex = self.lookupShardIndexes([termpk]).get(termpk)
+        if None == shardIndex:
+            raise Exception(f"Term {termpk} not found in any shard")
+
+        version = self.shards[shardIndex].udpateTermCategory(deck, catpk, termpk)
+        if self.partitionMode == PARTITION_BY_CATEGORY:
+            targetIndex = self.shardIndexForCategory(catpk)
+            if targetIndex != shardIndex:
+                version = self.moveTerm(termpk, shardIndex, targetIndex)
+        return version
+
+    def moveTerm(self, termpk, fromIndex, toIndex):
+        """
+        Move a term row between shards, e.g. after a category change
+        with category partitioning. Returns the row version of the term
+        in its new shard (None if it was not found).
+        """
+        columnNamesCommaStr = ",".join(DECK_TERMS_COLUMN_NAMES)
+        fromCon = self.shards[fromIndex].getDbConnection()
+        row = fromCon.execute(
+            f"SELECT {columnNamesCommaStr} FROM {DECK_TERMS_TABLE_NAME} WHERE pkey = ?;",
+            [termpk],
+        ).fetchone()
+        if None == row:
+            return None
+
+        # a new version in the target shard, so readers of that shard's
+        # changes see the term arrive
+        version = self.shards[toIndex].insertTermRows([row])
+        fromCon.execute(f"DELETE FROM {DECK_TERMS_TABLE_NAME} WHERE pkey = ?;", [termpk])
+        fromCon.commit()
+
+        con = self.getDbConnection()
+        con.execute(
+            f"UPDATE {SHARD_KEYS_TABLE_NAME} SET shard = ? WHERE pkey = ?;", [toIndex, termpk]
+        )
+        con.commit()
+        return version
+
+    def deleteTerm(self, deck: Deck, term: Term):
+        self.ensureDeckTablesExist(deck)
+
+        shardIndex = self.lookupShardIndexes([term.pkey]).get(term.pkey)
+        if None != shardIndex:
+            self.shards[shardIndex].deleteTerm(deck, term)
+
+        con = self.getDbConnection()
+        con.execute(f"DELETE FROM {TAG_RELATION_TABLE_NAME} WHERE term = ?;", [term.pkey])
+        con.execute(f"DELETE FROM {SHARD_KEYS_TABLE_NAME} WHERE pkey = ?;", [term.pkey])
+        con.commit()
+
+    def deleteTermsByPKeys(self, deck: Deck, pkeys: list):
+        self.ensureDeckTablesExist(deck)
+
+        shardIndexes = self.lookupShardIndexes(pkeys)
+        groups = {}
+        for pkey, shardIndex in shardIndexes.items():
+            groups.setdefault(shardIndex, []).append(pkey)
+
+        def deleteFromShard(shard, shardPKeys):
+            shardCon = shard.getDbConnection()
+            shardCon.executemany(
+                f"DELETE FROM {DECK_TERMS_TABLE_NAME} WHERE pkey = ?;", [(pk,) for pk in shardPKeys]
+            )
+            shardCon.commit()
+
+        self.mapShardGroups(groups, deleteFromShard)
+
+        params = [(pk,) for pk in pkeys]
+        con = self.getDbConnection()
+        con.executemany(f"DELETE FROM {TAG_RELATION_TABLE_NAME} WHERE term = ?;", params)
+        con.executemany(f"DELETE FROM {SHARD_KEYS_TABLE_NAME} WHERE pkey = ?;", params)
+        con.commit()
+
+    def updateTermBins(
+        self, deck: Deck, termList: list, isReversedDrill=False
+    ):
+        self.ensureDeckTablesExist(deck)
+        groups, deletedConflicts = self.groupTermsByShard(termList)
+        results = self.mapShardGroups(
+            groups, lambda shard, terms: shard.updateTermBins(deck, terms, isReversedDrill)
+        )
+        return ShardedDeckDatabase.mergeConflicts([deletedConflicts] + list(results.values()))
+
+    def deleteDeckCategory(self, deck: Deck, category):
+        self.ensureDeckTablesExist(deck)
+
+        clearSQL = f"UPDATE {DECK_TERMS_TABLE_NAME} SET category = NULL WHERE category = ?;"
+
+        def clearCategory(shard):
+            shardCon = shard.getDbConnection()
+            shardCon.execute(clearSQL, [category.pkey])
+            shardCon.commit()
+
+        if self.partitionMode == PARTITION_BY_CATEGORY:
+            # terms with no category live in shard 0
+            fromIndex = self.shardIndexForCategory(category.pkey)
+            clearCategory(self.shards[fromIndex])
+            if fromIndex != 0:
+                fromCon = self.shards[fromIndex].getDbConnection()
+                rows = fromCon.execute(
+                    f"SELECT pkey FROM {DECK_TERMS_TABLE_NAME} WHERE category IS NULL;"
+                ).fetchall()
+                for row in rows:
+                    self.moveTerm(row[0], fromIndex, 0)
+        else:
+            self.mapShards(clearCategory)
+
+        # foreign keys are not enforced here, so remove the overrides too
+        con = self.getDbConnection()
+        con.execute(f"DELETE FROM {CATEGORY_PREFS_TABLE_NAME} WHERE category = ?;", [category.pkey])
+        con.execute(f"DELETE FROM {CATEGORY_TABLE_NAME} WHERE pkey = ?;", [category.pkey])
+        con.commit()
+
+        deck.removeCategory(category)
+
+    # -------------------------------------- integrity
+
+    def checkIntegrity(self, deck: Deck, repair=False):
+        """
+        Tag relations are checked in the main file against the shard
+        keys, and each shard's term categories against the categories in
+        the main file (copied into a temp table of the shard).
+        """
+        from .deckintegrity import (
+            runIntegrityChecks,
+            tagRelationChecks,
+            termCategoryCheck,
+            scopedPrefChecks,
+        )
+
+        self.ensureDeckTablesExist(deck)
+        report = runIntegrityChecks(
+            self.getDbConnection(),
+            tagRelationChecks(SHARD_KEYS_TABLE_NAME) + scopedPrefChecks(),
+            repair,
+        )
+
+        categoryParams = [
+            row
+            for row in self.getDbConnection().execute(f"SELECT pkey FROM {CATEGORY_TABLE_NAME};")
+        ]
+
+        def checkShard(shard):
+            shardCon = shard.getDbConnection()
+            shardCon.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {INTEGRITY_CATEGORIES_TABLE_NAME} (pkey INTEGER PRIMARY KEY);"
+            )
+            shardCon.execute(f"DELETE FROM {INTEGRITY_CATEGORIES_TABLE_NAME};")
+            shardCon.executemany(
+                f"INSERT INTO {INTEGRITY_CATEGORIES_TABLE_NAME} (pkey) VALUES (?);", categoryParams
+            )
+            shardCon.commit()
+            return runIntegrityChecks(
+                shardCon, [termCategoryCheck(INTEGRITY_CATEGORIES_TABLE_NAME)], repair
+            )
+
+        for shardReport in self.mapShards(checkShard):
+            for name, count in shardReport.items():
+                report[name] = report.get(name, 0) + count
+
+        if repair and self.partitionMode == PARTITION_BY_CATEGORY:
+            # terms with no category live in shard 0
+            for fromIndex in range(1, self.shardCount):
+                rows = (
+                    self.shards[fromIndex]
+                    .getDbConnection()
+                    .execute(f"SELECT pkey FROM {DECK_TERMS_TABLE_NAME} WHERE category IS NULL;")
+                    .fetchall()
+                )
+                for row in rows:
+                    self.moveTerm(row[0], fromIndex, 0)
+
+        return report
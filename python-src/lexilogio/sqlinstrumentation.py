@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 16:02:27 2026
+
+@author: mathaes
+
+SQL statement instrumentation for deck databases. When a DeckDatabase is
+given a SqlInstrumentation, its connections are opened as
+InstrumentedConnection, which records for each statement:
+
+    - latency, including the time spent fetching its rows
+    - rows returned (SELECT) or changed (INSERT/UPDATE/DELETE)
+    - SQLite VM steps, counted by a progress handler
+
+A trace callback also counts every statement SQLite starts, including
+the implicit BEGIN/COMMIT statements the sqlite3 module issues.
+
+Statements slower than the slow-query threshold are logged and kept in a
+bounded slow-query list. The first time each distinct statement runs,
+its EXPLAIN QUERY PLAN is captured; plans that scan a whole table
+(rather than searching or scanning an index) are logged once, at info
+level since loading a whole deck is meant to scan, and kept.
+
+Without instrumentation, DeckDatabase uses plain sqlite3 connections and
+none of this costs anything.
+"""
+
+import collections
+import logging
+import sqlite3
+import threading
+import time
+
+DEFAULT_SLOW_QUERY_SECONDS = 0.1
+MAX_SLOW_QUERIES = 100
+# progress handler granularity, in SQLite VM instructions
+PROGRESS_STEP_INTERVAL = 1000
+
+EXPLAINABLE_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "INSERT")
+
+
+def normalizeSQL(sql):
+    return " ".join(sql.split())
+
+
+def isFullScanPlanDetail(detail):
+    # e.g. "SCAN deck_terms" (or "SCAN TABLE deck_terms" on older SQLite);
+    # index scans read "SCAN deck_terms USING [COVERING] INDEX ..."
+    return detail.startswith("SCAN ") and not "INDEX" in detail and not "CONSTANT ROW" in detail
+
+
+class StatementStats:
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.totalSeconds = 0.0
+        self.maxSeconds = 0.0
+        self.rows = 0
+        self.vmSteps = 0
+
+    def toDict(self):
+        return {
+            "sql": self.sql,
+            "count": self.count,
+            "totalSeconds": self.totalSeconds,
+            "maxSeconds": self.maxSeconds,
+            "rows": self.rows,
+            "vmSteps": self.vmSteps,
+        }
+
+
+class SlowQuery:
+    def __init__(self, sql, params, seconds, rows, plan):
+        self.sql = sql
+        self.params = params
+        self.seconds = seconds
+        self.rows = rows
+        self.plan = plan
+
+    def __repr__(self):
+        return f"{self.seconds * 1000:.1f}ms, {self.rows} rows: {self.sql}"
+
+
+class SqlInstrumentation:
+    """
+    Statement statistics shared by all connections of a deck database
+    (including shard connections used from worker threads).
+    """
+
+    def __init__(self, slowQuerySeconds=DEFAULT_SLOW_QUERY_SECONDS, explainPlans=True):
+        self.slowQuerySeconds = slowQuerySeconds
+        self.explainPlans = explainPlans
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.statementStats = {}
+            self.slowQueries = collections.deque(maxlen=MAX_SLOW_QUERIES)
+            # normalized sql -> plan detail lines, for each distinct statement
+            self.queryPlans = {}
+            # normalized sql -> plan detail lines, for full table scans only
+            self.fullScans = {}
+            self.tracedStatements = 0
+            self.commits = 0
+
+    def connect(self, dbPath, checkSameThread=True):
+        con = sqlite3.connect(
+            dbPath, check_same_thread=checkSameThread, factory=InstrumentedConnection
+        )
+        con.attachInstrumentation(self)
+        return con
+
+    def onTrace(self, sql):
+        with self.lock:
+            self.tracedStatements += 1
+            if sql.startswith("COMMIT"):
+                self.commits += 1
+
+    def needsQueryPlan(self, sql):
+        return self.explainPlans and not sql in self.queryPlans
+
+    def recordQueryPlan(self, sql, planDetails):
+        fullScanDetails = [d for d in planDetails if isFullScanPlanDetail(d)]
+        with self.lock:
+            self.queryPlans[sql] = planDetails
+            if len(fullScanDetails) > 0:
+                self.fullScans[sql] = planDetails
+        if len(fullScanDetails) > 0:
+            logging.info(f"Full table scan ({'; '.join(fullScanDetails)}): {sql}")
+
+    def recordStatement(self, sql, params, seconds, rows, vmSteps):
+        with self.lock:
+            stats = self.statementStats.get(sql)
+            if None == stats:
+                stats = StatementStats(sql)
+                self.statementStats[sql] = stats
+            stats.count += 1
+            stats.totalSeconds += seconds
+            stats.rows += rows
+            stats.vmSteps += vmSteps
+            if seconds > stats.maxSeconds:
+                stats.maxSeconds = seconds
+
+            if None == self.slowQuerySeconds or seconds < self.slowQuerySeconds:
+                return
+            slowQuery = SlowQuery(sql, params, seconds, rows, self.queryPlans.get(sql))
+            self.slowQueries.append(slowQuery)
+        logging.warning(f"Slow query: {slowQuery}")
+
+    def counters(self):
+        """
+        Return the aggregate counters as a dict.
+        """
+        with self.lock:
+            return {
+                "statements": sum(s.count for s in self.statementStats.values()),
+                "distinctStatements": len(self.statementStats),
+                "totalSeconds": sum(s.totalSeconds for s in self.statementStats.values()),
+                "rows": sum(s.rows for s in self.statementStats.values()),
+                "vmSteps": sum(s.vmSteps for s in self.statementStats.values()),
+                "slowQueries": len(self.slowQueries),
+                "fullScanStatements": len(self.fullScans),
+                "tracedStatements": self.tracedStatements,
+                "commits": self.commits,
+            }
+
+    def topStatements(self, count=10):
+        """
+        Return the StatementStats with the largest total time, slowest first.
+        """
+        with self.lock:
+            stats = list(self.statementStats.values())
+        stats.sort(key=lambda s: s.totalSeconds, reverse=True)
+        return stats[:count]
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def attachInstrumentation(self, instrumentation: SqlInstrumentation):
+        self.instrumentation = instrumentation
+        self.progressSteps = 0
+        self.set_trace_callback(instrumentation.onTrace)
+        self.set_progress_handler(self.onProgress, PROGRESS_STEP_INTERVAL)
+
+    def onProgress(self):
+        self.progressSteps += PROGRESS_STEP_INTERVAL
+        # returning non-zero would abort the statement
+        return 0
+
+    def cursor(self, factory=None):
+        return super().cursor(factory if None != factory else InstrumentedCursor)
+
+    # Connection.execute would create a plain cursor, bypassing cursor()
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def explainQueryPlan(self, sql, params):
+        try:
+            planRows = sqlite3.Cursor(self).execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error as ex:
+            logging.debug(f"Could not explain {sql}: {ex}")
+            return []
+        # rows are (id, parent, notused, detail)
+        return [row[3] for row in planRows]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    A cursor that reports each statement to the connection's
+    SqlInstrumentation once the statement is complete: for statements
+    returning rows, when the rows are exhausted or the cursor is reused
+    or closed.
+    """
+
+    pendingSQL = None
+
+    def beginStatement(self, sql, params, seconds, startSteps):
+        self.pendingSQL = normalizeSQL(sql)
+        self.pendingParams = params
+        self.pendingSeconds = seconds
+        self.pendingRows = 0
+        self.pendingStartSteps = startSteps
+        if None == self.description:
+            # no result rows, statement is already complete
+            self.pendingRows = max(self.rowcount, 0)
+            self.finishStatement()
+
+    def finishStatement(self):
+        sql = self.pendingSQL
+        if None == sql:
+            return
+        self.pendingSQL = None
+
+        con = self.connection
+        instrumentation = con.instrumentation
+        vmSteps = con.progressSteps - self.pendingStartSteps
+        if (
+            instrumentation.needsQueryPlan(sql)
+            and sql.upper().startswith(EXPLAINABLE_STATEMENTS)
+        ):
+            instrumentation.recordQueryPlan(sql, con.explainQueryPlan(sql, self.pendingParams))
+        instrumentation.recordStatement(
+            sql, self.pendingParams, self.pendingSeconds, self.pendingRows, vmSteps
+        )
+
+    def execute(self, sql, parameters=()):
+        self.finishStatement()
+        startSteps = self.connection.progressSteps
+        startTime = time.perf_counter()
+        super().execute(sql, parameters)
+        self.beginStatement(sql, parameters, time.perf_counter() - startTime, startSteps)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.finishStatement()
+        # materialize so the first parameter set can be used for EXPLAIN
+        seq_of_parameters = list(seq_of_parameters)
+        startSteps = self.connection.progressSteps
+        startTime = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        firstParams = seq_of_parameters[0] if len(seq_of_parameters) > 0 else ()
+        self.beginStatement(sql, firstParams, time.perf_counter() - startTime, startSteps)
+        return self
+
+    def fetchone(self):
+        startTime = time.perf_counter()
+        row = super().fetchone()
+        if None != self.pendingSQL:
+            self.pendingSeconds += time.perf_counter() - startTime
+            if None == row:
+                self.finishStatement()
+            else:
+                self.pendingRows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        startTime = time.perf_counter()
+        if None == size:
+            size = self.arraysize
+        rows = super().fetchmany(size)
+        if None != self.pendingSQL:
+            self.pendingSeconds += time.perf_counter() - startTime
+            self.pendingRows += len(rows)
+            if len(rows) < size:
+                self.finishStatement()
+        return rows
+
+    def fetchall(self):
+        startTime = time.perf_counter()
+        rows = super().fetchall()
+        if None != self.pendingSQL:
+            self.pendingSeconds += time.perf_counter() - startTime
+            self.pendingRows += len(rows)
+            self.finishStatement()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if None == row:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self.finishStatement()
+        super().close()
+
+    def __del__(self):
+        # e.g. con.execute(...).fetchone() leaves the statement pending
+        try:
+            self.finishStatement()
+        except Exception:
+            pass
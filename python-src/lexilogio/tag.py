@@ -8,9 +8,11 @@ Created on Sat Apr 22 11:25:32 2023
 
 
 class Tag:
-    def __init__(self, name="", pkey=None):
+    def __init__(self, name="", pkey=None, parent=None):
         self.name = name
         self.pkey = pkey
+        # pkey of the parent tag, None for a top level tag
+        self.parent = parent
         
     def __repr__(self):
         return self.name
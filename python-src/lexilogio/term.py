@@ -19,6 +19,23 @@ class Term:
         self.updated = False
         self.hasPaperCard = False
         self.tags = None
+        # term version of the row when read from the database; None if
+        # unknown, and then not checked on writes
+        self.rowVersion = None
+
+    def copyStoredFields(self, storedTerm):
+        """
+        Set the fields stored in the term row (all but pkey and tags)
+        from storedTerm, e.g. after another process changed the row.
+        """
+        self.question = storedTerm.question
+        self.answer = storedTerm.answer
+        self.category = storedTerm.category
+        self.bin = storedTerm.bin
+        self.reversedBin = storedTerm.reversedBin
+        self.lastDrillTime = storedTerm.lastDrillTime
+        self.hasPaperCard = storedTerm.hasPaperCard
+        self.rowVersion = storedTerm.rowVersion
 
     def questionSort(term):
         return term.question
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 19:02:17 2026
+
+@author: mathaes
+
+Bitsets of deck terms, for tag and category membership. A bitset is a
+plain Python int whose bit n is set when the term at ordinal n (its
+position in deck.terms) is a member, so union, intersection and
+difference are single C-level int operations over the whole deck and a
+bitset costs one bit per deck term however many terms it holds.
+
+TermMembership holds the ordinals of a deck's terms, the category
+bitsets (built together, in one pass over the terms) and the tag
+bitsets (each built on first use from the deck's tag -> term pkey lists).
+"""
+
+import sys
+
+EMPTY_BITSET = 0
+
+
+def bitsetUnion(bitsets):
+    result = EMPTY_BITSET
+    for bits in bitsets:
+        result |= bits
+    return result
+
+
+def bitsetIntersection(bitsets):
+    """
+    Intersect the bitsets, smallest (by highest member) first so an empty
+    intermediate result ends the loop early. An empty list gives the
+    empty bitset.
+    """
+    bitsets = sorted(bitsets, key=lambda bits: bits.bit_length())
+    if len(bitsets) == 0:
+        return EMPTY_BITSET
+    result = bitsets[0]
+    for bits in bitsets[1:]:
+        if result == EMPTY_BITSET:
+            break
+        result &= bits
+    return result
+
+
+def bitsetDifference(bits, removedBits):
+    return bits & ~removedBits
+
+
+if sys.version_info >= (3, 10):
+
+    def bitsetCount(bits):
+        return bits.bit_count()
+
+else:
+
+    def bitsetCount(bits):
+        return bin(bits).count("1")
+
+
+def bitsetOrdinals(bits):
+    """
+    Return the ordinals of the members of bits, ascending. The search for
+    set bits runs in C over the binary string, so the cost is one pass
+    over the deck plus one step per member.
+    """
+    if bits == EMPTY_BITSET:
+        return []
+    # least significant bit first
+    bitString = format(bits, "b")[::-1]
+    ordinals = []
+    ordinal = bitString.find("1")
+    while ordinal >= 0:
+        ordinals.append(ordinal)
+        ordinal = bitString.find("1", ordinal + 1)
+    return ordinals
+
+
+def bitsetFromOrdinals(ordinals, termCount):
+    bitBytes = bytearray((termCount + 7) // 8)
+    for ordinal in ordinals:
+        bitBytes[ordinal >> 3] |= 1 << (ordinal & 7)
+    return int.from_bytes(bitBytes, "little")
+
+
+class TermMembership:
+    def __init__(self, terms):
+        self.terms = terms
+        self.termCount = len(terms)
+        self.ordinalForPKey = {t.pkey: ordinal for ordinal, t in enumerate(terms)}
+        self.categoryBitsets = None
+        self.tagBitsets = {}
+
+    def termsForBitset(self, bits):
+        terms = self.terms
+        return [terms[ordinal] for ordinal in bitsetOrdinals(bits)]
+
+    def pkeysForBitset(self, bits):
+        terms = self.terms
+        return [terms[ordinal].pkey for ordinal in bitsetOrdinals(bits)]
+
+    def bitsetForPKeys(self, pkeys):
+        ordinalForPKey = self.ordinalForPKey
+        return bitsetFromOrdinals(
+            [ordinalForPKey[pk] for pk in pkeys if pk in ordinalForPKey], self.termCount
+        )
+
+    def categoryBitset(self, categoryPK):
+        if None == self.categoryBitsets:
+            categoryOrdinals = {}
+            for ordinal, t in enumerate(self.terms):
+                categoryOrdinals.setdefault(t.category, []).append(ordinal)
+            self.categoryBitsets = {
+                catPK: bitsetFromOrdinals(ordinals, self.termCount)
+                for catPK, ordinals in categoryOrdinals.items()
+            }
+        return self.categoryBitsets.get(categoryPK, EMPTY_BITSET)
+
+    def tagBitset(self, tagPK, tagToTerms):
+        bits = self.tagBitsets.get(tagPK)
+        if None == bits:
+            bits = self.bitsetForPKeys(tagToTerms.get(tagPK, []))
+            self.tagBitsets[tagPK] = bits
+        return bits
+
+    def invalidateTag(self, tagPK):
+        self.tagBitsets.pop(tagPK, None)
+
+    def invalidateCategories(self):
+        self.categoryBitsets = None
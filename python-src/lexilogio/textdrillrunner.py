@@ -11,13 +11,25 @@ import sys
 import os
 import string
 import logging
+import time
 import copy
+import glob
+import random
+from datetime import date
 
-from lexilogio.deckdatabase import QueryCriterion
-from lexilogio.term import Term
 from lexilogio.version import LEXILOGIO_PRODUCT_VERSION_STR
 
 from lexilogio.controller import Controller
+from lexilogio.deck import Deck
+from lexilogio.deckcatalog import DeckCatalog
+from lexilogio.deckdatabase import DeckDatabase, QueryCriterion, DECK_SCHEMA_VERSION
+from lexilogio.shardeddeckdatabase import openDeckDatabase
+from lexilogio.term import Term
+
+# Note: the controller loads the deck modules at startup anyway. Only the
+# profiler (cProfile, pstats and tracemalloc, about 20ms), the deck
+# generator and cross-deck search are imported by the commands using them,
+# as is the drill module by Controller.makeNewDrill.
 
 ARG_DIR = "dir"
 ARG_DECK = "deck"
@@ -27,9 +39,41 @@ ARG_BINS = "bins"
 ARG_COUNT = "count"
 ARG_FILE = "file"
 ARG_LOGLEVEL = "loglevel"
+ARG_MODE = "mode"
+ARG_SHARDS = "shards"
+ARG_PARTITION = "partition"
+ARG_SNAPSHOT = "snapshot"
+ARG_SLOW_QUERY = "slowquery"
+ARG_METRICS = "metrics"
+ARG_PROFILE = "profile"
+ARG_SEED = "seed"
+ARG_TEXT = "text"
+ARG_LIMIT = "limit"
+ARG_REVIEWS = "reviews"
 
 CMD_IMPORT = "import"
 CMD_EXPORT = "export"
+CMD_MIGRATE = "migrate"
+CMD_MERGE = "merge"
+CMD_DRILL = "drill"
+CMD_CHECK = "check"
+CMD_STATS = "stats"
+CMD_TUNE = "tune"
+CMD_DECKS = "decks"
+CMD_SEARCH = "search"
+CMD_GENERATE = "generate"
+
+DEFAULT_SEARCH_LIMIT = 50
+
+MERGE_MODE_mirror = "mirror"
+
+MIGRATE_MODE_offline = "offline"
+MIGRATE_MODE_online = "online"
+MIGRATE_MODE_dryrun = "dryrun"
+
+CHECK_MODE_repair = "repair"
+
+TUNE_MODE_dryrun = "dryrun"
 
 INPUT_MODE_mainmenu = 0
 INPUT_MODE_startDrill = 1
@@ -61,8 +105,18 @@ class TextDrillRunner:
 
         self.controller: Controller = Controller()
 
-    def initialize(self, dataDir, deckName=None):
-        self.controller.initialize(dataDir, deckName)
+        # operation metrics are written here on exit, if set
+        self.metricsFilePath = None
+
+        # RunProfiler mode for batch commands, or None
+        self.profileMode = None
+
+        # Future of an import running in the background, or None
+        self.backgroundImport = None
+
+    def initialize(self, dataDir, deckName=None, shardCount=0, partitionMode="hash",
+                   useSnapshot=False):
+        self.controller.initialize(dataDir, deckName, shardCount, partitionMode, useSnapshot)
 
         # load or create deck
         deck = self.controller.deck
@@ -105,7 +159,35 @@ class TextDrillRunner:
         print(f"  SCORE: {score}  REVERSE SCORE: {rev_score}")
         print(f"  ({term_count} terms, {avg} average, {rev_avg} reverse-average)")
         
+    def check_background_import(self):
+        if None == self.backgroundImport or not self.backgroundImport.done():
+            return
+        importFuture = self.backgroundImport
+        self.backgroundImport = None
+        if None != importFuture.exception():
+            print(f"ERROR: background import failed: {importFuture.exception()}")
+            return
+        print(f"Background import of {importFuture.result()} terms done.")
+        self.refresh_deck()
+
+    def refresh_deck(self):
+        # picks up terms changed by other programs (or a background import)
+        changeCount = self.controller.refreshDeck()
+        if None != changeCount and changeCount > 0:
+            print(f"Deck updated: {changeCount} terms changed.")
+
+    def print_term_conflicts(self, conflicts):
+        for conflict in conflicts:
+            if None == conflict.storedTerm:
+                print(f"  {conflict.localTerm} was deleted by another program, not saved.")
+            elif conflict.isWritten:
+                print(f"  {conflict.term} was also changed by another program; your later drill result was saved.")
+            else:
+                print(f"  {conflict.localTerm} was changed by another program, not saved; it is now {conflict.term}")
+
     def run_mainmenu_input(self):
+        self.check_background_import()
+        self.refresh_deck()
         print(f"\n{LEXILOGIO_PRODUCT_VERSION_STR}")
         print("---------")
         print(f"current deck: {self.controller.deck.name}")
@@ -114,7 +196,8 @@ class TextDrillRunner:
         print("  (d) drill         (p) preferences    (a) add card")
         print("  (i) import cards  (e) export cards   (m) manage cards")
         print("  (c) categories    (t) tags           (r) random-words")
-        print("  (L) reload database            (x) exit")
+        print("  (o) open deck     (f) find in all decks")
+        print("  (L) reload database  (s) profile  (x) exit")
 
         choice = input(": ").strip().lower()
         if choice == "d" or choice == 'δ':
@@ -149,22 +232,103 @@ class TextDrillRunner:
             self.inputMode = INPUT_MODE_randomWords
             self.run_random_words()
             self.inputMode = INPUT_MODE_mainmenu
+        elif choice == "o" or choice == 'ο':
+            self.run_open_deck()
+        elif choice == "f" or choice == 'φ':
+            text = input("Find text (blank to cancel): ").strip()
+            if len(text) > 0:
+                self.do_deck_search(self.controller.dataDir, text)
         elif choice == "l" or choice == 'λ':
             self.controller.reloadDeck()
             print("Deck reloaded.")
+        elif choice == "s" or choice == 'σ':
+            self.print_profile()
         elif choice == "x" or choice == 'χ':
+            if None != self.backgroundImport and not self.backgroundImport.done():
+                print("Waiting for the background import to finish...")
+            self.controller.shutdown()
+            self.log_sql_counters()
+            self.write_metrics_file()
             sys.exit(0)
         else:
             print(f"Option '{choice}' not recognized.")
 
+    def run_open_deck(self):
+        entries = self.controller.listDecks()
+        openDeckNames = self.controller.getOpenDeckNames()
+        print("Decks:")
+        for n, entry in enumerate(entries):
+            if entry.deckName == self.controller.deckName:
+                marker = "*"
+            elif entry.deckName in openDeckNames:
+                marker = "+"
+            else:
+                marker = " "
+            print(f" {marker}{n + 1:3d}. {entry}")
+        print("(* current deck, + loaded)")
+
+        choice = input("Deck number or name (new name creates a deck, blank to cancel): ").strip()
+        if choice == "":
+            return
+        deckName = choice
+        if choice.isdigit() and int(choice) >= 1 and int(choice) <= len(entries):
+            deckName = entries[int(choice) - 1].deckName
+        if deckName == self.controller.deckName:
+            return
+
+        if None != self.backgroundImport and not self.backgroundImport.done():
+            print("Waiting for the background import to finish...")
+            # blocks until done
+            self.backgroundImport.exception()
+        self.check_background_import()
+        startTime = time.perf_counter()
+        fromCache = self.controller.switchDeck(deckName)
+        elapsed = time.perf_counter() - startTime
+        deck = self.controller.deck
+        source = "from memory" if fromCache else f"from {self.controller.database.getFileName()}"
+        print(f"Opened deck {deck.name} {source} ({len(deck.terms)} terms, {elapsed:.3f}s).")
+
+    def print_profile(self):
+        metrics = self.controller.getOperationMetrics()
+        if None == metrics:
+            print("Operation timing is off (start with metrics=on or metrics=PATH).")
+        else:
+            print("Controller operation profile:")
+            for line in metrics.profileLines():
+                print(line)
+
+        counters = self.controller.getSqlCounters()
+        if None != counters:
+            print("SQL counters:")
+            for name, value in counters.items():
+                print(f"  {name}: {value}")
+
+        self.write_metrics_file()
+
+    def write_metrics_file(self):
+        if None != self.metricsFilePath:
+            self.controller.dumpOperationMetrics(self.metricsFilePath)
+
+    def log_sql_counters(self):
+        counters = self.controller.getSqlCounters()
+        if None == counters:
+            return
+        logging.info(f"SQL counters: {counters}")
+        for stats in self.controller.getSqlInstrumentation().topStatements(5):
+            logging.info(
+                f"  {stats.totalSeconds * 1000:.1f}ms total, {stats.count}x, {stats.rows} rows: {stats.sql}"
+            )
+
     def prepare_and_run_drill(self):
-        self.controller.reloadDeck()
+        self.refresh_deck()
 
         drillTag = None
         drillCategory = None
+        drillQuery = None
+        includeSubtags = False
         earlyExit = False
         
-        typeChoice = input("Enter drill type: (c) category, (t) tag, (a or return) all terms: ").strip().lower()
+        typeChoice = input("Enter drill type: (c) category, (t) tag, (q) query, (a or return) all terms: ").strip().lower()
         
         if typeChoice == 'c' or typeChoice == 'ψ':
             # show a category picker
@@ -176,6 +340,13 @@ class TextDrillRunner:
             drillTag = self.runTagPicker(permit_new_tag=False)
             if type(drillTag) == int and drillTag == -1:
                 earlyExit = True
+            elif None != drillTag and len(self.controller.getTagSubtree(drillTag)) > 1:
+                subtagChoice = input("Include terms with tags below this tag? (y/n) ").strip().lower()
+                includeSubtags = subtagChoice in ['y', 'υ']
+        elif typeChoice == 'q' or typeChoice == ';':
+            drillQuery = self.build_query_criteria()
+            if None == drillQuery:
+                earlyExit = True
         elif typeChoice == 'x' or typeChoice == 'χ':
             earlyExit = True
             
@@ -185,7 +356,10 @@ class TextDrillRunner:
         
         # build drill from params
         print("\nCreating drill...")
-        self.controller.makeNewDrill(category=drillCategory, tag=drillTag)
+        self.controller.makeNewDrill(
+            category=drillCategory, tag=drillTag, queryCriteriaList=drillQuery,
+            includeSubtags=includeSubtags,
+        )
         self.drill = self.controller.drill
 
         if None == self.drill:
@@ -365,9 +539,10 @@ class TextDrillRunner:
         term = self.controller.currentDrillTerm()
 
         flashQuestion = term.question
-        if self.controller.deck.isReversedDrill():
+        if self.controller.isDrillReversed():
             flashQuestion = term.answer
 
+        self.controller.markDrillQuestionShown()
         ret = input(f"\n\t{flashQuestion}\n").strip().lower()
 
         if ret == "x" or ret == "χ":
@@ -382,7 +557,7 @@ class TextDrillRunner:
         # print("DEBUG - run_drill_response_input...")
         term = self.controller.currentDrillTerm()
         flashAnswer = term.answer
-        if self.controller.getPref_isReversedDrill():
+        if self.controller.isDrillReversed():
             flashAnswer = term.question
 
         rating = 0
@@ -430,14 +605,17 @@ class TextDrillRunner:
             if yn.startswith('y') or yn.startswith('υ'):
                 self.tag_missed_terms(missed_terms)
                 
-        self.controller.saveUpdatedDrillTerms()
+        conflicts = self.controller.saveUpdatedDrillTerms()
+        if len(conflicts) > 0:
+            print(f"{len(conflicts)} drilled terms were changed by another program meanwhile:")
+            self.print_term_conflicts(conflicts)
         self.inputMode = INPUT_MODE_mainmenu
 
     def tag_missed_terms(self, missed_terms):
         tag = self.runTagPicker(permit_new_tag=True)
         if tag is not None and tag != -1:
-            for term in missed_terms:
-                self.controller.applyTagToTerm(tag, term)
+            taggedCount = self.controller.applyTagToTerms(tag, missed_terms)
+            print(f"Tagged {taggedCount} terms with {tag.name}.")
         
     def run_manage_terms(self):
         print("============")
@@ -487,16 +665,40 @@ class TextDrillRunner:
                 
         
     def query_for_manage_terms(self):
+        query = self.build_query_criteria()
+        if None == query:
+            return
+
+        results = self.controller.query(query)
+        print("Query results:")
+        if None == results or len(results) == 0:
+            print("None")
+        else:
+            print("[ID] question: answer")
+            print("---- --------  ------")
+            for result in results:
+                print(f"[{result.pkey}] {result.question}: {result.answer}")
+            self.bulk_edit_query_results(query, len(results))
+
+    def build_query_criteria(self):
+        """
+        Prompt for a list of QueryCriterion; returns None if canceled.
+        """
         query = []
         building_query = True
         while building_query:
             print(f" Current query: {query}")
             print("   c - add category")
-            print("   t - add tag")
+            print("   t - add tag (matches any of the tags)")
+            print("   s - add tag and the tags below it")
+            print("   m - add required tag (must match all required tags)")
             print("   q - add question")
             print("   a - add answer")
             print("   b - add bin value")
+            print("   n - add bin range")
             print("   r - add reverse bin value")
+            print("   d - add not seen in the last N days")
+            print("   y - add seen today")
             print("   0 - reset query")
             print("   x - exit (cancel query)")
             print(" Or hit return to run query")
@@ -524,6 +726,16 @@ class TextDrillRunner:
                     continue
                 else:
                     query.append( QueryCriterion.tag(tag) )
+
+            elif choice == 's' or choice == 'σ':
+                tag = self.runTagPicker("Choose top tag:", permit_new_tag=False)
+                if tag is not None and tag != -1:
+                    query.append( QueryCriterion.tagtree(tag) )
+
+            elif choice == 'm' or choice == 'μ':
+                tag = self.runTagPicker("Choose required tag:", permit_new_tag=False)
+                if tag is not None and tag != -1:
+                    query.append( QueryCriterion.requiredtag(tag) )
                 
             elif choice == "q" or choice == ';':
                 questionText = input("Enter question text; use * for wildcard, x to cancel: ").strip()
@@ -548,6 +760,14 @@ class TextDrillRunner:
                         continue
                     
                     query.append( QueryCriterion.binvalue(binText) )
+
+            elif choice == "n" or choice == 'ν':
+                rangeText = input("Enter bin range as low-high (e.g. 0-2), x to cancel: ").strip()
+                lowText, _, highText = rangeText.partition("-")
+                if lowText.strip().isnumeric() and highText.strip().isnumeric():
+                    query.append( QueryCriterion.binrange(lowText.strip(), highText.strip()) )
+                elif len(rangeText) > 0 and not rangeText in ['x', 'χ']:
+                    print(f"...'{rangeText}' is not a bin range, ignoring.")
                     
             elif choice == "r" or choice == 'ρ':
                 rbinText = input("Enter reverse-bin value (0-5), x to cancel: ").strip()
@@ -556,6 +776,16 @@ class TextDrillRunner:
                         continue
                     
                     query.append( QueryCriterion.reversebinvalue(rbinText) )
+
+            elif choice == "d" or choice == 'δ':
+                daysText = input("Enter number of days, x to cancel: ").strip()
+                if daysText.isnumeric():
+                    query.append( QueryCriterion.notseenindays(daysText) )
+                elif len(daysText) > 0 and not daysText in ['x', 'χ']:
+                    print(f"...'{daysText}' is not a number of days, ignoring.")
+
+            elif choice == "y" or choice == 'υ':
+                query.append( QueryCriterion.seentoday() )
                     
             elif choice == '0':
                 query = []
@@ -565,17 +795,58 @@ class TextDrillRunner:
             elif choice == 'x' or choice == 'χ':
                 building_query = False
                 print("Query canceled.")
-                return
-                
-        results = self.controller.query(query)
-        print("Query results:")
-        if None == results or len(results) == 0:
-            print("None")
-        else:
-            print("[ID] question: answer")
-            print("---- --------  ------")
-            for result in results:
-                print(f"[{result.pkey}] {result.question}: {result.answer}")
+                return None
+
+        return query
+
+    def bulk_edit_query_results(self, query, resultCount):
+        print(f"Apply to all {resultCount} results:")
+        print("   t - add tag")
+        print("   - - remove tag")
+        print("   c - change category")
+        print("   b - reset bins")
+        print("   p - set paper card flag")
+        print("   d - delete")
+        print(" Or hit return to continue")
+        choice = input("> ").strip().lower()
+
+        if choice == 't' or choice == 'τ':
+            tag = self.runTagPicker("Choose tag to add:")
+            if tag is not None and tag != -1:
+                taggedCount = self.controller.applyTagByCriteria(tag, query)
+                print(f"Tagged {taggedCount} terms with {tag.name}.")
+        elif choice == '-':
+            tag = self.runTagPicker("Choose tag to remove:", permit_new_tag=False)
+            if tag is not None and tag != -1:
+                untaggedCount = self.controller.removeTagByCriteria(tag, query)
+                print(f"Removed {tag.name} from {untaggedCount} terms.")
+        elif choice == 'c' or choice == 'ψ':
+            category = self.runCategoryPicker("Choose a new category: ")
+            if category is not None and category != -1:
+                updatedCount = self.controller.recategorizeByCriteria(query, category)
+                print(f"Moved {updatedCount} terms to {category.name}.")
+        elif choice == 'b' or choice == 'β':
+            which = input("Reset (b) bins, (r) reverse bins, or (a) both? ").strip().lower()
+            if which in ['b', 'r', 'a', 'β', 'ρ', 'α']:
+                updatedCount = self.controller.resetBinsByCriteria(
+                    query,
+                    resetBin=which in ['b', 'a', 'β', 'α'],
+                    resetReversedBin=which in ['r', 'a', 'ρ', 'α'],
+                )
+                print(f"Reset {updatedCount} terms.")
+        elif choice == 'p' or choice == 'π':
+            yn = input("Has paper card? (y/n) ").strip().lower()
+            if len(yn) > 0:
+                updatedCount = self.controller.setPaperCardByCriteria(query, yn.startswith("y"))
+                print(f"Updated {updatedCount} terms.")
+        elif choice == 'd' or choice == 'δ':
+            print(f"Are you sure you want to delete all {resultCount} terms? This cannot be undone.")
+            confirm = input("Enter 'delete' to confirm deletion: ").strip().lower()
+            if confirm == "delete":
+                deletedCount = self.controller.deleteByCriteria(query)
+                print(f"{deletedCount} terms deleted.")
+            else:
+                print("Deletion cancelled.")
     
     def manage_terms_editor(self):
         
@@ -657,7 +928,7 @@ class TextDrillRunner:
                         term.question = new_value
                     else:
                         term.answer = new_value
-                    self.controller.updateTerms([term])
+                    self.print_term_conflicts(self.controller.updateTerms([term]))
                 elif choice == 'd' or choice == 'δ':
                     self.delete_for_manage_terms()
     
@@ -728,10 +999,9 @@ class TextDrillRunner:
 
     def run_prefs(self):
 
+        self.controller.reloadPrefs()
         choice = None
         while not choice == "x":
-            self.controller.reloadPrefs()
-
             qcPref = self.controller.getPref_drillQuestionCount()
 
             spacedRepPref = self.controller.getPref_isUsingSpacedRepetition()
@@ -745,6 +1015,9 @@ class TextDrillRunner:
             print(f" (b) reverse drill (show answers first): {reversedPref}")
             print(f" (c) use spaced repetition: {spacedRepPref}")
             print(f" (d) spaced bin distribution: {binDist}")
+            print(f"     review intervals (days): {self.controller.deck.getSpacedBinIntervals()}")
+            print(" (e) question count and bin distribution for a category")
+            print(" (f) question count and bin distribution for a tag")
 
             choice = (
                 input("\nEnter letter of preference to change, or x to exit: ")
@@ -794,8 +1067,63 @@ class TextDrillRunner:
                 elif type(newDist) == dict and len(newDist) == 6:
                     self.controller.setPref_spacedBinDistribution(newDist)
 
-    def run_spaced_distribution_input(self):
-        binDist = self.controller.getPref_spacedBinDistribution()
+            elif choice == "e" or choice == "f":
+                self.run_scoped_prefs(choice == "f")
+
+    def run_scoped_prefs(self, forTag):
+        """
+        Edit the question count and bin distribution overrides of a
+        category or tag.
+        """
+        scopeName = "tag" if forTag else "category"
+        name = input(f"Enter {scopeName} name: ").strip()
+        if forTag:
+            scopes = [t for t in self.controller.getTagsList() if t.name == name]
+        else:
+            scopes = [c for c in self.controller.getCategoryList() if c.name == name]
+        if len(scopes) == 0:
+            print(f"Error: no {scopeName} found with name {name}")
+            return
+        scope = scopes[0]
+
+        if forTag:
+            overrides = self.controller.getTagPrefs(scope)
+            resolved = self.controller.resolvePrefs(tag=scope)
+        else:
+            overrides = self.controller.getCategoryPrefs(scope)
+            resolved = self.controller.resolvePrefs(category=scope)
+        print(f"\nOverrides for {scopeName} {name}: {overrides if len(overrides) > 0 else 'none'}")
+        print(f"  question count: {resolved[Deck.PREFSKEY_QUESTION_COUNT]}")
+        print(f"  spaced bin distribution: {resolved[Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION]}")
+
+        newPrefs = {}
+        newCount = input("Question count (return to keep, - to use the default): ").strip()
+        if newCount == "-":
+            newPrefs[Deck.PREFSKEY_QUESTION_COUNT] = None
+        elif len(newCount) > 0:
+            if not newCount.isdigit() or int(newCount) <= 0:
+                print("ERROR: invalid input.")
+                return
+            newPrefs[Deck.PREFSKEY_QUESTION_COUNT] = int(newCount)
+
+        yn = input("Change bin distribution? (y/n, - to use the default): ").strip().lower()
+        if yn == "-":
+            newPrefs[Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION] = None
+        elif yn.startswith("y"):
+            newDist = self.run_spaced_distribution_input(
+                resolved[Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION]
+            )
+            if type(newDist) == dict and len(newDist) == 6:
+                newPrefs[Deck.PREFSKEY_SPACED_BIN_DISTRIBUTION] = newDist
+
+        if forTag:
+            self.controller.setTagPrefs(scope, newPrefs)
+        else:
+            self.controller.setCategoryPrefs(scope, newPrefs)
+
+    def run_spaced_distribution_input(self, binDist=None):
+        if None == binDist:
+            binDist = self.controller.getPref_spacedBinDistribution()
 
         newBinDist = copy.deepcopy(binDist)
 
@@ -828,7 +1156,6 @@ class TextDrillRunner:
         return newBinDist
 
     def run_add(self):
-
         done = False
         cancelled = False
 
@@ -934,12 +1261,17 @@ class TextDrillRunner:
             self.inputMode = INPUT_MODE_mainmenu
             return
 
-        importResult = self.do_file_import(filePath)
-        if importResult:
-            print("Reloading deck...")
-            self.controller.reloadDeck()
+        if None != self.backgroundImport:
+            print("An import is still running, try again when it is done.")
+            self.inputMode = INPUT_MODE_mainmenu
+            return
+
+        # drills can go on meanwhile; the main menu reloads the deck once
+        # the import is done
+        if self.do_file_import(filePath, inBackground=True):
+            self.inputMode = INPUT_MODE_mainmenu
 
-    def do_file_import(self, filePath):
+    def do_file_import(self, filePath, inBackground=False):
         if not (os.path.isfile(filePath)):
             print(f"ERROR: \"{filePath}\" is not a valid file path.")
             return False
@@ -1003,6 +1335,10 @@ class TextDrillRunner:
                 newTerms.append(newTerm)
 
         if len(newTerms) > 0:
+            if inBackground:
+                print(f"Importing {len(newTerms)} terms in the background...")
+                self.backgroundImport = self.controller.addNewTermsInBackground(newTerms)
+                return True
             print(f"Importing {len(newTerms)} terms...")
             self.controller.addNewTerms(newTerms)
             return True
@@ -1010,6 +1346,238 @@ class TextDrillRunner:
             print("No terms found to import in file {filePath}")
             return False
 
+    def run_batch_command(self, label, func, *args):
+        """
+        Run func(*args) for a batch command, under cProfile/tracemalloc
+        if a profile mode is set, and return its result.
+        """
+        if None == self.profileMode:
+            return func(*args)
+
+        from lexilogio.runprofiler import RunProfiler
+
+        with RunProfiler(self.controller.dataDir, label, self.profileMode) as profiler:
+            result = func(*args)
+        for line in profiler.summaryLines():
+            print(line)
+        return result
+
+    def do_scripted_drill(self, categoryName, drillCount=1, seed=0):
+        """
+        Run drillCount complete drills without input, rating each term
+        with a seeded pseudo-random score, and save the results.
+        """
+        category = None
+        if not None == categoryName:
+            category = self.controller.getCategoryByName(categoryName)
+            if None == category:
+                print(f'ERROR: no category found with name "{categoryName}"')
+                return False
+
+        rng = random.Random(seed)
+        for n in range(0, drillCount):
+            self.controller.reloadDeck()
+            self.controller.makeNewDrill(category=category)
+            if None == self.controller.drill or len(self.controller.drill.terms) == 0:
+                print("ERROR: no terms to drill.")
+                return False
+            while not self.controller.isDrillCompleted():
+                self.controller.setTermBinValue(rng.randint(1, 5))
+                self.controller.advanceDrill()
+            self.controller.saveUpdatedDrillTerms()
+            print(f"Drill {n + 1} of {drillCount}: {len(self.controller.drill.terms)} terms rated.")
+        return True
+
+    def do_generate_deck(self, termCount, seed=0, reviewHistory=False):
+        """
+        Add termCount generated terms (see DeckGenerator) to the deck,
+        with their review history if reviewHistory, then time a full
+        reload of the deck.
+        """
+        from lexilogio.deckgenerator import DeckGenerator
+
+        if termCount < 1:
+            print("ERROR: generate needs a count=N of at least 1")
+            return False
+
+        generator = DeckGenerator(seed=seed, reviewHistory=reviewHistory)
+        startTime = time.perf_counter()
+        generator.populateDeck(self.controller.database, self.controller.deck, termCount)
+        elapsed = time.perf_counter() - startTime
+        print(f"Generated {termCount} terms in {elapsed:.3f}s ({termCount / elapsed:.0f} terms/s).")
+
+        startTime = time.perf_counter()
+        self.controller.reloadDeck()
+        elapsed = time.perf_counter() - startTime
+        deck = self.controller.deck
+        print(f"Loaded deck {deck.name} in {elapsed:.3f}s: {len(deck.terms)} terms, "
+              f"{len(deck.categories)} categories, {len(deck.tags)} tags.")
+        return True
+
+    def do_integrity_check(self, repair=False):
+        """
+        Report (and with repair, fix) orphaned tag relations and terms
+        whose category no longer exists.
+        """
+        startTime = time.perf_counter()
+        report = self.controller.checkIntegrity(repair)
+        elapsed = time.perf_counter() - startTime
+
+        print(f"Integrity check of deck {self.controller.deck.name} ({elapsed:.3f}s):")
+        for name, count in report.items():
+            print(f"  {name}: {count}{' (repaired)' if repair and count > 0 else ''}")
+        return True
+
+    def do_review_stats(self, sinceDays=30):
+        """
+        Print review analytics: retention by interval since the previous
+        review, accuracy per category and daily reviews over the last
+        sinceDays days, and the forecast review workload.
+        """
+
+        print(f"Review statistics for deck {self.controller.deck.name}, last {sinceDays} days:")
+        curve = self.controller.getRetentionCurve(sinceDays)
+        if len(curve) == 0:
+            print("  no reviews logged.")
+        else:
+            print("  retention by interval since previous review:")
+            for label, reviews, rate in curve:
+                print(f"    {label:>14}: {rate * 100:5.1f}% of {reviews}")
+
+            print("  accuracy by category:")
+            for catPK, (reviews, rate, meanMs) in self.controller.getCategoryAccuracy(sinceDays).items():
+                category = self.controller.getCategoryByPkey(catPK)
+                name = "(none)" if None == category else category.name
+                responseText = "" if None == meanMs else f", mean response {meanMs / 1000:.1f}s"
+                print(f"    {name:>14}: {rate * 100:5.1f}% of {reviews}{responseText}")
+
+            print("  reviews per day:")
+            for day, reviews, recalled in self.controller.getDailyReviewCounts(sinceDays):
+                print(f"    {date.fromordinal(date(1970, 1, 1).toordinal() + day)}: {reviews} ({recalled} recalled)")
+
+        forecast = self.controller.getWorkloadForecast()
+        print(f"  terms due, today (incl. overdue) and next days: {forecast}")
+        return True
+
+    def do_bin_tuning(self, apply=True):
+        """
+        Tune the bin intervals and weights from the review log; in
+        dryrun mode the results are shown but not saved.
+        """
+        oldIntervals = self.controller.deck.getSpacedBinIntervals()
+        oldWeights = self.controller.getPref_spacedBinDistribution()
+        result = self.controller.tuneBinPrefs(apply)
+
+        print(f"Bin tuning for deck {self.controller.deck.name}: {result.newReviewCount} new reviews"
+              f", retention target {self.controller.deck.getRetentionTarget()}")
+        if len(result.stabilities) == 0:
+            print("  no bin has enough reviews to fit its stability yet; intervals and weights unchanged")
+            return True
+        for n in range(0, 6):
+            fitText = ""
+            if n in result.stabilities:
+                reviews, stability = result.stabilities[n]
+                fitText = f"  (stability {stability}d from {reviews} reviews)"
+            print(f"  bin {n}: interval {oldIntervals[n]}d -> {result.intervals[n]}d, "
+                  f"weight {oldWeights[n]} -> {result.weights[n]}{fitText}")
+        if not apply:
+            print("  (dry run, prefs not changed)")
+        return True
+
+    def do_deck_merge(self, sourcePath, applyDeletes=False):
+        if not os.path.isfile(sourcePath):
+            print(f"ERROR: \"{sourcePath}\" is not a valid file path.")
+            return False
+
+        print(f"Merging {sourcePath} into deck {self.controller.deck.name}...")
+        diff = self.controller.mergeFromDeckFile(sourcePath, applyDeletes)
+        print(f"Merge complete: {diff}")
+        return True
+
+    def do_schema_migration(self, dataDir, mode=MIGRATE_MODE_offline):
+        """
+        Migrate every deck database in dataDir to the current schema.
+        In dryrun mode nothing is modified; each deck's pending migrations
+        are timed against an in-memory copy instead.
+        """
+        if not mode in [MIGRATE_MODE_offline, MIGRATE_MODE_online, MIGRATE_MODE_dryrun]:
+            print(f"ERROR: unsupported migrate mode '{mode}'")
+            return False
+
+        deckPaths = sorted(glob.glob(os.path.join(dataDir, DeckDatabase.fileNameForDeckName("*"))))
+        if len(deckPaths) == 0:
+            print(f"No deck databases found in {dataDir}")
+            return True
+
+        totalSeconds = 0.0
+        for deckPath in deckPaths:
+            database = openDeckDatabase(deckPath)
+            fromVersion = database.readSchemaVersion()
+            if fromVersion >= DECK_SCHEMA_VERSION:
+                print(f"{database.getFileName()}: up to date (version {fromVersion})")
+                continue
+
+            if mode == MIGRATE_MODE_dryrun:
+                report = database.dryRunSchemaMigration()
+            else:
+                report = database.migrateSchema(online=(mode == MIGRATE_MODE_online))
+
+            deckSeconds = sum([entry.seconds for entry in report])
+            totalSeconds += deckSeconds
+            print(f"{database.getFileName()}: version {fromVersion} -> {DECK_SCHEMA_VERSION}, {deckSeconds:.3f}s")
+            for entry in report:
+                print(f"  {entry}")
+            database.close()
+
+        if mode == MIGRATE_MODE_dryrun:
+            print(f"Expected total migration time: {totalSeconds:.3f}s")
+        return True
+
+    def do_list_decks(self, dataDir):
+        """
+        List the decks in dataDir with their term counts.
+        """
+        entries = DeckCatalog(dataDir).refresh()
+        if len(entries) == 0:
+            print(f"No deck databases found in {dataDir}")
+            return True
+        for entry in entries:
+            print(f"  {entry}")
+        return True
+
+    def do_deck_search(self, dataDir, text, categoryName=None, limit=DEFAULT_SEARCH_LIMIT):
+        """
+        Search the questions and answers of all decks in dataDir for
+        text (optionally only in categories named categoryName), and print
+        the best ranked limit hits with their deck and category.
+        """
+        from lexilogio.decksearch import DeckSearch, textCriteriaLists, mergeSearchHits
+
+        queryCriteriaLists = textCriteriaLists(text)
+        if None != categoryName:
+            for criteriaList in queryCriteriaLists:
+                criteriaList.append(QueryCriterion.category(categoryName))
+
+        startTime = time.perf_counter()
+        deckResults = []
+        for result in DeckSearch(dataDir).iterDeckResults(queryCriteriaLists):
+            if None != result.error:
+                print(f"  {result.deckName}: ERROR {result.error}")
+            else:
+                print(f"  {result.deckName}: {len(result.hits)} found ({result.seconds:.3f}s)")
+            deckResults.append(result)
+        hits = mergeSearchHits(deckResults, limit)
+        elapsed = time.perf_counter() - startTime
+
+        totalCount = sum([len(result.hits) for result in deckResults])
+        print(f"{totalCount} terms found in {len(deckResults)} decks ({elapsed:.3f}s):")
+        for hit in hits:
+            categoryName = hit.categoryName if None != hit.categoryName else "-"
+            print(f"  [{hit.deckName} / {categoryName}] {hit.term.question} : {hit.term.answer}")
+        if totalCount > len(hits):
+            print(f"  ... {totalCount - len(hits)} more")
+        return True
+
     def show_setup_menu(self):
         print("legilogio")
         print("---------")
@@ -1035,16 +1603,23 @@ class TextDrillRunner:
 
             currentTags = self.controller.getTagsList()
 
+            def findTag(tagName):
+                for tagObj in currentTags:
+                    if tagObj.name.lower() == tagName.lower():
+                        return tagObj
+                return None
+
             print(
                 "\nEdit tags list. Tags must have no spaces and are case-insensitive.\nCurrent tags:"
             )
             if len(currentTags) == 0:
                 print("  None")
             else:
-                for curTag in currentTags:
-                    print(f"  {curTag.name}")
+                for tagPath in sorted([self.controller.deck.getTagPath(t) for t in currentTags]):
+                    print(f"  {tagPath}")
 
-            print("\ncommands: add (tag-name), delete (tag-name), clear (tag-name), x (exit)")
+            print("\ncommands: add (tag-name) [parent-tag], move (tag-name) (parent-tag or -),")
+            print("  delete (tag-name), clear (tag-name), x (exit)")
             commandInput = input(": ")
 
             commandParts = commandInput.lower().split(" ")
@@ -1059,11 +1634,35 @@ class TextDrillRunner:
                     )
                 else:
                     tagName = commandParts[1].strip()
-                    if tagName in currentTags:
+                    parentTag = None
+                    if len(commandParts) >= 3:
+                        parentTag = findTag(commandParts[2].strip())
+                    if tagName in [t.name for t in currentTags]:
                         print(f'ERROR: tag "{tagName}" already exists.')
+                    elif len(commandParts) >= 3 and None == parentTag:
+                        print(f'ERROR: parent tag "{commandParts[2].strip()}" not found.')
                     else:
                         print(f'Creating tag "{tagName}"...')
-                        self.controller.addTag(tagName)
+                        self.controller.addTag(tagName, parentTag)
+
+            elif command == "move":
+                if len(commandParts) < 3:
+                    print(
+                        "ERROR: move command should be followed by tag name and parent tag name (- for top level)."
+                    )
+                else:
+                    moveTagObj = findTag(commandParts[1].strip())
+                    parentName = commandParts[2].strip()
+                    parentTag = None if parentName == "-" else findTag(parentName)
+                    if None == moveTagObj:
+                        print(f'WARNING: tag "{commandParts[1].strip()}" not found, nothing to move.')
+                    elif parentName != "-" and None == parentTag:
+                        print(f'ERROR: parent tag "{parentName}" not found.')
+                    else:
+                        try:
+                            self.controller.moveTag(moveTagObj, parentTag)
+                        except Exception as ex:
+                            print(f"ERROR: {ex}")
 
             elif command == "delete":
                 if len(commandParts) < 2:
@@ -1185,9 +1784,7 @@ class TextDrillRunner:
                 print("===============================")
                 print("term counts per category")
                 for cat in catsToCount:
-                    catCount = len(
-                        self.controller.deck.getTermsInCategory(cat)
-                    )
+                    catCount = self.controller.deck.countTermsInCategory(cat)
                     print(f"  {cat.name}: {catCount}")
                 print("===============================")
 
@@ -1205,6 +1802,35 @@ class TextDrillRunner:
 
         foundImportCmd = False
         foundExportCmd = False
+        foundMigrateCmd = False
+        foundMergeCmd = False
+        foundDrillCmd = False
+        foundCheckCmd = False
+        foundStatsCmd = False
+        foundTuneCmd = False
+        foundDecksCmd = False
+        foundSearchCmd = False
+        foundGenerateCmd = False
+        reviewsArg = False
+
+        textArg = None
+        limitArg = DEFAULT_SEARCH_LIMIT
+
+        modeArg = MIGRATE_MODE_offline
+
+        shardCount = 0
+        partitionMode = "hash"
+
+        useSnapshot = False
+
+        slowQueryMs = None
+
+        metricsArg = None
+
+        profileArg = None
+
+        countArg = 1
+        seedArg = 0
 
         logLevelStr = "INFO"
 
@@ -1216,6 +1842,33 @@ class TextDrillRunner:
             elif arg.strip() == CMD_EXPORT:
                 foundExportCmd = True
 
+            elif arg.strip() == CMD_MIGRATE:
+                foundMigrateCmd = True
+
+            elif arg.strip() == CMD_MERGE:
+                foundMergeCmd = True
+
+            elif arg.strip() == CMD_DRILL:
+                foundDrillCmd = True
+
+            elif arg.strip() == CMD_CHECK:
+                foundCheckCmd = True
+
+            elif arg.strip() == CMD_STATS:
+                foundStatsCmd = True
+
+            elif arg.strip() == CMD_TUNE:
+                foundTuneCmd = True
+
+            elif arg.strip() == CMD_DECKS:
+                foundDecksCmd = True
+
+            elif arg.strip() == CMD_SEARCH:
+                foundSearchCmd = True
+
+            elif arg.strip() == CMD_GENERATE:
+                foundGenerateCmd = True
+
             elif arg.startswith(f"{ARG_DIR}="):
                 dataDir = arg[len(ARG_DIR) + 1 :]
 
@@ -1233,6 +1886,42 @@ class TextDrillRunner:
             elif arg.startswith(f"{ARG_LOGLEVEL}="):
                 logLevelStr = arg[len(ARG_LOGLEVEL) + 1 :].strip().upper()
 
+            elif arg.startswith(f"{ARG_MODE}="):
+                modeArg = arg[len(ARG_MODE) + 1 :].strip().lower()
+
+            elif arg.startswith(f"{ARG_SHARDS}="):
+                shardCount = int(arg[len(ARG_SHARDS) + 1 :])
+
+            elif arg.startswith(f"{ARG_PARTITION}="):
+                partitionMode = arg[len(ARG_PARTITION) + 1 :].strip().lower()
+
+            elif arg.startswith(f"{ARG_SNAPSHOT}="):
+                useSnapshot = arg[len(ARG_SNAPSHOT) + 1 :].strip().lower() in ["on", "yes", "1", "true"]
+
+            elif arg.startswith(f"{ARG_SLOW_QUERY}="):
+                slowQueryMs = float(arg[len(ARG_SLOW_QUERY) + 1 :])
+
+            elif arg.startswith(f"{ARG_METRICS}="):
+                metricsArg = arg[len(ARG_METRICS) + 1 :].strip()
+
+            elif arg.startswith(f"{ARG_PROFILE}="):
+                profileArg = arg[len(ARG_PROFILE) + 1 :].strip().lower()
+
+            elif arg.startswith(f"{ARG_COUNT}="):
+                countArg = int(arg[len(ARG_COUNT) + 1 :])
+
+            elif arg.startswith(f"{ARG_SEED}="):
+                seedArg = int(arg[len(ARG_SEED) + 1 :])
+
+            elif arg.startswith(f"{ARG_TEXT}="):
+                textArg = arg[len(ARG_TEXT) + 1 :]
+
+            elif arg.startswith(f"{ARG_LIMIT}="):
+                limitArg = int(arg[len(ARG_LIMIT) + 1 :])
+
+            elif arg.startswith(f"{ARG_REVIEWS}="):
+                reviewsArg = arg[len(ARG_REVIEWS) + 1 :].strip().lower() in ["on", "yes", "1", "true"]
+
         # Configure stdout logging
         # TODO also support file logging?
         root = logging.getLogger()
@@ -1244,36 +1933,145 @@ class TextDrillRunner:
         handler.setFormatter(formatter)
         root.addHandler(handler)
 
-        # test logging
-        logging.debug("Testing debug logging...")
-        logging.info("Testing info logging...")
-        logging.error("Testing error logging...")
-
         runner = TextDrillRunner()
-        runner.initialize(dataDir, deckName)
+
+        # profile=cpu|memory|all (or on) profiles a batch import, export,
+        # merge or drill command, writing the results to the data dir
+        if None != profileArg:
+            from lexilogio.runprofiler import isProfileModeValid, PROFILE_MODE_all
+
+            if profileArg == "on":
+                profileArg = PROFILE_MODE_all
+            if not isProfileModeValid(profileArg):
+                print(f"ERROR: unknown profile mode {profileArg} (use cpu, memory or all)")
+                sys.exit(1)
+            runner.profileMode = profileArg
+
+        # migrate operates on all decks in the data dir, so handle it
+        # before loading a particular deck
+        if foundMigrateCmd:
+            runner.inputMode = INPUT_MODE_batchcmd
+            if runner.do_schema_migration(dataDir, modeArg):
+                return
+            else:
+                sys.exit(1)
+
+        if foundDecksCmd:
+            runner.inputMode = INPUT_MODE_batchcmd
+            if runner.do_list_decks(dataDir):
+                return
+            else:
+                sys.exit(1)
+
+        if foundSearchCmd:
+            if None == textArg:
+                print("ERROR: search command requires text=TEXT parameter")
+                sys.exit(1)
+            runner.inputMode = INPUT_MODE_batchcmd
+            if runner.do_deck_search(dataDir, textArg, categoryArg, limitArg):
+                return
+            else:
+                sys.exit(1)
+
+        runner.initialize(dataDir, deckName, shardCount, partitionMode, useSnapshot)
+
+        if None != slowQueryMs:
+            runner.controller.enableSqlInstrumentation(slowQueryMs / 1000.0)
+
+        # metrics=on times controller operations, metrics=PATH also
+        # writes the histograms to PATH (.json for JSON) on exit
+        if None != metricsArg:
+            runner.controller.enableOperationTiming()
+            if metricsArg.lower() != "on":
+                runner.metricsFilePath = metricsArg
 
         if foundImportCmd:
             if None == fileArg:
                 print("ERROR: import command requires file=PATH parameter")
                 sys.exit(1)
             runner.inputMode = INPUT_MODE_batchcmd
-            if runner.do_file_import(fileArg):
+            if runner.run_batch_command(CMD_IMPORT, runner.do_file_import, fileArg):
+                runner.write_metrics_file()
                 return
             else:
                 logging.warning("Failed to import anything from {fileArg}")
                 sys.exit(1)
 
+        if foundMergeCmd:
+            if None == fileArg:
+                print("ERROR: merge command requires file=PATH parameter")
+                sys.exit(1)
+            runner.inputMode = INPUT_MODE_batchcmd
+            if runner.run_batch_command(
+                CMD_MERGE, runner.do_deck_merge, fileArg, modeArg == MERGE_MODE_mirror
+            ):
+                runner.write_metrics_file()
+                return
+            else:
+                sys.exit(1)
+
         if foundExportCmd:
             if None == fileArg:
                 print("ERROR: export command requires file=PATH parameter")
                 sys.exit(1)
             runner.inputMode = INPUT_MODE_batchcmd
-            if runner.do_file_export(fileArg, categoryArg):
+            if runner.run_batch_command(CMD_EXPORT, runner.do_file_export, fileArg, categoryArg):
+                runner.write_metrics_file()
                 return
             else:
                 logging.warning("Failed to export terms.")
                 sys.exit(1)
 
+        # generate count=N [seed=N] [reviews=on] adds generated terms to
+        # the deck (created with shards=N if new) for scale tests
+        if foundGenerateCmd:
+            runner.inputMode = INPUT_MODE_batchcmd
+            if runner.run_batch_command(
+                CMD_GENERATE, runner.do_generate_deck, countArg, seedArg, reviewsArg
+            ):
+                runner.write_metrics_file()
+                return
+            else:
+                sys.exit(1)
+
+        if foundDrillCmd:
+            runner.inputMode = INPUT_MODE_batchcmd
+            if runner.run_batch_command(
+                CMD_DRILL, runner.do_scripted_drill, categoryArg, countArg, seedArg
+            ):
+                runner.write_metrics_file()
+                return
+            else:
+                sys.exit(1)
+
+        if foundCheckCmd:
+            runner.inputMode = INPUT_MODE_batchcmd
+            if runner.run_batch_command(
+                CMD_CHECK, runner.do_integrity_check, modeArg == CHECK_MODE_repair
+            ):
+                runner.write_metrics_file()
+                return
+            else:
+                sys.exit(1)
+
+        if foundStatsCmd:
+            runner.inputMode = INPUT_MODE_batchcmd
+            if runner.run_batch_command(CMD_STATS, runner.do_review_stats):
+                runner.write_metrics_file()
+                return
+            else:
+                sys.exit(1)
+
+        if foundTuneCmd:
+            runner.inputMode = INPUT_MODE_batchcmd
+            if runner.run_batch_command(
+                CMD_TUNE, runner.do_bin_tuning, modeArg != TUNE_MODE_dryrun
+            ):
+                runner.write_metrics_file()
+                return
+            else:
+                sys.exit(1)
+
         runner.inputMode = INPUT_MODE_mainmenu
         while not runner.quit:
             runner.run_input()